@@ -1,11 +1,25 @@
+import sys
+import json
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import folium
 import numpy as np
-from numpy.random import default_rng as rng
-from folium.plugins import HeatMap
 from streamlit_folium import st_folium
 
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.append(str(ROOT / 'usage'))
+sys.path.append(str(ROOT / 'data_preprocessing'))
+from model_usage import EmergencyPredictor  # noqa: E402
+from heatmap_tiles import PALETTE, HeatmapTileCache  # noqa: E402
+from forecast_animation import ForecastAnimation  # noqa: E402
+import timing  # noqa: E402
+from timing import span, count  # noqa: E402
+
 st.set_page_config(
     page_title="EMS Prediction Atlas",
     initial_sidebar_state="expanded",
@@ -15,18 +29,174 @@ city_coords = {
     "San Francisco" : [37.76, -122.4],
     "New York" : [40.7128, -74.0060],
 }
+# Cities with a trained model
+city_models = {
+    "San Francisco": (str(ROOT / 'model' / 'emergency_prediction_model.ubj'), str(ROOT / 'data' / 'weather_store')),
+}
+# Neither artifact is checked in, a fresh checkout has to build them
+BUILD_MODEL_HELP = ("Build it with `python weather_store.py` and `python training_data.py` in data_preprocessing, "
+                    "then `python test_training.py` in train.")
+
+CELL_STYLE = """function(feature) {
+    return {fillColor: feature.properties.fill, fillOpacity: 0.6, weight: 0.2, color: '#555555'};
+}"""
+# Decimal places of cell corners sent to the browser, about 1 m
+GEOJSON_PRECISION = 5
+# Days of predictions kept by the data cache, per grid size
+CACHED_DAYS = 64
+# Open the dashboard with ?timings=1 to record and show per-stage latencies for the session
+TIMINGS_PARAM = 'timings'
+
+
+def city_model(city: str):
+    """(model_path, weather_path) of the city, or None if it has no model or its files have not been built."""
+    paths = city_models.get(city)
+    if paths is None or not all(Path(path).exists() for path in paths):
+        return None
+    return paths
+
+
+@st.cache_resource(show_spinner="Loading model...")
+def load_predictor(model_path: str, weather_path: str) -> EmergencyPredictor:
+    """One predictor (booster and weather store) per process, shared by every session and rerun."""
+    # Predictions are cached by day below, the predictor's own hour cache would only duplicate them
+    return EmergencyPredictor(model_path, weather_path, cache_size=0)
+
+
+@st.cache_data(max_entries=CACHED_DAYS, show_spinner=False)
+def day_predictions(model_path: str, weather_path: str, day: date, num_cells: int) -> np.ndarray:
+    """
+    All 24 hours of one day as a (24, num_cells) float32 array, from one
+    model call. Moving the hour slider within a day is then a cache hit.
+    """
+    predictor = load_predictor(model_path, weather_path)
+    hours = pd.date_range(pd.Timestamp(day), periods=24, freq='h')
+    count('dashboard.days_predicted')
+    return predictor.predict_hours(hours, num_cells)
+
+
+@st.cache_data(max_entries=CACHED_DAYS * 24, show_spinner=False)
+def hour_layer(model_path: str, weather_path: str, day: date, hour: int, num_cells: int, level: int) -> dict:
+    """
+    GeoJSON of one hour's predictions at one pyramid level, each feature
+    carrying its prediction and fill colour. The colour scale is the day's
+    maximum, so colours are comparable across the slider.
+    """
+    pyramid = load_predictor(model_path, weather_path).grid_pyramid(num_cells)
+    predictions = pyramid.aggregate(day_predictions(model_path, weather_path, day, num_cells), level)
+    scale = max(float(predictions.max()), 1e-9)
+    colors = np.minimum((predictions[hour] / scale * len(PALETTE)).astype(int), len(PALETTE) - 1)
+
+    geometry = pyramid.geojson(level, precision=GEOJSON_PRECISION)
+    with span('dashboard.hour_layer'):
+        features = [
+            {'type': 'Feature', 'geometry': feature['geometry'],
+             'properties': {'cell_id': feature['properties']['cell_id'],
+                            'prediction': round(float(value), 3), 'fill': PALETTE[color]}}
+            for feature, value, color in zip(geometry['features'], predictions[hour], colors)
+        ]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+@st.cache_resource
+def base_map(city: str) -> folium.Map:
+    """The tile layer only. Prediction layers are sent separately, so the map itself is built once per city."""
+    return folium.Map(location=city_coords[city], zoom_start=12)
+
+
+def prediction_layer(geojson: dict) -> folium.FeatureGroup:
+    group = folium.FeatureGroup(name="Predicted calls")
+    folium.GeoJson(
+        geojson,
+        # Styled in the browser; a Python style_function is serialized once per feature on every rerun
+        style=folium.JsCode(CELL_STYLE),
+        tooltip=folium.GeoJsonTooltip(fields=['cell_id', 'prediction'], aliases=['Cell', 'Expected calls']),
+    ).add_to(group)
+    return group
 
-def create_heatmap(city:str):
-    coordinates = city_coords[city]
-    rng = np.random.default_rng(0)
-    df = pd.DataFrame(
-        rng.standard_normal((1000, 2)) / [50, 50] + coordinates,
-        columns=["lat", "lon"],
-    )
-    heat = folium.Map(location=coordinates, zoom_start=12)
-    HeatMap(df[['lat', 'lon']].values, radius=10).add_to(heat)
 
-    return heat
+@st.cache_resource
+def tile_cache() -> HeatmapTileCache:
+    return HeatmapTileCache(str(ROOT / 'data' / 'heatmap_tiles'))
+
+
+def raster_layer(predictor: EmergencyPredictor, day: date, hour: int, num_cells: int) -> folium.FeatureGroup:
+    """
+    The hour's pre-rendered heatmap image, one pixel per cell. The whole day
+    is rendered into the tile cache the first time any of its hours is shown,
+    on the layer's colour scale, which the first rendered day sets.
+    """
+    target = pd.Timestamp(day) + pd.Timedelta(hours=hour)
+    path = tile_cache().hour_path(predictor, target, num_cells)
+    if path is None:
+        tile_cache().render(predictor, pd.Timestamp(day), pd.Timestamp(day) + pd.Timedelta(hours=23), num_cells)
+        path = tile_cache().hour_path(predictor, target, num_cells)
+    lats, lons = predictor.grid_pyramid(num_cells).levels[0]
+    group = folium.FeatureGroup(name="Predicted calls")
+    folium.raster_layers.ImageOverlay(str(path), bounds=[[lats[0], lons[0]], [lats[-1], lons[-1]]],
+                                      opacity=0.6, pixelated=True).add_to(group)
+    return group
+
+
+def range_predictions(model_path: str, weather_path: str, start_day: date, hours: int, num_cells: int) -> np.ndarray:
+    """The first `hours` hours from start_day as a (hours, num_cells) array, from the cached days."""
+    days = [start_day + timedelta(days=d) for d in range(-(-hours // 24))]
+    return np.concatenate([day_predictions(model_path, weather_path, d, num_cells) for d in days])[:hours]
+
+
+@st.cache_data(max_entries=8, show_spinner="Building the animation...")
+def animation_html(model_path: str, weather_path: str, city: str, start_day: date, hours: int, num_cells: int) -> str:
+    """
+    A standalone map that animates `hours` hours from start_day in the
+    browser: the grid geometry once plus one compressed byte per cell and hour.
+    """
+    predictor = load_predictor(model_path, weather_path)
+    predictions = range_predictions(model_path, weather_path, start_day, hours, num_cells)
+    times = pd.date_range(pd.Timestamp(start_day), periods=hours, freq='h')
+
+    with span('dashboard.animation'):
+        animated = folium.Map(location=city_coords[city], zoom_start=12)
+        ForecastAnimation(predictions, times, *predictor.grid_pyramid(num_cells).levels[0]).add_to(animated)
+        return animated.get_root().render()
+
+
+def view_level(predictor: EmergencyPredictor, num_cells: int, max_cells: int) -> int:
+    """The pyramid level for the map bounds st_folium reported on the previous rerun, level 0 before that."""
+    bounds = st.session_state.get('map_bounds') or {}
+    south_west, north_east = bounds.get('_southWest') or {}, bounds.get('_northEast') or {}
+    # Until the browser has drawn the map, st_folium reports empty bounds
+    if None in (south_west.get('lat'), south_west.get('lng'), north_east.get('lat'), north_east.get('lng')):
+        return 0
+    pyramid = predictor.grid_pyramid(num_cells)
+    return pyramid.level_for_viewport(south_west['lat'], north_east['lat'], south_west['lng'], north_east['lng'],
+                                      max_cells)
+
+
+def session_recorder():
+    """This session's timing recorder when the page was opened with ?timings=1, otherwise None."""
+    if st.query_params.get(TIMINGS_PARAM) != '1':
+        return None
+    if 'timings' not in st.session_state:
+        st.session_state['timings'] = timing.Recorder()
+    return st.session_state['timings']
+
+
+def timings_panel(recorder: timing.Recorder):
+    """Per-stage latencies of every rerun in this session, with exports for offline analysis."""
+    with st.expander("Timings", expanded=True):
+        summary = recorder.summary()
+        st.dataframe(summary.round(2), hide_index=True)
+        if recorder.counters:
+            st.dataframe(pd.Series(recorder.counters, name="count").rename_axis("counter").reset_index(),
+                         hide_index=True)
+        json_export, csv_export, reset = st.columns(3)
+        json_export.download_button("Export JSON", json.dumps(recorder.to_dict()), file_name="timings.json",
+                                    mime="application/json")
+        csv_export.download_button("Export samples (CSV)", recorder.samples().to_csv(index=False),
+                                   file_name="timings.csv", mime="text/csv")
+        if reset.button("Reset"):
+            recorder.reset()
+            st.rerun()
 
 
 # Title
@@ -38,12 +208,92 @@ st.write("Welcome to the EMS Prediction Atlas — an open-source, real-time heat
 
 
 selected_city = st.sidebar.selectbox("Select City", ["San Francisco", "New York"])
-notes, maps = st.columns([1,3], gap="small")
-# Map selection
-with maps:
-    st.markdown("<h1 style='text-align: center;'>Heat Map</h1>", unsafe_allow_html=True)
-    st_folium(create_heatmap(selected_city), width=1120, height=500)  
-
-with notes:
-    st.markdown("<h1 style='text-align: center;'>Information</h1>", unsafe_allow_html=True)
-    st.write("Ipsum Lorem")
\ No newline at end of file
+selected_day = st.sidebar.date_input("Date", value=date(2007, 7, 15))
+selected_hour = st.sidebar.slider("Hour", 0, 23, 18, help="The animation plays every hour from the selected date instead.")
+grid_size = st.sidebar.select_slider("Grid", options=[16, 32, 50, 64, 100], value=50,
+                                     format_func=lambda n: f"{n} x {n}")
+max_cells = st.sidebar.select_slider("Most cells drawn", options=[256, 625, 1024, 2500, 10000], value=2500)
+layer_mode = st.sidebar.radio("Map layer", ["Grid cells", "Raster image", "Animation"],
+                              help="Raster images are pre-rendered per hour and draw equally fast at any grid size; "
+                                   "grid cells show each cell's prediction on hover; the animation plays "
+                                   "the hours from the selected date in the browser.")
+if layer_mode == "Animation":
+    animation_hours = st.sidebar.select_slider("Animation hours", options=[24, 48, 72, 96, 120, 144, 168], value=168)
+num_cells = grid_size * grid_size
+group = None
+shown = False
+
+recorder = session_recorder()
+with timing.recording(recorder), span('dashboard.rerun'):
+    notes, maps = st.columns([1,3], gap="small")
+    # Map selection
+    with maps:
+        st.markdown("<h1 style='text-align: center;'>Heat Map</h1>", unsafe_allow_html=True)
+        if city_model(selected_city) is None:
+            if selected_city in city_models:
+                st.info(f"The prediction model for {selected_city} has not been built yet. {BUILD_MODEL_HELP}")
+            else:
+                st.info(f"There is no prediction model for {selected_city} yet.")
+            st_folium(base_map(selected_city), width=1120, height=500, key=f"map-{selected_city}", returned_objects=[])
+        else:
+            model_path, weather_path = city_model(selected_city)
+            began = time.perf_counter()
+            predictor = load_predictor(model_path, weather_path)
+            level = view_level(predictor, num_cells, max_cells)
+            try:
+                if layer_mode == "Animation":
+                    with span('dashboard.prepare'):
+                        html = animation_html(model_path, weather_path, selected_city, selected_day, animation_hours,
+                                              num_cells)
+                    with span('dashboard.render'):
+                        components.html(html, width=1120, height=500)
+                    shown = True
+                    st.caption(f"{animation_hours} hours x {num_cells} cells, {len(html) / 1e6:.2f} MB page, "
+                               f"prepared in {(time.perf_counter() - began) * 1000:.0f} ms")
+                elif layer_mode == "Raster image":
+                    with span('dashboard.prepare'):
+                        group = raster_layer(predictor, selected_day, selected_hour, num_cells)
+                    description = f"{num_cells} cells as one image"
+                else:
+                    with span('dashboard.prepare'):
+                        layer = hour_layer(model_path, weather_path, selected_day, selected_hour, num_cells, level)
+                        group = prediction_layer(layer)
+                    description = f"{len(layer['features'])} cells (pyramid level {level})"
+            except KeyError as e:
+                st.error(e.args[0])
+            prepared_ms = (time.perf_counter() - began) * 1000
+
+            if group is not None:
+                # Only the feature group changes between reruns; the map and its tiles stay in the browser
+                # Serializing the map and feature group to HTML/JSON and sending it
+                with span('dashboard.render'):
+                    state = st_folium(base_map(selected_city), width=1120, height=500, key=f"map-{selected_city}",
+                                      feature_group_to_add=group, returned_objects=['bounds'])
+                shown = True
+                if state and state.get('bounds') and state['bounds'] != st.session_state.get('map_bounds'):
+                    st.session_state['map_bounds'] = state['bounds']
+                    if layer_mode == "Grid cells" and view_level(predictor, num_cells, max_cells) != level:
+                        st.rerun()
+                st.caption(f"{description}, prepared in {prepared_ms:.0f} ms")
+
+    with notes:
+        st.markdown("<h1 style='text-align: center;'>Information</h1>", unsafe_allow_html=True)
+        if shown and layer_mode == "Animation":
+            # The frame on screen is chosen in the browser, so the notes cover the whole animation
+            predictions = range_predictions(model_path, weather_path, selected_day, animation_hours, num_cells)
+            times = pd.date_range(pd.Timestamp(selected_day), periods=animation_hours, freq='h')
+            st.metric(f"Expected calls over {animation_hours} hours", f"{predictions.sum():.1f}")
+            st.metric("Busiest hour", f"{times[predictions.sum(axis=1).argmax()]:%a %H:00}")
+            st.bar_chart(pd.Series(predictions.sum(axis=1), index=times, name="Expected calls"), height=200)
+        elif shown:
+            day = day_predictions(model_path, weather_path, selected_day, num_cells)
+            st.metric("Expected calls this hour", f"{day[selected_hour].sum():.1f}")
+            st.metric("Expected calls this day", f"{day.sum():.1f}")
+            st.bar_chart(pd.Series(day.sum(axis=1), name="Expected calls"), height=200)
+        elif selected_city in city_models:
+            st.write("Predicted call volumes appear here once the model is built.")
+        else:
+            st.write("Select San Francisco to see predicted call volumes.")
+
+if recorder is not None:
+    timings_panel(recorder)
@@ -1,7 +1,15 @@
+import numpy as np
 import pandas as pd
 
+from schema import apply_schema
 
-def add_non_emergency(emergency_df: pd.DataFrame, total_cells):
+
+KNOWN_COLS = ['call_number', 'incident_number', 'date', 'year', 'month', 'day',
+              'hour', 'longitude', 'latitude', 'cell', 'date_hour', 'date_day',
+              'emergency_count']
+
+
+def add_non_emergency(emergency_df: pd.DataFrame, total_cells, backend: str = 'dense'):
     """
     Expands the emergency call dataframe to include non-emergency time slots
     and retains the count of emergencies per hour as the target variable.
@@ -9,25 +17,143 @@ def add_non_emergency(emergency_df: pd.DataFrame, total_cells):
     Args:
         emergency_df: DataFrame containing only emergency events, with 'cell'
                       and weather data already assigned.
+        total_cells: Number of cells in the grid (cell IDs are 1..total_cells).
+        backend: 'dense' bins the events into a (n_hours, n_cells) count array
+                 and builds the table month by month (see iter_non_emergency).
+                 'merge' is the original MultiIndex scaffold + pd.merge version.
+                 Both return the same rows, counts and weather; 'dense' orders them by
+                 month first, then cell and hour.
+
+    Returns:
+        A DataFrame with both emergency (count > 0) and non-emergency (count = 0) rows,
+        with the schema.TRAINING_SCHEMA dtypes.
+    """
+    if backend == 'merge':
+        return _add_non_emergency_merge(emergency_df, total_cells)
+    if backend != 'dense':
+        raise ValueError(f"backend must be 'dense' or 'merge', got '{backend}'")
+
+    chunks = list(iter_non_emergency(emergency_df, total_cells))
+    if not chunks:
+        return pd.DataFrame(columns=['date_hour', 'cell', 'emergency_count', 'year', 'month', 'day', 'hour', 'date'])
+    return pd.concat(chunks, ignore_index=True)
+
+
+def build_count_tensor(emergency_df: pd.DataFrame, total_cells):
+    """
+    Counts emergencies per hour and cell with a single bincount.
+
+    Args:
+        emergency_df: DataFrame with 'date' and 'cell' columns.
+        total_cells: Number of cells in the grid.
 
     Returns:
-        A DataFrame with both emergency (count > 0) and non-emergency (count = 0) rows.
+        tuple: (counts, all_hours) where counts is an int32 array of shape
+        (len(all_hours), total_cells) and column j holds cell j + 1.
+    """
+    date_hour = pd.to_datetime(emergency_df['date']).dt.floor('h')
+    all_hours = pd.date_range(start=date_hour.min(), end=date_hour.max(), freq='h')
+
+    # Cells outside 1..total_cells have no slot in the table, same as the scaffold merge
+    cells = emergency_df['cell'].to_numpy()
+    valid = (cells >= 1) & (cells <= total_cells) & date_hour.notna().to_numpy()
+
+    hour_idx = ((date_hour[valid] - all_hours[0]) // pd.Timedelta(hours=1)).to_numpy().astype('int64')
+    flat_idx = hour_idx * total_cells + (cells[valid].astype('int64') - 1)
+
+    counts = np.bincount(flat_idx, minlength=len(all_hours) * total_cells)
+    counts = counts.astype('int32').reshape(len(all_hours), total_cells)
+
+    return counts, all_hours
+
+
+def iter_non_emergency(emergency_df: pd.DataFrame, total_cells):
+    """
+    Lazily yields the long-format training table one calendar month at a time,
+    so the full (hours x cells) scaffold is never held in memory as a DataFrame.
+
+    Args:
+        emergency_df: DataFrame containing only emergency events, with 'cell'
+                      and optionally weather data already assigned.
+        total_cells: Number of cells in the grid.
+
+    Yields:
+        pd.DataFrame: The rows for one month, in the same columns as add_non_emergency.
+    """
+    if emergency_df.empty:
+        return
+
+    counts, all_hours = build_count_tensor(emergency_df, total_cells)
+
+    weather_cols = [col for col in emergency_df.columns if col not in KNOWN_COLS]
+    weather_to_merge = None
+    if weather_cols:
+        weather_to_merge = emergency_df[['cell'] + weather_cols].copy()
+        weather_to_merge['date_hour'] = pd.to_datetime(emergency_df['date']).dt.floor('h')
+        weather_to_merge = weather_to_merge.drop_duplicates(subset=['date_hour', 'cell'])
+
+    # all_hours is sorted, so each month is a contiguous block of rows in counts
+    month_keys = all_hours.year * 12 + all_hours.month
+    boundaries = np.flatnonzero(np.diff(month_keys)) + 1
+    starts = np.concatenate([[0], boundaries])
+    stops = np.concatenate([boundaries, [len(all_hours)]])
+
+    cell_ids = np.arange(1, total_cells + 1)
+
+    for start, stop in zip(starts, stops):
+        hours = all_hours[start:stop]
+        n_hours = stop - start
+
+        # cell-major order, matching the sort of the merge backend
+        chunk = pd.DataFrame({
+            'date_hour': np.tile(hours.to_numpy(), total_cells),
+            'cell': np.repeat(cell_ids, n_hours),
+            'emergency_count': counts[start:stop].T.ravel(),
+        })
+
+        if weather_to_merge is not None:
+            month_weather = weather_to_merge[
+                (weather_to_merge['date_hour'] >= hours[0]) & (weather_to_merge['date_hour'] <= hours[-1])
+            ]
+            chunk = pd.merge(chunk, month_weather, on=['date_hour', 'cell'], how='left')
+            chunk['date_day'] = chunk['date_hour'].dt.date
+            _fill_within_day(chunk, weather_cols)
+            chunk = chunk.dropna(subset=weather_cols)
+            chunk = chunk.drop(columns=['date_day'])
+
+        chunk['year'] = chunk['date_hour'].dt.year
+        chunk['month'] = chunk['date_hour'].dt.month
+        chunk['day'] = chunk['date_hour'].dt.day
+        chunk['hour'] = chunk['date_hour'].dt.hour
+        chunk['date'] = chunk['date_hour'].dt.normalize()
+
+        yield apply_schema(chunk)
+
+
+def _fill_within_day(df: pd.DataFrame, weather_cols):
     """
+    Fills the weather of rows without an event from the cell's other rows of
+    the same day, forward then backward, in place. Both passes are grouped:
+    an ungrouped bfill after the grouped ffill would pull values across cells
+    and days, so the result would depend on how the table was chunked.
+    """
+    df[weather_cols] = df.groupby(['cell', 'date_day'])[weather_cols].ffill()
+    df[weather_cols] = df.groupby(['cell', 'date_day'])[weather_cols].bfill()
+
+
+def _add_non_emergency_merge(emergency_df: pd.DataFrame, total_cells):
     # --- 1. Prepare Timestamps and Identify Weather Columns ---
 
-    emergency_df['date_hour'] = pd.to_datetime(emergency_df['date']).dt.floor('H')
+    emergency_df['date_hour'] = pd.to_datetime(emergency_df['date']).dt.floor('h')
     emergency_df['date_day'] = emergency_df['date_hour'].dt.date
 
-    known_cols = ['call_number', 'incident_number', 'date', 'year', 'month', 'day',
-                  'hour', 'longitude', 'latitude', 'cell', 'date_hour', 'date_day',
-                  'emergency_count']
-    weather_cols = [col for col in emergency_df.columns if col not in known_cols]
+    weather_cols = [col for col in emergency_df.columns if col not in KNOWN_COLS]
 
     # --- 2. Create the Full Scaffold (all hours, all cells) ---
     all_cells = range(1, total_cells + 1)
     min_hour = emergency_df['date_hour'].min()
     max_hour = emergency_df['date_hour'].max()
-    all_hours = pd.date_range(start=min_hour, end=max_hour, freq='H')
+    all_hours = pd.date_range(start=min_hour, end=max_hour, freq='h')
 
     scaffold_df = pd.DataFrame(
         index=pd.MultiIndex.from_product(
@@ -64,7 +190,7 @@ def add_non_emergency(emergency_df: pd.DataFrame, total_cells):
     final_df['date_day'] = final_df['date_hour'].dt.date
 
     final_df = final_df.sort_values(by=['cell', 'date_hour'])
-    final_df[weather_cols] = final_df.groupby(['cell', 'date_day'])[weather_cols].ffill().bfill()
+    _fill_within_day(final_df, weather_cols)
     final_df = final_df.dropna(subset=weather_cols)
 
     final_df['year'] = final_df['date_hour'].dt.year
@@ -76,4 +202,4 @@ def add_non_emergency(emergency_df: pd.DataFrame, total_cells):
     # Clean up helper columns, but KEEP emergency_count
     final_df = final_df.drop(columns=['date_day'])
 
-    return final_df
\ No newline at end of file
+    return apply_schema(final_df)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The modules in this folder import each other by plain module name, as they are run from here
+sys.path.insert(0, str(Path(__file__).resolve().parent))
@@ -1,6 +1,9 @@
 import pandas as pd
 import numpy as np
 from bisect import bisect_right
+from functools import lru_cache
+
+from timing import timed, count
 
 def old_create_grid_axes(min_lat, max_lat, min_lon, max_lon, levels):
     def split_range(min_val, max_val, levels):
@@ -74,17 +77,110 @@ def test():
     print(cell)
 
 
-def find_cells(df: pd.DataFrame, num_cols, num_rows, min_in=None, max_in=None):
+OUT_OF_BOUNDS_POLICIES = ('raise', 'drop', 'clip', 'mark')
+
+# [lat, lon] corners of the San Francisco grid used by the usage notebooks and scripts
+SF_MIN_IN = [37.700090787, -122.517681208]
+SF_MAX_IN = [37.82999, -122.33257462]
+
+
+@timed('grid.assign_cells')
+def which_grid_vectorized(lats, lons, lat_in, lon_in, out_of_bounds='raise'):
+    """
+    Vectorized version of which_grid. Assigns a whole array of points to
+    their 1-based, row-major cell IDs in one call, using the same boundary
+    rules (a point on a boundary goes to the cell to its "upper-right", a
+    point on the outer max edge goes to the last cell).
+
+    Args:
+        lats (list): Latitude boundary lines.
+        lons (list): Longitude boundary lines.
+        lat_in (array-like): Latitudes of the points.
+        lon_in (array-like): Longitudes of the points.
+        out_of_bounds (str): What to do with points outside the grid (or NaN):
+            'raise' raises a ValueError like which_grid,
+            'clip' snaps them to the nearest edge cell, except NaN points,
+            which have no nearest cell and get -1,
+            'mark' and 'drop' give them a cell ID of -1 ('drop' is applied
+            by find_cells, which removes those rows).
+
+    Returns:
+        np.ndarray: int64 array of cell IDs, same length as the input.
+    """
+    if out_of_bounds not in OUT_OF_BOUNDS_POLICIES:
+        raise ValueError(f"out_of_bounds must be one of {OUT_OF_BOUNDS_POLICIES}, got '{out_of_bounds}'")
+
+    lats = np.asarray(lats, dtype='float64')
+    lons = np.asarray(lons, dtype='float64')
+    # ensure ascending (in case you built them descending)
+    if lats[0] > lats[-1]:
+        lats = lats[::-1]
+    if lons[0] > lons[-1]:
+        lons = lons[::-1]
+
+    n_lat_cells = len(lats) - 1
+    n_lon_cells = len(lons) - 1
+
+    lat_in = np.asarray(lat_in, dtype='float64')
+    lon_in = np.asarray(lon_in, dtype='float64')
+
+    in_bounds = (
+        (lats[0] <= lat_in) & (lat_in <= lats[-1]) &
+        (lons[0] <= lon_in) & (lon_in <= lons[-1])
+    )
+    if out_of_bounds == 'raise' and not in_bounds.all():
+        n_out = int((~in_bounds).sum())
+        raise ValueError(f"{n_out} point(s) are outside the grid bounds.")
+
+    # 0-based bin index = rightmost breakpoint <= value, clamped to the grid
+    lat_bin0 = np.clip(np.searchsorted(lats, lat_in, side='right') - 1, 0, n_lat_cells - 1)
+    lon_bin0 = np.clip(np.searchsorted(lons, lon_in, side='right') - 1, 0, n_lon_cells - 1)
+
+    # single id (row-major, 1-based)
+    cell_ids = (lat_bin0 * n_lon_cells + lon_bin0 + 1).astype('int64')
+
+    if out_of_bounds in ('mark', 'drop'):
+        cell_ids[~in_bounds] = -1
+    else:
+        # searchsorted puts NaN after every boundary, which would be the last row or column
+        cell_ids[np.isnan(lat_in) | np.isnan(lon_in)] = -1
+
+    return cell_ids
+
+
+def find_cells(df: pd.DataFrame, num_cols, num_rows, min_in=None, max_in=None, out_of_bounds='drop'):
+    """
+    Assigns every row of df to a grid cell.
+
+    Args:
+        df (pd.DataFrame): Must contain 'latitude' and 'longitude' columns.
+        num_cols (int): Number of longitude cells.
+        num_rows (int): Number of latitude cells.
+        min_in, max_in (list): [lat, lon] corners of the grid. Taken from the
+            data when not given.
+        out_of_bounds (str): Policy for points outside the grid, see
+            which_grid_vectorized. With 'drop' those rows are removed.
+
+    Returns:
+        tuple: (df with a 'cell' column, lats, lons)
+    """
     if min_in is None or max_in is None:
-        min_in = [min(df['latitude'].unique().tolist()), min(df['longitude'].unique().tolist())]
-        max_in = [max(df['latitude'].unique().tolist()), max(df['longitude'].unique().tolist())]
+        min_in = [df['latitude'].min(), df['longitude'].min()]
+        max_in = [df['latitude'].max(), df['longitude'].max()]
 
     lats, lons = create_grid_axes(min_in[0], max_in[0], min_in[1], max_in[1], num_cols, num_rows)
 
-    df['cell'] = df.apply(
-        lambda row: which_grid(lats, lons, row['latitude'], row['longitude']),
-        axis=1
-    )
+    cells = which_grid_vectorized(lats, lons, df['latitude'].to_numpy(), df['longitude'].to_numpy(),
+                                  out_of_bounds=out_of_bounds)
+
+    if out_of_bounds == 'drop':
+        keep = cells != -1
+        if not keep.all():
+            print(f"Dropping {int((~keep).sum())} rows outside the grid bounds.")
+            df = df[keep].copy()
+            cells = cells[keep]
+
+    df['cell'] = cells
 
     return df, lats, lons
 
@@ -154,59 +250,137 @@ def grid_to_coords_vectorized(cells, lats, lons):
     return latitudes, longitudes
 
 
-# In grid.py
-
-def create_grid_geojson(lats, lons):
+@timed('grid.geojson')
+def create_grid_geojson(lats, lons, precision=None):
     """
     Creates a GeoJSON FeatureCollection of rectangular grid cells.
 
     Args:
         lats (list): A list of latitude boundary lines, sorted bottom to top.
         lons (list): A list of longitude boundary lines, sorted left to right.
+        precision (int): Decimal places to round coordinates to, e.g. 5
+            (about 1 m) for a smaller payload. None keeps full precision.
 
     Returns:
         dict: A GeoJSON-compliant dictionary.
     """
-    features = []
+    lats = np.asarray(lats, dtype='float64')
+    lons = np.asarray(lons, dtype='float64')
+    if precision is not None:
+        lats, lons = lats.round(precision), lons.round(precision)
     n_lat_cells = len(lats) - 1
     n_lon_cells = len(lons) - 1
 
-    # Loop through each grid cell coordinate
-    for i in range(n_lat_cells):
-        for j in range(n_lon_cells):
-            # Get the four corners of the cell
-            lat_start, lat_end = lats[i], lats[i + 1]
-            lon_start, lon_end = lons[j], lons[j + 1]
-
-            # Define the polygon for the cell in (lon, lat) order
-            coordinates = [[
-                [lon_start, lat_start],
-                [lon_end, lat_start],
-                [lon_end, lat_end],
-                [lon_start, lat_end],
-                [lon_start, lat_start]  # Close the loop
-            ]]
-
-            # Calculate the cell_id to match your training data
-            # This is the crucial link between your data and the map shape
-            cell_id = i * n_lon_cells + (j + 1)
-
-            # Create the GeoJSON 'Feature' object for this cell
-            feature = {
-                'type': 'Feature',
-                'geometry': {
-                    'type': 'Polygon',
-                    'coordinates': coordinates,
-                },
-                'properties': {
-                    'cell_id': cell_id
-                }
-            }
-            features.append(feature)
-
-    # Combine all features into a 'FeatureCollection'
-    geojson = {
-        'type': 'FeatureCollection',
-        'features': features
+    # The four corners of every cell at once, row-major so index + 1 is the cell_id
+    lat_start, lat_end = np.repeat(lats[:-1], n_lon_cells), np.repeat(lats[1:], n_lon_cells)
+    lon_start, lon_end = np.tile(lons[:-1], n_lat_cells), np.tile(lons[1:], n_lat_cells)
+
+    # (n_cells, 5, 2) rings in (lon, lat) order, closed by repeating the first corner
+    rings = np.stack([
+        np.stack([lon_start, lat_start], axis=-1),
+        np.stack([lon_end, lat_start], axis=-1),
+        np.stack([lon_end, lat_end], axis=-1),
+        np.stack([lon_start, lat_end], axis=-1),
+        np.stack([lon_start, lat_start], axis=-1),
+    ], axis=1).tolist()
+
+    features = [
+        {'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': [ring]}, 'properties': {'cell_id': cell_id}}
+        for cell_id, ring in enumerate(rings, start=1)
+    ]
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+@timed('grid.topojson')
+def create_grid_topojson(lats, lons, quantization=10000):
+    """
+    Creates a TopoJSON Topology of the grid cells, object 'grid', with the
+    same cell_id properties as create_grid_geojson. Every cell edge is one
+    arc shared by the cells on both sides, and coordinates are quantized
+    integers, so the payload is several times smaller.
+
+    Args:
+        lats (list): A list of latitude boundary lines, sorted bottom to top.
+        lons (list): A list of longitude boundary lines, sorted left to right.
+        quantization (int): Number of distinct positions along each axis, at
+            least 2; 10000 is about 2 m across San Francisco.
+
+    Returns:
+        dict: A TopoJSON-compliant dictionary.
+    """
+    if quantization < 2:
+        raise ValueError(f"quantization must be at least 2, got {quantization}")
+    lats = np.asarray(lats, dtype='float64')
+    lons = np.asarray(lons, dtype='float64')
+    n_lat_cells = len(lats) - 1
+    n_lon_cells = len(lons) - 1
+
+    scale = [max(lons[-1] - lons[0], 1e-12) / (quantization - 1), max(lats[-1] - lats[0], 1e-12) / (quantization - 1)]
+    x = np.round((lons - lons[0]) / scale[0]).astype('int64')
+    y = np.round((lats - lats[0]) / scale[1]).astype('int64')
+
+    # Horizontal edges first, (n_lat_cells + 1) lines of n_lon_cells arcs, then vertical
+    # edges, (n_lon_cells + 1) lines of n_lat_cells arcs. Arcs are delta-encoded.
+    row, col = np.divmod(np.arange((n_lat_cells + 1) * n_lon_cells), n_lon_cells)
+    horizontal = np.stack([x[col], y[row], x[col + 1] - x[col], np.zeros_like(col)], axis=-1)
+    col, row = np.divmod(np.arange((n_lon_cells + 1) * n_lat_cells), n_lat_cells)
+    vertical = np.stack([x[col], y[row], np.zeros_like(row), y[row + 1] - y[row]], axis=-1)
+    arcs = np.concatenate([horizontal, vertical]).reshape(-1, 2, 2).tolist()
+
+    # Each ring runs bottom, right, top (reversed), left (reversed), like the GeoJSON rings.
+    # A reversed arc i is written ~i.
+    row, col = np.divmod(np.arange(n_lat_cells * n_lon_cells), n_lon_cells)
+    n_horizontal = (n_lat_cells + 1) * n_lon_cells
+    bottom = row * n_lon_cells + col
+    top = (row + 1) * n_lon_cells + col
+    left = n_horizontal + col * n_lat_cells + row
+    right = n_horizontal + (col + 1) * n_lat_cells + row
+    rings = np.stack([bottom, right, ~top, ~left], axis=-1).tolist()
+
+    geometries = [
+        {'type': 'Polygon', 'arcs': [ring], 'properties': {'cell_id': cell_id}}
+        for cell_id, ring in enumerate(rings, start=1)
+    ]
+    return {
+        'type': 'Topology',
+        'transform': {'scale': scale, 'translate': [float(lons[0]), float(lats[0])]},
+        'objects': {'grid': {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': arcs,
     }
-    return geojson
+
+
+GRID_SHAPE_ENCODINGS = ('geojson', 'topojson')
+
+
+@lru_cache(maxsize=32)
+def _grid_shapes(lats: tuple, lons: tuple, encoding: str, precision, quantization):
+    count('grid.shapes_built')
+    if encoding == 'topojson':
+        return create_grid_topojson(lats, lons, **({} if quantization is None else {'quantization': quantization}))
+    return create_grid_geojson(lats, lons, precision)
+
+
+def grid_shapes(lats, lons, encoding='geojson', precision=None, quantization=None):
+    """
+    Memoized create_grid_geojson or create_grid_topojson, built once per grid
+    spec. The returned dict is shared between callers and must not be modified.
+
+    Args:
+        lats (list): Latitude boundary lines.
+        lons (list): Longitude boundary lines.
+        encoding (str): 'geojson' or 'topojson'.
+        precision (int): Decimal places, GeoJSON only. None keeps full precision.
+        quantization (int): Positions per axis, TopoJSON only, at least 2.
+            None uses create_grid_topojson's default.
+    """
+    if encoding not in GRID_SHAPE_ENCODINGS:
+        raise ValueError(f"encoding must be one of {GRID_SHAPE_ENCODINGS}, got '{encoding}'")
+    if quantization is not None and quantization < 2:
+        raise ValueError(f"quantization must be at least 2, got {quantization}")
+    count('grid.shapes_requested')
+    # Only the encoding's own option is part of the memo key
+    if encoding == 'topojson':
+        precision = None
+    else:
+        quantization = None
+    return _grid_shapes(tuple(map(float, lats)), tuple(map(float, lons)), encoding, precision, quantization)
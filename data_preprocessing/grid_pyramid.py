@@ -0,0 +1,145 @@
+import numpy as np
+
+from grid import grid_shapes
+
+
+def coarsen_axis(bounds) -> np.ndarray:
+    """
+    Every other boundary line, so each coarse cell spans two fine ones.
+    With an odd number of cells the last coarse cell spans just one.
+    """
+    bounds = np.asarray(bounds, dtype='float64')
+    coarse = bounds[::2]
+    if (len(bounds) - 1) % 2:
+        coarse = np.append(coarse, bounds[-1])
+    return coarse
+
+
+def sum_blocks(values: np.ndarray, n_rows: int, n_cols: int) -> np.ndarray:
+    """
+    Sums 2x2 blocks of row-major cells, the cell axis being the last axis of
+    values. Odd grids are padded with zeros, matching coarsen_axis.
+
+    Returns:
+        np.ndarray: (..., ceil(n_rows / 2) * ceil(n_cols / 2)) array.
+    """
+    values = np.asarray(values)
+    lead = values.shape[:-1]
+    grid = values.reshape(lead + (n_rows, n_cols))
+    pad = [(0, 0)] * len(lead) + [(0, n_rows % 2), (0, n_cols % 2)]
+    if n_rows % 2 or n_cols % 2:
+        grid = np.pad(grid, pad)
+    rows, cols = grid.shape[-2] // 2, grid.shape[-1] // 2
+    return grid.reshape(lead + (rows, 2, cols, 2)).sum(axis=(-3, -1)).reshape(lead + (rows * cols,))
+
+
+class GridPyramid:
+    """
+    A fine grid and successively coarser versions of it, each cell of level
+    l + 1 covering a 2x2 block of level l. Level 0 is the grid the model
+    predicts on. Every level has its own 1-based, row-major cell IDs, the
+    same numbering as which_grid and create_grid_geojson.
+    """
+
+    def __init__(self, lats, lons, num_levels: int = None):
+        """
+        Args:
+            lats (list): Latitude boundary lines of the finest grid, ascending.
+            lons (list): Longitude boundary lines of the finest grid, ascending.
+            num_levels (int): Levels to build including level 0. Defaults to
+                coarsening until a single cell is left.
+        """
+        self.levels = [(np.asarray(lats, dtype='float64'), np.asarray(lons, dtype='float64'))]
+        while num_levels is None or len(self.levels) < num_levels:
+            lats, lons = self.levels[-1]
+            if len(lats) == 2 and len(lons) == 2:
+                break
+            self.levels.append((coarsen_axis(lats), coarsen_axis(lons)))
+
+    def __len__(self):
+        return len(self.levels)
+
+    def axes(self, level: int):
+        """(lats, lons) boundary lines of a level, as lists like create_grid_axes."""
+        lats, lons = self.levels[level]
+        return lats.tolist(), lons.tolist()
+
+    def shape(self, level: int):
+        """(rows, columns) of a level."""
+        lats, lons = self.levels[level]
+        return len(lats) - 1, len(lons) - 1
+
+    def num_cells(self, level: int) -> int:
+        rows, cols = self.shape(level)
+        return rows * cols
+
+    def aggregate(self, values: np.ndarray, level: int) -> np.ndarray:
+        """
+        Sums fine-grid predictions or counts up to one level.
+
+        Args:
+            values (np.ndarray): (..., num_cells(0)) array, e.g. one hour of
+                predictions or (hours, cells).
+            level (int): Target level.
+
+        Returns:
+            np.ndarray: (..., num_cells(level)) array.
+        """
+        values = np.asarray(values)
+        if values.shape[-1] != self.num_cells(0):
+            raise ValueError(f"Expected {self.num_cells(0)} cells on the last axis, got {values.shape[-1]}")
+        for finer in range(level):
+            values = sum_blocks(values, *self.shape(finer))
+        return values
+
+    def build(self, values: np.ndarray) -> list:
+        """All levels of values, finest first. Each level is summed from the one below it."""
+        pyramid = [np.asarray(values)]
+        for finer in range(len(self) - 1):
+            pyramid.append(sum_blocks(pyramid[-1], *self.shape(finer)))
+        return pyramid
+
+    def parent_cells(self, level: int) -> np.ndarray:
+        """The level's cell ID for every level 0 cell, indexed by level 0 cell ID - 1."""
+        rows, cols = self.shape(0)
+        scale = 2 ** level
+        row, col = np.divmod(np.arange(rows * cols), cols)
+        return (row // scale) * self.shape(level)[1] + col // scale + 1
+
+    def geojson(self, level: int, precision: int = None) -> dict:
+        """create_grid_geojson for a level, memoized by grid_shapes. Shared, do not modify."""
+        return grid_shapes(*self.levels[level], precision=precision)
+
+    def topojson(self, level: int) -> dict:
+        """create_grid_topojson for a level, memoized by grid_shapes. Shared, do not modify."""
+        return grid_shapes(*self.levels[level], encoding='topojson')
+
+    def level_for_viewport(self, min_lat, max_lat, min_lon, max_lon, max_cells: int = 1024) -> int:
+        """
+        The finest level with at most max_cells cells inside the viewport.
+
+        Args:
+            min_lat, max_lat, min_lon, max_lon (float): Viewport bounds.
+            max_cells (int): Most cells worth sending to and drawing in the client.
+        """
+        for level in range(len(self)):
+            lats, lons = self.levels[level]
+            rows = np.count_nonzero((lats[1:] > min_lat) & (lats[:-1] < max_lat))
+            cols = np.count_nonzero((lons[1:] > min_lon) & (lons[:-1] < max_lon))
+            if rows * cols <= max_cells:
+                return level
+        return len(self) - 1
+
+    def level_for_zoom(self, zoom: float, min_cell_pixels: float = 8) -> int:
+        """
+        The finest level whose cells are at least min_cell_pixels wide on a
+        web-mercator map (256 px tiles) at the given zoom, e.g. a folium or
+        Leaflet zoom level.
+        """
+        degrees_per_pixel = 360 / (256 * 2 ** zoom)
+        for level in range(len(self)):
+            lons = self.levels[level][1]
+            if (lons[1] - lons[0]) / degrees_per_pixel >= min_cell_pixels:
+                return level
+        return len(self) - 1
+
@@ -1,8 +1,87 @@
+import numpy as np
 import pandas as pd
-import faiss
 
-
-def match_weather_data(weather_data: pd.DataFrame = None, emt_data: pd.DataFrame = None):
+WEATHER_KEY_COLUMNS = ['year', 'month', 'day', 'date', 'latitude', 'longitude']
+
+
+def nearest_station(coords, station_coords):
+    """
+    Index of the nearest weather station (Euclidean distance in lat/lon) for
+    every row of coords. There are only a handful of stations, so a brute
+    force argmin over the (n_points, n_stations) distance matrix is enough.
+
+    Args:
+        coords (np.ndarray): (n, 2) array of [lat, lon].
+        station_coords (np.ndarray): (n_stations, 2) array of [lat, lon].
+
+    Returns:
+        np.ndarray: (n,) int array of station indices.
+    """
+    coords = np.asarray(coords, dtype='float64')
+    station_coords = np.asarray(station_coords, dtype='float64')
+    distances = ((coords[:, None, :] - station_coords[None, :, :]) ** 2).sum(axis=2)
+    return distances.argmin(axis=1)
+
+
+def build_weather_array(weather_data: pd.DataFrame):
+    """
+    Lays the weather table out as dense (station, day) arrays so it can be
+    joined by integer indexing instead of a merge on float coordinates.
+
+    Args:
+        weather_data (pd.DataFrame): Daily weather with 'date', 'latitude' and
+            'longitude' columns plus any number of value columns.
+
+    Returns:
+        dict: 'stations' (n_stations, 2) coordinates, 'first_day' (day ordinal
+        of column 0), 'present' (n_stations, n_days) bool mask of rows that
+        exist, and 'values', a dict of (n_stations, n_days) arrays per column.
+    """
+    value_cols = [col for col in weather_data.columns if col not in WEATHER_KEY_COLUMNS]
+
+    station_coords, station_idx = np.unique(
+        weather_data[['latitude', 'longitude']].to_numpy(dtype='float64'), axis=0, return_inverse=True)
+    station_idx = station_idx.ravel()
+
+    day_ordinals = pd.to_datetime(weather_data['date']).to_numpy().astype('datetime64[D]').astype('int64')
+    first_day = day_ordinals.min()
+    day_idx = day_ordinals - first_day
+    shape = (len(station_coords), int(day_idx.max()) + 1)
+
+    present = np.zeros(shape, dtype=bool)
+    present[station_idx, day_idx] = True
+
+    values = {}
+    for col in value_cols:
+        column = weather_data[col].to_numpy()
+        if column.dtype.kind == 'f':
+            array = np.full(shape, np.nan, dtype=column.dtype)
+        else:
+            array = np.full(shape, np.nan, dtype=object)
+        array[station_idx, day_idx] = column
+        values[col] = array
+
+    return {'stations': station_coords, 'first_day': first_day, 'present': present, 'values': values}
+
+
+def match_weather_data(weather_data: pd.DataFrame = None, emt_data: pd.DataFrame = None, weather_array=None):
+    """
+    Attaches the weather of the nearest station on the same day to every row of emt_data.
+
+    Rows after the grid step share at most total_cells distinct coordinates,
+    so the nearest station is computed once per distinct coordinate (i.e. a
+    per-cell table) and the weather is then picked out of the dense
+    (station, day) arrays by integer indexing.
+
+    Args:
+        weather_data (pd.DataFrame): Daily weather per station.
+        emt_data (pd.DataFrame): Rows with 'date', 'latitude' and 'longitude'.
+        weather_array (dict): Output of build_weather_array, to reuse it across calls.
+
+    Returns:
+        pd.DataFrame: emt_data without 'date' plus the weather columns. Rows
+        with no weather for their station and day are dropped.
+    """
     weather_required_columns = ['year', 'month', 'day', 'latitude', 'longitude']
     emt_required_columns = ['year', 'month', 'day', 'latitude', 'longitude']
 
@@ -16,46 +95,40 @@ def match_weather_data(weather_data: pd.DataFrame = None, emt_data: pd.DataFrame
     if missing_emt_cols:
         raise ValueError(f"emt_data is missing columns: {missing_emt_cols}")
 
-    # Unique weather station coords
-    weather_coords = weather_data[['latitude', 'longitude']].drop_duplicates().to_numpy().astype('float64')
-
-    # Build the FAISS index
-    index = faiss.IndexFlatL2(weather_coords.shape[1])  # L2 = Euclidean
-    index.add(weather_coords)
+    if weather_array is None:
+        weather_array = build_weather_array(weather_data)
 
-    # Query for nearest station for each call
-    call_coords = emt_data[['latitude', 'longitude']].to_numpy().astype('float32')
-    distances, indices = index.search(call_coords, 1)  # k=1 nearest
+    merged = emt_data.dropna(subset=["latitude", "longitude"])
 
-    # Map the nearest station coords back
-    nearest_weather_coords = weather_coords[indices.flatten()]
-    emt_data['nearest_lat'] = nearest_weather_coords[:, 0]
-    emt_data['nearest_lon'] = nearest_weather_coords[:, 1]
+    # Nearest station per distinct coordinate, then broadcast back to the rows
+    # (hash-based factorize on lat + i*lon, much cheaper than np.unique(axis=0) on millions of rows)
+    coord_idx, unique_coords = pd.factorize(
+        merged['latitude'].to_numpy(dtype='float64') + 1j * merged['longitude'].to_numpy(dtype='float64'))
+    unique_coords = np.column_stack([unique_coords.real, unique_coords.imag])
+    station_idx = nearest_station(unique_coords, weather_array['stations'])[coord_idx]
 
-    merged = pd.merge(
-        emt_data,
-        weather_data,
-        left_on=['nearest_lat', 'nearest_lon', 'date'],
-        right_on=['latitude', 'longitude', 'date'],
-        how='inner'
-    )
+    day_ordinals = pd.to_datetime(merged['date']).to_numpy().astype('datetime64[D]').astype('int64')
+    day_idx = day_ordinals - weather_array['first_day']
 
-    merged = merged.drop(
-        columns=['latitude_y', 'longitude_y', 'nearest_lat', 'nearest_lon', 'date', 'year_y', 'month_y', 'day_y'])
+    n_days = weather_array['present'].shape[1]
+    in_range = (day_idx >= 0) & (day_idx < n_days)
+    keep = np.zeros(len(merged), dtype=bool)
+    keep[in_range] = weather_array['present'][station_idx[in_range], day_idx[in_range]]
 
-    merged = merged.rename(columns={'year_x': 'year'})
-    merged = merged.rename(columns={'day_x': 'day'})
-    merged = merged.rename(columns={'month_x': 'month'})
-    merged = merged.rename(columns={'longitude_x': 'longitude'})
-    merged = merged.rename(columns={'latitude_x': 'latitude'})
+    merged = merged[keep].drop(columns=['date'])
+    station_idx = station_idx[keep]
+    day_idx = day_idx[keep]
 
-    merged = merged.dropna(subset=["latitude", "longitude"])
+    for col, values in weather_array['values'].items():
+        merged[col] = values[station_idx, day_idx]
 
     return merged
 
 
 if __name__ == "__main__":
+    from parquet_store import EMT_DATA_DIR, read_dataset
+
     weather_data = pd.read_csv('../data/weather.csv')
-    emt_data = pd.read_parquet('../data/processed_ems_data.parquet')
+    emt_data = read_dataset(EMT_DATA_DIR)
 
-    match_weather_data(weather_data, emt_data)
\ No newline at end of file
+    match_weather_data(weather_data, emt_data)
@@ -0,0 +1,136 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+EMT_DATA_DIR = '../data/emt_data'
+TRAINING_DATA_DIR = '../data/training'
+PREDICTIONS_DATA_DIR = '../data/predictions'
+
+PARTITION_COLS = ['year', 'month']
+# Leading underscore: dataset discovery skips it, so it can sit next to the partitions
+GRID_SPEC_FILE = '_grid.json'
+
+
+def training_table_dir(grid_columns, grid_rows, root: str = TRAINING_DATA_DIR):
+    """Each grid spec gets its own training table, e.g. ../data/training/grid=50x50."""
+    return str(Path(root) / f"grid={grid_columns}x{grid_rows}")
+
+
+def write_grid_spec(path: str, lats, lons) -> dict:
+    """
+    Records the grid a training table was built on, next to its partitions:
+    columns, rows, num_cells and the [lat, lon] corners min_in and max_in.
+    """
+    spec = {
+        'columns': len(lons) - 1,
+        'rows': len(lats) - 1,
+        'num_cells': (len(lons) - 1) * (len(lats) - 1),
+        'min_in': [float(lats[0]), float(lons[0])],
+        'max_in': [float(lats[-1]), float(lons[-1])],
+    }
+    Path(path).mkdir(parents=True, exist_ok=True)
+    with open(Path(path) / GRID_SPEC_FILE, 'w') as f:
+        json.dump(spec, f)
+    return spec
+
+
+def read_grid_spec(path: str):
+    """The grid spec written by write_grid_spec, or None for a table without one."""
+    spec_path = Path(path) / GRID_SPEC_FILE
+    if not spec_path.exists():
+        return None
+    with open(spec_path) as f:
+        return json.load(f)
+
+
+def write_partitioned(df: pd.DataFrame, path: str, partition_cols=None):
+    """
+    Writes df as a hive-partitioned parquet dataset (path/year=2004/month=7/...).
+    Partitions present in df replace the ones on disk, others are left alone.
+
+    Args:
+        df (pd.DataFrame): Must contain the partition columns.
+        path (str): Root directory of the dataset.
+        partition_cols (list): Defaults to ['year', 'month'].
+    """
+    partition_cols = partition_cols or PARTITION_COLS
+    missing = [col for col in partition_cols if col not in df.columns]
+    if missing:
+        raise ValueError(f"df is missing partition columns: {missing}")
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    partitioning = ds.partitioning(table.select(partition_cols).schema, flavor='hive')
+
+    ds.write_dataset(
+        table,
+        path,
+        format='parquet',
+        partitioning=partitioning,
+        existing_data_behavior='delete_matching',
+        max_rows_per_group=1_000_000
+    )
+
+
+def open_dataset(path: str):
+    """Opens a partitioned directory or a single parquet file as a pyarrow dataset."""
+    if not Path(path).exists():
+        raise FileNotFoundError(f"Dataset not found at {path}")
+    if Path(path).is_dir():
+        return ds.dataset(path, format='parquet', partitioning='hive')
+    return ds.dataset(path, format='parquet')
+
+
+def build_filter(years=None, bbox=None, filters=None):
+    """
+    Builds a pyarrow filter expression.
+
+    Args:
+        years (tuple): (first_year, last_year), inclusive. A single int selects one year.
+        bbox (tuple): (min_lat, min_lon, max_lat, max_lon), inclusive.
+        filters (pyarrow.dataset.Expression): Any extra expression, and-ed in.
+
+    Returns:
+        pyarrow.dataset.Expression or None
+    """
+    expressions = []
+    if years is not None:
+        if isinstance(years, int):
+            years = (years, years)
+        expressions.append((ds.field('year') >= years[0]) & (ds.field('year') <= years[1]))
+    if bbox is not None:
+        min_lat, min_lon, max_lat, max_lon = bbox
+        expressions.append(
+            (ds.field('latitude') >= min_lat) & (ds.field('latitude') <= max_lat) &
+            (ds.field('longitude') >= min_lon) & (ds.field('longitude') <= max_lon)
+        )
+    if filters is not None:
+        expressions.append(filters)
+
+    if not expressions:
+        return None
+    expression = expressions[0]
+    for other in expressions[1:]:
+        expression = expression & other
+    return expression
+
+
+def read_dataset(path: str, columns=None, years=None, bbox=None, filters=None) -> pd.DataFrame:
+    """
+    Reads a parquet dataset with the column selection and row filters pushed
+    down to the scan, so partitions outside the year range are never opened
+    and row groups outside the bounding box are skipped by their statistics.
+
+    Args:
+        path (str): Partitioned directory or single parquet file.
+        columns (list): Columns to load. Defaults to all.
+        years, bbox, filters: See build_filter.
+
+    Returns:
+        pd.DataFrame
+    """
+    dataset = open_dataset(path)
+    table = dataset.to_table(columns=columns, filter=build_filter(years, bbox, filters))
+    return table.to_pandas()
@@ -1,25 +1,23 @@
-import pandas as pd
 from add_non_emergency import add_non_emergency
-from grid import create_grid_axes, which_grid, other_create_grid_axes
+from grid import create_grid_axes, which_grid_vectorized
+from parquet_store import read_dataset
 
-def get_output(path):
+def get_output(path, num_cols=32, num_rows=32):
 
     max_in =[37.875808, -122.326536]
     min_in =[37.680158, -122.560339]
 
-    lats, lons = create_grid_axes(min_in[0], max_in[0], min_in[1], max_in[0], 4)
+    lats, lons = create_grid_axes(min_in[0], max_in[0], min_in[1], max_in[1], num_cols, num_rows)
 
-    df = pd.read_parquet(path)
-    df = df[
-        (df["latitude"] >= min_in[0]) & (df["latitude"] <= max_in[0]) &
-        (df["longitude"] >= min_in[1]) & (df["longitude"] <= max_in[1])
-    ]
+    df = read_dataset(path, bbox=(min_in[0], min_in[1], max_in[0], max_in[1]))
 
-    df["cell"] = df.apply(
-        lambda r: which_grid(lats, lons, r["latitude"], r["longitude"]),
-        axis = 1
-    )
+    df["cell"] = which_grid_vectorized(lats, lons, df["latitude"], df["longitude"], out_of_bounds='clip')
+    # Rows without coordinates have no cell
+    missing = df["cell"] == -1
+    if missing.any():
+        print(f"Dropping {int(missing.sum())} rows without coordinates.")
+        df = df[~missing].copy()
 
-    df = add_non_emergency(df)
+    df = add_non_emergency(df, num_cols * num_rows)
 
-    df.to_csv("parsed_emt_data.csv", index=False)
\ No newline at end of file
+    df.to_csv("parsed_emt_data.csv", index=False)
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+# Column dtypes of the training table, from add_non_emergency through to the model.
+# cell < 65536, hour/month/day < 256, counts per cell and hour are small.
+TRAINING_SCHEMA = {
+    'cell': 'uint16',
+    'year': 'int16',
+    'month': 'uint8',
+    'day': 'uint8',
+    'hour': 'uint8',
+    'fmax': 'float32',
+    'fmin': 'float32',
+    'prcp_in': 'float32',
+    'snow_in': 'float32',
+    'emergency_count': 'uint16',
+}
+
+# What get_training_data produced before, kept for memory_report
+LEGACY_SCHEMA = {
+    col: 'float64' if dtype.startswith('float') else 'int64'
+    for col, dtype in TRAINING_SCHEMA.items()
+}
+
+FEATURES = ['cell', 'year', 'month', 'day', 'hour', 'fmax', 'fmin', 'prcp_in', 'snow_in']
+TARGET = 'emergency_count'
+
+
+def apply_schema(df: pd.DataFrame, schema=None):
+    """
+    Casts the columns of df that appear in the schema, in place, and returns df.
+    Non-numeric values are coerced to NaN first, like the old pd.to_numeric loop.
+
+    Raises:
+        ValueError: If an integer column holds values outside its dtype's range,
+            e.g. the cell -1 of out_of_bounds='mark' or a grid of 65,536 cells
+            or more, which astype would silently wrap around.
+    """
+    schema = schema or TRAINING_SCHEMA
+    for col, dtype in schema.items():
+        if col in df.columns and df[col].dtype != dtype:
+            if df[col].dtype == object:
+                df[col] = pd.to_numeric(df[col], errors='coerce')
+            if np.issubdtype(np.dtype(dtype), np.integer) and len(df[col]):
+                limits = np.iinfo(dtype)
+                low, high = df[col].min(), df[col].max()
+                if low < limits.min or high > limits.max:
+                    raise ValueError(f"Column '{col}' has values in [{low}, {high}], "
+                                     f"outside the {dtype} range [{limits.min}, {limits.max}].")
+            df[col] = df[col].astype(dtype)
+    return df
+
+
+def memory_report(df: pd.DataFrame):
+    """
+    Compares the memory of df in the compact schema against the old int64/float64 layout.
+
+    Returns:
+        pd.DataFrame: Bytes per column for both layouts, with a total row.
+    """
+    columns = [col for col in TRAINING_SCHEMA if col in df.columns]
+    compact = apply_schema(df[columns].copy())
+    legacy = apply_schema(df[columns].copy(), LEGACY_SCHEMA)
+
+    report = pd.DataFrame({
+        'legacy_dtype': legacy.dtypes.astype(str),
+        'legacy_bytes': legacy.memory_usage(index=False, deep=True),
+        'compact_dtype': compact.dtypes.astype(str),
+        'compact_bytes': compact.memory_usage(index=False, deep=True),
+    })
+    report.loc['total'] = ['', report['legacy_bytes'].sum(), '', report['compact_bytes'].sum()]
+
+    total = report.loc['total']
+    print(f"Training table: {total['legacy_bytes'] / 1e6:.1f} MB legacy, "
+          f"{total['compact_bytes'] / 1e6:.1f} MB compact "
+          f"({total['legacy_bytes'] / total['compact_bytes']:.1f}x smaller)")
+    return report
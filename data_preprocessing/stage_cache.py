@@ -0,0 +1,115 @@
+import os
+import json
+import hashlib
+from pathlib import Path
+
+import pandas as pd
+
+CACHE_DIR = '../data/cache'
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3  # 20 GB
+
+
+def fingerprint_path(path: str):
+    """
+    Cheap fingerprint of an input file or dataset directory: the path, size
+    and mtime of every file, without reading the data.
+    """
+    path = Path(path)
+    if not path.exists():
+        raise FileNotFoundError(f"Cannot fingerprint missing input {path}")
+
+    files = sorted(p for p in path.rglob('*') if p.is_file()) if path.is_dir() else [path]
+    return [[str(p), p.stat().st_size, p.stat().st_mtime_ns] for p in files]
+
+
+def stage_key(name: str, *inputs, **params):
+    """
+    Hash of a stage name, its input fingerprints (or parent stage keys) and
+    its parameters. Any change upstream changes every key below it.
+    """
+    payload = json.dumps([name, inputs, params], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()[:24]
+
+
+class StageCache:
+    """
+    On-disk cache of pipeline stage outputs. Every entry is a parquet file
+    named after its stage and key, plus an optional JSON file for small
+    extra outputs (e.g. grid axes). Least recently used entries are evicted
+    once the cache grows past max_bytes.
+    """
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def _paths(self, name: str, key: str):
+        base = self.cache_dir / f"{name}-{key}"
+        return base.with_suffix('.parquet'), base.with_suffix('.json')
+
+    def get_or_compute(self, name: str, key: str, compute):
+        """
+        Returns the cached output of a stage, or runs compute() and stores it.
+
+        Args:
+            name (str): Stage name.
+            key (str): Key from stage_key.
+            compute (callable): Returns a DataFrame, or a (DataFrame, dict) tuple
+                where the dict is JSON-serializable.
+
+        Returns:
+            tuple: (DataFrame, dict or None)
+        """
+        data_path, meta_path = self._paths(name, key)
+
+        if data_path.exists():
+            print(f"Stage '{name}' loaded from cache ({key}).")
+            df = pd.read_parquet(data_path)
+            meta = None
+            if meta_path.exists():
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            # touch, so eviction sees this entry as recently used
+            os.utime(data_path)
+            return df, meta
+
+        result = compute()
+        df, meta = result if isinstance(result, tuple) else (result, None)
+
+        # write then rename, so an interrupted run never leaves a partial entry
+        tmp_path = data_path.with_suffix('.tmp')
+        df.to_parquet(tmp_path, index=False)
+        if meta is not None:
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+        tmp_path.rename(data_path)
+        print(f"Stage '{name}' computed and cached ({key}).")
+
+        self.evict()
+        return df, meta
+
+    def size(self):
+        """Total size of the cache in bytes."""
+        return sum(p.stat().st_size for p in self.cache_dir.iterdir() if p.is_file())
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes."""
+        entries = sorted(self.cache_dir.glob('*.parquet'), key=lambda p: p.stat().st_mtime_ns)
+        total = self.size()
+        # never evict the newest entry, it was just written
+        for data_path in entries[:-1]:
+            if total <= self.max_bytes:
+                break
+            total -= data_path.stat().st_size
+            data_path.unlink()
+            meta_path = data_path.with_suffix('.json')
+            if meta_path.exists():
+                total -= meta_path.stat().st_size
+                meta_path.unlink()
+            print(f"Evicted {data_path.name} from stage cache.")
+
+    def clear(self):
+        for p in self.cache_dir.iterdir():
+            if p.is_file():
+                p.unlink()
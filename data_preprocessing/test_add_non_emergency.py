@@ -0,0 +1,84 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from add_non_emergency import add_non_emergency, build_count_tensor, iter_non_emergency
+from schema import TRAINING_SCHEMA
+
+
+class TestAddNonEmergency(unittest.TestCase):
+
+    def setUp(self):
+        """Random events over two months on a 3x3 grid, with repeated (hour, cell) slots."""
+        rng = np.random.default_rng(0)
+        hours = pd.Timestamp('2000-01-30') + pd.to_timedelta(rng.integers(0, 24 * 5, 200), unit='h')
+        self.total_cells = 9
+        self.events = pd.DataFrame({
+            'call_number': np.arange(200),
+            'date': hours,
+            'cell': rng.integers(1, self.total_cells + 1, 200),
+        })
+
+    def assert_backends_match(self, events, total_cells):
+        merge = add_non_emergency(events.copy(), total_cells, backend='merge')
+        dense = add_non_emergency(events.copy(), total_cells, backend='dense')
+
+        key = ['date_hour', 'cell']
+        merge = merge.sort_values(key).reset_index(drop=True)
+        dense = dense.sort_values(key).reset_index(drop=True)
+        self.assertEqual(list(merge.columns), list(dense.columns))
+        pd.testing.assert_frame_equal(merge, dense, check_dtype=False)
+        return dense
+
+    def test_dense_matches_merge(self):
+        dense = self.assert_backends_match(self.events, self.total_cells)
+        self.assertEqual(dense['emergency_count'].sum(), len(self.events))
+
+    def test_dense_matches_merge_with_weather(self):
+        events = self.events.copy()
+        rng = np.random.default_rng(1)
+        events['fmax'] = rng.normal(60, 10, len(events)).round(1)
+        events['prcp'] = rng.random(len(events)).round(2)
+        dense = self.assert_backends_match(events, self.total_cells)
+        self.assertFalse(dense[['fmax', 'prcp']].isna().any().any())
+
+    def test_weather_is_filled_within_cell_and_day(self):
+        """A cell's hours take its own events' weather for that day, never another cell's or day's."""
+        events = pd.DataFrame({
+            'date': pd.to_datetime(['2007-01-31 22:10', '2007-01-31 23:05', '2007-02-01 03:00']),
+            'cell': [2, 2, 1],
+            'fmax': [60.0, 70.0, 80.0],
+        })
+        dense = self.assert_backends_match(events, 2)
+        cell_2 = dense[dense['cell'] == 2].set_index('date_hour')['fmax']
+        self.assertEqual(cell_2[pd.Timestamp('2007-01-31 22:00')], 60)
+        self.assertEqual(cell_2[pd.Timestamp('2007-01-31 23:00')], 70)
+        # Cell 1 has no event on Jan 31 and cell 2 none on Feb 1, so those rows are dropped
+        self.assertEqual(set(dense.loc[dense['cell'] == 1, 'day']), {1})
+        self.assertEqual(set(dense.loc[dense['cell'] == 2, 'day']), {31})
+        self.assertTrue((dense.loc[dense['cell'] == 1, 'fmax'] == 80).all())
+
+    def test_compact_dtypes(self):
+        dense = add_non_emergency(self.events.copy(), self.total_cells)
+        for col, dtype in TRAINING_SCHEMA.items():
+            if col in dense.columns:
+                self.assertEqual(dense[col].dtype, dtype, col)
+
+    def test_count_tensor_shape(self):
+        counts, all_hours = build_count_tensor(self.events, self.total_cells)
+        self.assertEqual(counts.shape, (len(all_hours), self.total_cells))
+        self.assertEqual(counts.sum(), len(self.events))
+
+    def test_iter_yields_one_chunk_per_month(self):
+        chunks = list(iter_non_emergency(self.events, self.total_cells))
+        self.assertEqual([c['month'].unique().tolist() for c in chunks], [[1], [2]])
+
+    def test_cells_outside_grid_are_ignored(self):
+        events = self.events.copy()
+        events.loc[0, 'cell'] = -1
+        counts, _ = build_count_tensor(events, self.total_cells)
+        self.assertEqual(counts.sum(), len(events) - 1)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
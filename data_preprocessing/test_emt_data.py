@@ -0,0 +1,130 @@
+import json
+import re
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pandas as pd
+
+from emt_data import (fetch_raw_emt_data, load_raw_emt_pages, make_client, read_watermark,
+                      normalize_emt_records)
+
+
+def make_records(n, start='2000-01-15', freq='7h'):
+    times = pd.date_range(start, periods=n, freq=freq)
+    return [{
+        'call_number': str(i),
+        'incident_number': str(i),
+        'received_dttm': t.strftime('%Y-%m-%dT%H:%M:%S.000'),
+        'case_location': {'type': 'Point', 'coordinates': [-122.4 + i * 1e-4, 37.7]},
+        'unit_type': 'MEDIC',
+    } for i, t in enumerate(times)]
+
+
+class SodaStandIn(BaseHTTPRequestHandler):
+    """Minimal local stand-in for the SODA resource endpoint."""
+    records = []
+    requests_seen = []
+
+    def do_GET(self):
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        SodaStandIn.requests_seen.append(params)
+
+        lo, hi = re.findall(r"'([^']+)'", params['$where'])
+        rows = sorted((r for r in self.records if lo <= r['received_dttm'] < hi),
+                      key=lambda r: (r['received_dttm'], int(r['call_number'])))
+        offset, limit = int(params['$offset']), int(params['$limit'])
+        columns = params['$select'].split(', ')
+        rows = [{c: r[c] for c in columns} for r in rows[offset:offset + limit]]
+
+        body = json.dumps(rows).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestFetchRawEmtData(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), SodaStandIn)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        domain = f"127.0.0.1:{cls.server.server_address[1]}"
+        cls.client_factory = staticmethod(lambda: make_client(domain, scheme="http://"))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        self.out_dir = tempfile.mkdtemp()
+        SodaStandIn.records = make_records(300)
+        SodaStandIn.requests_seen = []
+
+    def tearDown(self):
+        shutil.rmtree(self.out_dir)
+
+    def fetch(self, **kwargs):
+        return fetch_raw_emt_data(self.out_dir, start='2000-01-01', end='2000-05-01', page_size=25,
+                                  max_workers=3, client_factory=self.client_factory, **kwargs)
+
+    def test_fetches_everything_with_select_pushdown(self):
+        self.assertEqual(self.fetch(), 300)
+        df = load_raw_emt_pages(self.out_dir)
+        self.assertEqual(sorted(df['call_number'].astype(int)), list(range(300)))
+        self.assertNotIn('unit_type', df.columns)
+        self.assertTrue(all(p['$select'] == 'call_number, incident_number, received_dttm, case_location'
+                            for p in SodaStandIn.requests_seen))
+
+    def test_resume_skips_written_pages(self):
+        self.fetch()
+        n_requests = len(SodaStandIn.requests_seen)
+        self.assertEqual(self.fetch(), 0)
+        self.assertEqual(len(SodaStandIn.requests_seen), n_requests)
+
+    def test_since_watermark_only_fetches_new_records(self):
+        self.fetch()
+        self.assertEqual(read_watermark(self.out_dir), SodaStandIn.records[-1]['received_dttm'])
+
+        SodaStandIn.records = make_records(320)
+        self.assertEqual(self.fetch(since_watermark=True), 20)
+        df = load_raw_emt_pages(self.out_dir)
+        self.assertEqual(len(df), 320)
+        self.assertFalse(df['call_number'].duplicated().any())
+
+
+class TestNormalizeEmtRecords(unittest.TestCase):
+
+    def test_normalize(self):
+        raw = pd.DataFrame(make_records(3))
+        raw.loc[1, 'case_location'] = None
+        df = normalize_emt_records(raw)
+
+        self.assertEqual(list(df.columns), ['call_number', 'incident_number', 'date', 'year', 'month', 'day',
+                                            'hour', 'longitude', 'latitude'])
+        self.assertEqual(df['hour'].tolist(), [0, 7, 14])
+        self.assertEqual(df['date'].tolist(), [pd.Timestamp('2000-01-15')] * 3)
+        self.assertAlmostEqual(df.loc[2, 'longitude'], -122.3998)
+        self.assertTrue(pd.isna(df.loc[1, 'latitude']))
+
+    def test_normalize_parquet_round_trip(self):
+        out_dir = tempfile.mkdtemp()
+        try:
+            pd.DataFrame(make_records(5)).drop(columns='unit_type').to_parquet(f"{out_dir}/part-0.parquet")
+            df = normalize_emt_records(load_raw_emt_pages(out_dir))
+            self.assertEqual(df['latitude'].tolist(), [37.7] * 5)
+        finally:
+            shutil.rmtree(out_dir)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
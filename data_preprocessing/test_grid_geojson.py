@@ -0,0 +1,88 @@
+import json
+import unittest
+import numpy as np
+
+from grid import create_grid_axes, create_grid_geojson, create_grid_topojson, grid_shapes
+
+
+def loop_grid_geojson(lats, lons):
+    """The original per-cell loop, as the reference output."""
+    features = []
+    for i in range(len(lats) - 1):
+        for j in range(len(lons) - 1):
+            lat_start, lat_end = lats[i], lats[i + 1]
+            lon_start, lon_end = lons[j], lons[j + 1]
+            coordinates = [[[lon_start, lat_start], [lon_end, lat_start], [lon_end, lat_end],
+                            [lon_start, lat_end], [lon_start, lat_start]]]
+            features.append({'type': 'Feature', 'geometry': {'type': 'Polygon', 'coordinates': coordinates},
+                             'properties': {'cell_id': i * (len(lons) - 1) + (j + 1)}})
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+def decode_topojson(topology):
+    """Rings of every geometry in (lon, lat), the way topojson-client's feature() decodes them."""
+    scale, translate = topology['transform']['scale'], topology['transform']['translate']
+    arcs = []
+    for arc in topology['arcs']:
+        points = np.cumsum(arc, axis=0) * scale + translate
+        arcs.append(points.tolist())
+    decoded = {}
+    for geometry in topology['objects']['grid']['geometries']:
+        ring = []
+        for index in geometry['arcs'][0]:
+            points = arcs[index] if index >= 0 else arcs[~index][::-1]
+            ring.extend(points if not ring else points[1:])
+        decoded[geometry['properties']['cell_id']] = ring
+    return decoded
+
+
+class TestGridGeojson(unittest.TestCase):
+
+    def setUp(self):
+        self.lats, self.lons = create_grid_axes(37.7, 37.83, -122.52, -122.33, 7, 5)
+
+    def test_matches_loop(self):
+        """Identical to the per-cell loop, for a non-square grid."""
+        self.assertEqual(create_grid_geojson(self.lats, self.lons), loop_grid_geojson(self.lats, self.lons))
+
+    def test_precision(self):
+        compact = create_grid_geojson(self.lats, self.lons, precision=5)
+        full = create_grid_geojson(self.lats, self.lons)
+        np.testing.assert_allclose(compact['features'][12]['geometry']['coordinates'],
+                                   full['features'][12]['geometry']['coordinates'], atol=5e-6)
+        self.assertLess(len(json.dumps(compact)), len(json.dumps(full)))
+
+    def test_topojson_decodes_to_geojson_rings(self):
+        topology = create_grid_topojson(self.lats, self.lons)
+        # 6 lines of 7 horizontal edges, 8 lines of 5 vertical edges
+        self.assertEqual(len(topology['arcs']), 6 * 7 + 8 * 5)
+        decoded = decode_topojson(topology)
+        for feature in create_grid_geojson(self.lats, self.lons)['features']:
+            ring = decoded[feature['properties']['cell_id']]
+            np.testing.assert_allclose(ring, feature['geometry']['coordinates'][0], atol=1e-5)
+
+    def test_grid_shapes_memoized(self):
+        first = grid_shapes(self.lats, self.lons)
+        self.assertIs(grid_shapes(np.array(self.lats), self.lons), first)
+        self.assertIsNot(grid_shapes(self.lats, self.lons, precision=5), first)
+        topology = grid_shapes(self.lats, self.lons, 'topojson')
+        self.assertEqual(topology['type'], 'Topology')
+        # precision is GeoJSON's option, quantization TopoJSON's
+        self.assertIs(grid_shapes(self.lats, self.lons, 'topojson', precision=5), topology)
+        self.assertIs(grid_shapes(self.lats, self.lons, quantization=100), first)
+        self.assertIsNot(grid_shapes(self.lats, self.lons, 'topojson', quantization=100), topology)
+        with self.assertRaises(ValueError):
+            grid_shapes(self.lats, self.lons, 'svg')
+
+    def test_quantization_below_two(self):
+        """One position per axis would divide by zero."""
+        with self.assertRaises(ValueError):
+            create_grid_topojson(self.lats, self.lons, quantization=1)
+        with self.assertRaises(ValueError):
+            grid_shapes(self.lats, self.lons, 'topojson', quantization=1)
+        corners = create_grid_topojson(self.lats, self.lons, quantization=2)['arcs'][0]
+        self.assertEqual(corners, [[0, 0], [0, 0]])
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,57 @@
+import unittest
+import numpy as np
+
+from grid import create_grid_axes, old_create_grid_axes, which_grid_vectorized
+from grid_pyramid import GridPyramid
+
+
+class TestGridPyramid(unittest.TestCase):
+
+    def setUp(self):
+        self.lats, self.lons = create_grid_axes(38.0, 39.0, -122.0, -121.0, 8, 8)
+        self.pyramid = GridPyramid(self.lats, self.lons)
+
+    def test_levels_match_power_of_two_splits(self):
+        """An 8x8 grid coarsens to 4x4, 2x2 and 1x1, the same lines as old_create_grid_axes."""
+        self.assertEqual(len(self.pyramid), 4)
+        for level in range(4):
+            lats, lons = old_create_grid_axes(38.0, 39.0, -122.0, -121.0, 3 - level)
+            np.testing.assert_allclose(self.pyramid.axes(level)[0], lats)
+            np.testing.assert_allclose(self.pyramid.axes(level)[1], lons)
+
+    def test_aggregate_matches_reassigning_points(self):
+        """Summing counts up the pyramid equals counting the points on the coarse grid directly."""
+        rng = np.random.default_rng(0)
+        lat_in, lon_in = rng.uniform(38.0, 39.0, 1000), rng.uniform(-122.0, -121.0, 1000)
+        fine = np.bincount(which_grid_vectorized(self.lats, self.lons, lat_in, lon_in) - 1, minlength=64)
+        levels = self.pyramid.build(fine)
+        for level in range(len(self.pyramid)):
+            lats, lons = self.pyramid.axes(level)
+            direct = np.bincount(which_grid_vectorized(lats, lons, lat_in, lon_in) - 1,
+                                 minlength=self.pyramid.num_cells(level))
+            np.testing.assert_array_equal(levels[level], direct)
+            np.testing.assert_array_equal(self.pyramid.aggregate(fine, level), direct)
+            np.testing.assert_array_equal(
+                np.bincount(self.pyramid.parent_cells(level) - 1, weights=fine), direct)
+
+    def test_odd_grid_and_leading_axes(self):
+        lats, lons = create_grid_axes(38.0, 39.0, -122.0, -121.0, 5, 3)
+        pyramid = GridPyramid(lats, lons)
+        self.assertEqual([pyramid.shape(level) for level in range(len(pyramid))], [(3, 5), (2, 3), (1, 2), (1, 1)])
+        hours = np.ones((4, 15))
+        coarse = pyramid.aggregate(hours, 1)
+        self.assertEqual(coarse.shape, (4, 6))
+        np.testing.assert_array_equal(coarse[0], [4, 4, 2, 2, 2, 1])
+        self.assertEqual(len(pyramid.geojson(1)['features']), 6)
+
+    def test_level_selection(self):
+        self.assertEqual(self.pyramid.level_for_viewport(38.0, 39.0, -122.0, -121.0, max_cells=64), 0)
+        self.assertEqual(self.pyramid.level_for_viewport(38.0, 39.0, -122.0, -121.0, max_cells=16), 1)
+        # a quarter of the map fits 16 cells at full resolution
+        self.assertEqual(self.pyramid.level_for_viewport(38.0, 38.5, -122.0, -121.5, max_cells=16), 0)
+        self.assertLessEqual(self.pyramid.level_for_zoom(12), self.pyramid.level_for_zoom(6))
+        self.assertEqual(self.pyramid.level_for_zoom(1), 3)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,53 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from grid import create_grid_axes, which_grid, which_grid_vectorized, find_cells
+
+
+class TestWhichGridVectorized(unittest.TestCase):
+
+    def setUp(self):
+        """Same 4x4 grid as test_grid.py."""
+        self.lats, self.lons = create_grid_axes(38.0, 39.0, -122.0, -121.0, 4, 4)
+
+    def test_matches_which_grid(self):
+        """Random points and all boundary lines give the same IDs as which_grid."""
+        rng = np.random.default_rng(0)
+        lat_in = np.concatenate([rng.uniform(38.0, 39.0, 500), self.lats, self.lats])
+        lon_in = np.concatenate([rng.uniform(-122.0, -121.0, 500), self.lons, self.lons[::-1]])
+        expected = [which_grid(self.lats, self.lons, la, lo) for la, lo in zip(lat_in, lon_in)]
+        result = which_grid_vectorized(self.lats, self.lons, lat_in, lon_in)
+        np.testing.assert_array_equal(result, expected)
+
+    def test_reversed_axes(self):
+        lats_rev = list(reversed(self.lats))
+        lons_rev = list(reversed(self.lons))
+        result = which_grid_vectorized(lats_rev, lons_rev, [38.6], [-121.6])
+        self.assertEqual(result[0], 10)
+
+    def test_out_of_bounds_policies(self):
+        lat_in = [38.6, 37.0, np.nan]
+        lon_in = [-121.6, -121.5, -121.5]
+        with self.assertRaises(ValueError):
+            which_grid_vectorized(self.lats, self.lons, lat_in, lon_in)
+        np.testing.assert_array_equal(
+            which_grid_vectorized(self.lats, self.lons, lat_in, lon_in, out_of_bounds='mark'), [10, -1, -1])
+        # 37.0 is below the grid, so it is clipped into the bottom row (cell 3)
+        clipped = which_grid_vectorized(self.lats, self.lons, lat_in[:2], lon_in[:2], out_of_bounds='clip')
+        np.testing.assert_array_equal(clipped, [10, 3])
+        # NaN has no nearest edge cell, in either coordinate
+        clipped = which_grid_vectorized(self.lats, self.lons, [np.nan, 38.6, np.nan], [-121.5, np.nan, np.nan],
+                                        out_of_bounds='clip')
+        np.testing.assert_array_equal(clipped, [-1, -1, -1])
+        with self.assertRaises(ValueError):
+            which_grid_vectorized(self.lats, self.lons, lat_in, lon_in, out_of_bounds='ignore')
+
+    def test_find_cells_drops_out_of_bounds(self):
+        df = pd.DataFrame({'latitude': [38.1, 38.9, 40.0], 'longitude': [-121.9, -121.1, -121.5]})
+        df, lats, lons = find_cells(df, 4, 4, [38.0, -122.0], [39.0, -121.0])
+        self.assertEqual(df['cell'].tolist(), [1, 16])
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,62 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from match_weather_data import match_weather_data, nearest_station
+
+
+def reference_match(weather_data, emt_data):
+    """The old float-coordinate merge, with a brute force nearest station search."""
+    stations = weather_data[['latitude', 'longitude']].drop_duplicates().to_numpy()
+    nearest = stations[nearest_station(emt_data[['latitude', 'longitude']].to_numpy(), stations)]
+    emt_data = emt_data.assign(nearest_lat=nearest[:, 0], nearest_lon=nearest[:, 1])
+    merged = pd.merge(emt_data, weather_data, left_on=['nearest_lat', 'nearest_lon', 'date'],
+                      right_on=['latitude', 'longitude', 'date'], how='inner')
+    merged = merged.drop(columns=['latitude_y', 'longitude_y', 'nearest_lat', 'nearest_lon', 'date',
+                                  'year_y', 'month_y', 'day_y'])
+    return merged.rename(columns={'year_x': 'year', 'month_x': 'month', 'day_x': 'day',
+                                  'latitude_x': 'latitude', 'longitude_x': 'longitude'})
+
+
+class TestMatchWeatherData(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        days = pd.date_range('2004-01-01', '2004-03-31')
+        stations = [(37.7705, -122.4269), (37.61962, -122.36562)]
+        weather = []
+        for lat, lon in stations:
+            weather.append(pd.DataFrame({
+                'date': days, 'year': days.year, 'month': days.month, 'day': days.day,
+                'fmax': rng.uniform(50, 80, len(days)), 'fmin': rng.uniform(40, 50, len(days)),
+                'snow_in': np.where(rng.random(len(days)) < 0.3, None, '0.0'),
+                'latitude': lat, 'longitude': lon,
+            }))
+        # one station is missing a week of data
+        self.weather = pd.concat(weather, ignore_index=True)
+        self.weather = self.weather.drop(self.weather.index[100:107]).reset_index(drop=True)
+
+        n = 2000
+        dates = pd.Timestamp('2003-12-25') + pd.to_timedelta(rng.integers(0, 110, n), unit='D')
+        cells = rng.integers(0, 25, n)
+        self.emt = pd.DataFrame({
+            'cell': cells + 1, 'date': dates, 'year': dates.year, 'month': dates.month, 'day': dates.day,
+            'latitude': 37.60 + (cells // 5) * 0.05, 'longitude': -122.52 + (cells % 5) * 0.04,
+            'emergency_count': rng.integers(0, 3, n),
+        })
+
+    def test_matches_merge(self):
+        expected = reference_match(self.weather, self.emt).reset_index(drop=True)
+        result = match_weather_data(self.weather, self.emt).reset_index(drop=True)
+        self.assertEqual(list(result.columns), list(expected.columns))
+        pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+        self.assertLess(len(result), len(self.emt))
+
+    def test_missing_columns(self):
+        with self.assertRaises(ValueError):
+            match_weather_data(self.weather.drop(columns=['year']), self.emt)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
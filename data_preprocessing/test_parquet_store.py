@@ -0,0 +1,70 @@
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from parquet_store import (write_partitioned, read_dataset, open_dataset, build_filter,
+                           training_table_dir, write_grid_spec, read_grid_spec)
+from grid import create_grid_axes
+
+
+class TestParquetStore(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        n = 120
+        self.df = pd.DataFrame({
+            'call_number': np.arange(n),
+            'year': np.repeat([2004, 2005, 2006], n // 3),
+            'month': np.tile([1, 2], n // 2),
+            'latitude': np.linspace(37.70, 37.80, n),
+            'longitude': np.linspace(-122.50, -122.40, n),
+        })
+        write_partitioned(self.df, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_round_trip(self):
+        df = read_dataset(self.path).sort_values('call_number').reset_index(drop=True)
+        pd.testing.assert_frame_equal(df[self.df.columns], self.df, check_dtype=False)
+
+    def test_year_filter_prunes_partitions(self):
+        dataset = open_dataset(self.path)
+        fragments = list(dataset.get_fragments(filter=build_filter(years=2005)))
+        self.assertEqual(len(fragments), 2)  # 2005 / month 1 and 2
+        self.assertTrue(all('year=2005' in f.path for f in fragments))
+
+        df = read_dataset(self.path, columns=['call_number', 'year'], years=(2005, 2006))
+        self.assertEqual(list(df.columns), ['call_number', 'year'])
+        self.assertEqual(sorted(df['year'].unique()), [2005, 2006])
+
+    def test_bbox_filter(self):
+        df = read_dataset(self.path, bbox=(37.70, -122.50, 37.75, -122.45))
+        expected = self.df[self.df['latitude'] <= 37.75]
+        self.assertEqual(sorted(df['call_number']), expected['call_number'].tolist())
+
+    def test_rewrite_replaces_partition(self):
+        update = self.df[(self.df['year'] == 2006) & (self.df['month'] == 1)].head(3)
+        write_partitioned(update, self.path)
+        df = read_dataset(self.path, years=2006)
+        self.assertEqual(len(df), 3 + len(self.df[(self.df['year'] == 2006) & (self.df['month'] == 2)]))
+
+    def test_grid_spec_next_to_table(self):
+        self.assertIsNone(read_grid_spec(self.path))
+        lats, lons = create_grid_axes(37.71, 37.79, -122.49, -122.41, 5, 3)
+        write_grid_spec(self.path, lats, lons)
+        spec = read_grid_spec(self.path)
+        self.assertEqual((spec['columns'], spec['rows'], spec['num_cells']), (5, 3, 15))
+        self.assertEqual((spec['min_in'], spec['max_in']), ([37.71, -122.49], [37.79, -122.41]))
+        # The spec file is not mistaken for a partition
+        self.assertEqual(len(read_dataset(self.path)), len(self.df))
+
+    def test_training_table_dir(self):
+        self.assertTrue(training_table_dir(50, 50, 'root').endswith('grid=50x50'))
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
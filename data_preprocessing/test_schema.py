@@ -0,0 +1,26 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from schema import TRAINING_SCHEMA, apply_schema
+
+
+class TestApplySchema(unittest.TestCase):
+
+    def test_casts_to_schema(self):
+        df = apply_schema(pd.DataFrame({'cell': [1, 65535], 'hour': ['3', '23'], 'fmax': [61.5, np.nan]}))
+        for col in df.columns:
+            self.assertEqual(df[col].dtype, TRAINING_SCHEMA[col], col)
+        self.assertEqual(df['cell'].tolist(), [1, 65535])
+
+    def test_out_of_range_raises(self):
+        """Values astype would wrap, like the -1 of out_of_bounds='mark' or a 70,000 cell grid."""
+        for cells in ([-1, 5], [1, 70000]):
+            with self.assertRaises(ValueError):
+                apply_schema(pd.DataFrame({'cell': cells}))
+        with self.assertRaises(ValueError):
+            apply_schema(pd.DataFrame({'hour': [0, 256]}))
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
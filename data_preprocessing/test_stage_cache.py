@@ -0,0 +1,56 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+import pandas as pd
+
+from stage_cache import StageCache, stage_key, fingerprint_path
+
+
+class TestStageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = StageCache(self.cache_dir)
+        self.calls = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def compute(self):
+        self.calls += 1
+        return pd.DataFrame({'cell': range(1000)}), {'lats': [1.0, 2.0]}
+
+    def test_hit_after_miss(self):
+        key = stage_key('cells', 'parent', grid_columns=50, grid_rows=50)
+        df, meta = self.cache.get_or_compute('cells', key, self.compute)
+        df_cached, meta_cached = self.cache.get_or_compute('cells', key, self.compute)
+        self.assertEqual(self.calls, 1)
+        pd.testing.assert_frame_equal(df, df_cached)
+        self.assertEqual(meta_cached, {'lats': [1.0, 2.0]})
+
+    def test_key_changes_with_params_and_inputs(self):
+        key = stage_key('cells', 'parent', grid_columns=50, grid_rows=50)
+        self.assertEqual(key, stage_key('cells', 'parent', grid_rows=50, grid_columns=50))
+        self.assertNotEqual(key, stage_key('cells', 'parent', grid_columns=40, grid_rows=50))
+        self.assertNotEqual(key, stage_key('cells', 'other parent', grid_columns=50, grid_rows=50))
+
+    def test_fingerprint_changes_when_file_changes(self):
+        path = Path(self.cache_dir) / 'weather.csv'
+        path.write_text('a,b\n1,2\n')
+        before = fingerprint_path(path)
+        path.write_text('a,b\n1,2\n3,4\n')
+        self.assertNotEqual(before, fingerprint_path(path))
+
+    def test_eviction_keeps_newest_entries(self):
+        self.cache.get_or_compute('a', 'k1', self.compute)
+        self.cache.max_bytes = self.cache.size() + 10
+        self.cache.get_or_compute('b', 'k2', self.compute)
+
+        remaining = sorted(p.name for p in Path(self.cache_dir).iterdir())
+        self.assertEqual(remaining, ['b-k2.json', 'b-k2.parquet'])
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
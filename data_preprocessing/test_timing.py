@@ -0,0 +1,83 @@
+import os
+import json
+import tempfile
+import threading
+import unittest
+import pandas as pd
+
+import timing
+from timing import Recorder, recording, span, count, timed
+from grid import create_grid_axes, create_grid_geojson
+
+
+class TestTiming(unittest.TestCase):
+
+    def tearDown(self):
+        timing.disable()
+
+    def test_disabled_records_nothing(self):
+        """Without an active recorder spans and counters are no-ops."""
+        self.assertIsNone(timing.active_recorder())
+        with span('stage') as first, span('other') as second:
+            count('calls')
+        self.assertIs(first, second)
+
+    def test_spans_and_counters(self):
+        recorder = Recorder()
+        with recording(recorder):
+            for _ in range(20):
+                with span('stage'):
+                    pass
+            count('calls', 3)
+            count('calls')
+            with self.assertRaises(KeyError):
+                with span('failing'):
+                    raise KeyError('missing day')
+        with span('stage'):
+            pass
+
+        summary = recorder.summary().set_index('span')
+        self.assertEqual(summary.loc['stage', 'count'], 20)
+        self.assertEqual(summary.loc['failing', 'count'], 1)
+        self.assertLessEqual(summary.loc['stage', 'p50_ms'], summary.loc['stage', 'p95_ms'])
+        self.assertLessEqual(summary.loc['stage', 'p95_ms'], summary.loc['stage', 'max_ms'])
+        self.assertEqual(recorder.counters, {'calls': 4})
+
+    def test_context_recorder_is_per_thread(self):
+        """A recording in one thread does not see another thread's spans; enable() catches the rest."""
+        recorder, process = Recorder(), timing.enable()
+
+        def other():
+            with span('other'):
+                pass
+
+        with recording(recorder):
+            worker = threading.Thread(target=other)
+            worker.start()
+            worker.join()
+            with span('mine'):
+                pass
+        self.assertEqual(set(recorder.spans), {'mine'})
+        self.assertEqual(set(process.spans), {'other'})
+
+    def test_instrumented_grid_and_export(self):
+        lats, lons = create_grid_axes(37.7, 37.83, -122.52, -122.33, 4, 4)
+        recorder = Recorder(window=2)
+        with recording(recorder):
+            for _ in range(3):
+                create_grid_geojson(lats, lons)
+            timed('decorated')(len)([1])
+        self.assertEqual(recorder.spans['grid.geojson'].count, 3)
+        # Percentiles come from the last `window` samples, counts and totals from all of them
+        self.assertEqual(len(recorder.spans['grid.geojson'].samples), 2)
+
+        with tempfile.TemporaryDirectory() as directory:
+            with open(recorder.export(os.path.join(directory, 'timings.json'))) as f:
+                exported = json.load(f)
+            self.assertEqual({row['span'] for row in exported['summary']}, {'grid.geojson', 'decorated'})
+            samples = pd.read_csv(recorder.export(os.path.join(directory, 'timings.csv')))
+            self.assertEqual(len(samples), 3)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,62 @@
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from weather_store import WeatherStore
+
+
+class TestWeatherStore(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        days = pd.date_range('2004-01-01', '2004-03-31')
+        frames = []
+        for _ in range(2):  # two stations
+            frames.append(pd.DataFrame({
+                'Date': days.strftime('%Y-%m-%d'),
+                'fmax': rng.uniform(50, 80, len(days)), 'fmin': rng.uniform(40, 50, len(days)),
+                'prcp_in': rng.uniform(0, 1, len(days)), 'snow_in': 0.0,
+            }))
+        self.weather = pd.concat(frames, ignore_index=True)
+        # 2004-02-10 .. 2004-02-12 are missing at both stations
+        self.weather = self.weather[~self.weather['Date'].between('2004-02-10', '2004-02-12')]
+        self.store = WeatherStore.from_frame(self.weather)
+
+    def test_matches_groupby_mean(self):
+        """Same values as the old groupby('date').mean() table, for an array of dates at once."""
+        expected = self.weather.groupby('Date').mean(numeric_only=True)
+        result = self.store.lookup(pd.to_datetime(expected.index))
+        self.assertEqual(result.dtype, np.float32)
+        np.testing.assert_allclose(result, expected[self.store.columns].to_numpy(), rtol=1e-6)
+
+    def test_fallback_policies(self):
+        dates = ['2004-02-09', '2004-02-11', '2004-02-12']
+        with self.assertRaises(KeyError):
+            self.store.lookup(dates)
+        self.assertTrue(np.isnan(self.store.lookup(dates, 'nan')[1:]).all())
+
+        nearest = self.store.lookup(dates, 'nearest')
+        np.testing.assert_array_equal(nearest[1], self.store.lookup('2004-02-09')[0])
+        np.testing.assert_array_equal(nearest[2], self.store.lookup('2004-02-13')[0])
+
+        # before the first day, the January mean
+        climatology = self.store.lookup(['2003-01-15'], 'climatology')[0]
+        january = self.store.lookup(pd.date_range('2004-01-01', '2004-01-31')).mean(axis=0)
+        np.testing.assert_allclose(climatology, january, rtol=1e-5)
+
+        with self.assertRaises(ValueError):
+            self.store.lookup(dates, 'zero')
+
+    def test_save_and_memory_map(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.store.save(directory)
+            loaded = WeatherStore.load(directory)
+            self.assertIsInstance(loaded.values, np.memmap)
+            dates = pd.date_range('2004-01-01', '2004-03-31')
+            np.testing.assert_array_equal(loaded.lookup(dates, 'nan'), self.store.lookup(dates, 'nan'))
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,205 @@
+"""
+Lightweight timing spans and counters.
+
+    from timing import span, count
+
+    with span('predict.model'):
+        predictions = booster.inplace_predict(X)
+    count('predict.cache_hit')
+
+Nothing is recorded unless a Recorder is active, either for the current
+context (a thread, or one Streamlit session's script run) with recording(),
+or for the whole process with enable(). Without one, span() returns a shared
+no-op context manager, so instrumented code pays about a context variable
+lookup per span.
+
+    recorder = Recorder()
+    with recording(recorder):
+        predictor.predict_range(start, end)
+    print(recorder.summary())
+    recorder.export('timings.json')
+"""
+import json
+import time
+from collections import deque
+from contextvars import ContextVar
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+
+# Samples kept per span name for the percentiles
+DEFAULT_WINDOW = 10000
+
+_context_recorder = ContextVar('timing_recorder', default=None)
+_process_recorder = None
+
+
+class Histogram:
+    """Count, total and maximum of every sample, and the most recent `window` samples for percentiles."""
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=window)
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.samples.append(value)
+
+    def percentiles(self, *qs) -> list:
+        if not self.samples:
+            return [float('nan')] * len(qs)
+        return np.percentile(np.fromiter(list(self.samples), dtype='float64'), qs).tolist()
+
+
+class Recorder:
+    """Span durations in milliseconds and counters, keyed by name."""
+
+    def __init__(self, window: int = DEFAULT_WINDOW):
+        self.window = window
+        self.spans = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def add(self, name: str, seconds: float):
+        histogram = self.spans.get(name)
+        if histogram is None:
+            histogram = self.spans.setdefault(name, Histogram(self.window))
+        histogram.add(seconds * 1000)
+
+    def count(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        self.spans = {}
+        self.counters = {}
+        self.started = time.time()
+
+    def summary(self) -> pd.DataFrame:
+        """One row per span: count, total_ms, mean_ms, p50_ms, p95_ms, max_ms, slowest total first."""
+        rows = []
+        for name, histogram in list(self.spans.items()):
+            p50, p95 = histogram.percentiles(50, 95)
+            rows.append({'span': name, 'count': histogram.count, 'total_ms': histogram.total,
+                         'mean_ms': histogram.total / histogram.count, 'p50_ms': p50, 'p95_ms': p95,
+                         'max_ms': histogram.max})
+        columns = ['span', 'count', 'total_ms', 'mean_ms', 'p50_ms', 'p95_ms', 'max_ms']
+        return pd.DataFrame(rows, columns=columns).sort_values('total_ms', ascending=False, ignore_index=True)
+
+    def samples(self) -> pd.DataFrame:
+        """The retained samples as (span, ms) rows, for offline analysis."""
+        frames = [pd.DataFrame({'span': name, 'ms': list(histogram.samples)})
+                  for name, histogram in list(self.spans.items())]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=['span', 'ms'])
+
+    def export(self, path: str) -> str:
+        """
+        Writes the recording to `path`: a .csv gets the raw samples, anything
+        else a JSON document with the summary, counters and samples.
+        """
+        if str(path).endswith('.csv'):
+            self.samples().to_csv(path, index=False)
+            return path
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        return path
+
+    def to_dict(self) -> dict:
+        return {
+            'started': self.started,
+            'exported': time.time(),
+            'summary': self.summary().to_dict(orient='records'),
+            'counters': dict(self.counters),
+            'samples': {name: list(histogram.samples) for name, histogram in list(self.spans.items())},
+        }
+
+
+class _Span:
+    __slots__ = ('name', 'recorder', 'began')
+
+    def __init__(self, name: str, recorder: Recorder):
+        self.name = name
+        self.recorder = recorder
+
+    def __enter__(self):
+        self.began = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder.add(self.name, time.perf_counter() - self.began)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def active_recorder():
+    """The context's recorder, else the process recorder, else None."""
+    return _context_recorder.get() or _process_recorder
+
+
+def span(name: str):
+    """Context manager that times its block into the active recorder, if any."""
+    recorder = _context_recorder.get() or _process_recorder
+    if recorder is None:
+        return _NO_SPAN
+    return _Span(name, recorder)
+
+
+def count(name: str, n: int = 1):
+    """Adds n to a counter of the active recorder, if any."""
+    recorder = _context_recorder.get() or _process_recorder
+    if recorder is not None:
+        recorder.count(name, n)
+
+
+def timed(name: str):
+    """Decorator form of span()."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class recording:
+    """Makes `recorder` the active recorder for the current context until the block exits."""
+
+    def __init__(self, recorder: Recorder):
+        self.recorder = recorder
+
+    def __enter__(self) -> Recorder:
+        self._token = _context_recorder.set(self.recorder)
+        return self.recorder
+
+    def __exit__(self, *exc):
+        _context_recorder.reset(self._token)
+        return False
+
+
+def enable(recorder: Recorder = None) -> Recorder:
+    """Records every span in the process, including worker threads, that has no context recorder."""
+    global _process_recorder
+    _process_recorder = recorder or Recorder()
+    return _process_recorder
+
+
+def disable():
+    global _process_recorder
+    _process_recorder = None
@@ -1,69 +1,113 @@
 import pandas as pd
 from pathlib import Path
 
-from weather_data import get_weather_data
+from weather_data import get_weather_data, DOWNTOWN_PATH, AIRPORT_PATH
 from match_weather_data import match_weather_data
 from add_non_emergency import add_non_emergency
 from grid import find_cells, grid_to_coords_vectorized
+from parquet_store import EMT_DATA_DIR, read_dataset, write_partitioned, write_grid_spec, training_table_dir
+from stage_cache import StageCache, stage_key, fingerprint_path
+from schema import TRAINING_SCHEMA, apply_schema, memory_report
 
 levels = 4
-RAW_EMT_DATA_PATH = '../data/2000_2006_subset_raw_emt_data.parquet'
+RAW_EMT_DATA_PATH = EMT_DATA_DIR
 grid_columns = 50
 grid_rows = 50
 total_cells = grid_columns * grid_rows
 
 
-def get_training_data():
-    if Path(RAW_EMT_DATA_PATH).exists():
-        emt_data = pd.read_parquet(RAW_EMT_DATA_PATH)
-    else:
+def get_training_data(years=None, bbox=None, grid_columns=grid_columns, grid_rows=grid_rows, use_cache=True,
+                      return_grid=False):
+    """
+    Args:
+        years (tuple): (first_year, last_year) to load, inclusive. Defaults to all.
+        bbox (tuple): (min_lat, min_lon, max_lat, max_lon). Calls outside it are
+            not loaded and it becomes the grid bounds. Defaults to the data bounds.
+        grid_columns, grid_rows (int): Grid resolution.
+        use_cache (bool): Reuse stage outputs from the stage cache. Each stage is
+            keyed on its inputs and parameters, so changing e.g. the grid size
+            only reruns the stages from find_cells onward.
+        return_grid (bool): Also return the grid's {'lats', 'lons'} boundary lines.
+    """
+    if not Path(RAW_EMT_DATA_PATH).exists():
         raise FileNotFoundError(f"Raw EMT data not found at {RAW_EMT_DATA_PATH}")
-    print("Raw EMT data loaded successfully.")
 
-    emt_data = emt_data.dropna(subset=['latitude', 'longitude'])
+    total_cells = grid_columns * grid_rows
+    cache = StageCache() if use_cache else None
 
-    emt_data, lats, lons = find_cells(emt_data, grid_columns, grid_rows)
-    print("Grid successfully.")
+    def run_stage(name, key, compute):
+        if cache is None:
+            result = compute()
+            return result if isinstance(result, tuple) else (result, None)
+        return cache.get_or_compute(name, key, compute)
 
-    emt_data = add_non_emergency(emt_data, total_cells)
-    print("Non-emergency data added successfully.")
+    # Keys only depend on the inputs, so a cached stage never has to run its parents
+    load_key = stage_key('load', fingerprint_path(RAW_EMT_DATA_PATH), years=years, bbox=bbox)
+    cells_key = stage_key('cells', load_key, grid_columns=grid_columns, grid_rows=grid_rows)
+    # The grid axes travel with the later stages' metadata, so the table's bounds are known from any of them
+    non_emergency_key = stage_key('non_emergency', cells_key, total_cells=total_cells, schema=TRAINING_SCHEMA,
+                                  axes=True)
+    training_key = stage_key('training', non_emergency_key, fingerprint_path(DOWNTOWN_PATH),
+                             fingerprint_path(AIRPORT_PATH), schema=TRAINING_SCHEMA, axes=True)
 
-    lat_series, lon_series = grid_to_coords_vectorized(emt_data['cell'], lats, lons)
+    def load():
+        emt_data = read_dataset(RAW_EMT_DATA_PATH, years=years, bbox=bbox)
+        print("Raw EMT data loaded successfully.")
+        return emt_data.dropna(subset=['latitude', 'longitude'])
 
-    # Assign the new columns in one go
-    emt_data['latitude'] = lat_series
-    emt_data['longitude'] = lon_series
-    print("Coordinates added successfully.")
+    def cells():
+        emt_data, _ = run_stage('load', load_key, load)
 
-    weather_data = get_weather_data()
-    print("Weather data loaded successfully.")
+        min_in, max_in = None, None
+        if bbox is not None:
+            min_in, max_in = [bbox[0], bbox[1]], [bbox[2], bbox[3]]
+        emt_data, lats, lons = find_cells(emt_data, grid_columns, grid_rows, min_in, max_in)
+        print("Grid successfully.")
+        return emt_data, {'lats': lats, 'lons': lons}
 
-    combined_df = match_weather_data(emt_data=emt_data, weather_data=weather_data)
-    print("Weather data matched successfully.")
+    def non_emergency():
+        emt_data, axes = run_stage('cells', cells_key, cells)
 
-    final_df = combined_df[
-        ['cell', 'year', 'month', 'day', 'hour', 'fmax', 'fmin', 'prcp_in', 'snow_in', 'emergency_count']].copy()
+        emt_data = add_non_emergency(emt_data, total_cells)
+        print("Non-emergency data added successfully.")
 
-    final_df['snow_in'] = final_df['snow_in'].fillna("0.0")
+        lat_series, lon_series = grid_to_coords_vectorized(emt_data['cell'], axes['lats'], axes['lons'])
 
-    final_df = final_df.dropna()
+        # Assign the new columns in one go
+        emt_data['latitude'] = lat_series
+        emt_data['longitude'] = lon_series
+        print("Coordinates added successfully.")
+        return emt_data, axes
 
-    dtype_map = {
-        'cell': 'int64',
-        'year': 'int64',
-        'month': 'int64',
-        'day': 'int64',
-        'hour': 'int64',
-        'fmax': 'float64',
-        'fmin': 'float64',
-        'prcp_in': 'float64',
-        'snow_in': 'float64',
-        'emergency_count': 'int64'
-    }
+    def training():
+        emt_data, axes = run_stage('non_emergency', non_emergency_key, non_emergency)
 
-    # Apply conversions safely
-    for col, dtype in dtype_map.items():
-        if col in final_df.columns:
-            final_df[col] = pd.to_numeric(final_df[col], errors='coerce').astype(dtype)
+        weather_data = get_weather_data()
+        print("Weather data loaded successfully.")
 
+        combined_df = match_weather_data(emt_data=emt_data, weather_data=weather_data)
+        print("Weather data matched successfully.")
+
+        final_df = combined_df[
+            ['cell', 'year', 'month', 'day', 'hour', 'fmax', 'fmin', 'prcp_in', 'snow_in', 'emergency_count']].copy()
+
+        final_df['snow_in'] = final_df['snow_in'].fillna(0.0)
+
+        final_df = final_df.dropna()
+
+        # Compact dtypes (uint16 cell, uint8 hour, float32 weather, ...), see schema.py
+        apply_schema(final_df)
+
+        return final_df, axes
+
+    final_df, axes = run_stage('training', training_key, training)
+    if return_grid:
+        return final_df, axes
     return final_df
+
+
+if __name__ == "__main__":
+    training_data, axes = get_training_data(return_grid=True)
+    print(memory_report(training_data))
+    write_partitioned(training_data, training_table_dir(grid_columns, grid_rows))
+    write_grid_spec(training_table_dir(grid_columns, grid_rows), axes['lats'], axes['lons'])
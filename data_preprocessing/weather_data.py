@@ -1,7 +1,7 @@
 import pandas as pd
 
-"../data/sanfranciscodowntown.csv"
-"../data/sanfranciscointernationalairport.csv"
+DOWNTOWN_PATH = "../data/sanfranciscodowntown.csv"
+AIRPORT_PATH = "../data/sanfranciscointernationalairport.csv"
 
 DOWNTOWN_COORD = [37.7705, -122.4269]
 AIRPORT_COORD = [37.61962, -122.36562]
@@ -55,10 +55,7 @@ def format_date_columns(weather_df: pd.DataFrame):
 
 
 def get_weather_data():
-    downtown_path = "../data/sanfranciscodowntown.csv"
-    airport_path = "../data/sanfranciscointernationalairport.csv"
-
-    weather_df = load_raw_weather_data(downtown_path, airport_path)
+    weather_df = load_raw_weather_data(DOWNTOWN_PATH, AIRPORT_PATH)
     weather_df = format_date_columns(weather_df)
 
     # select relevant columns
@@ -0,0 +1,174 @@
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+WEATHER_STORE_DIR = '../data/weather_store'
+WEATHER_COLUMNS = ['fmax', 'fmin', 'prcp_in', 'snow_in']
+FALLBACK_POLICIES = ('raise', 'nan', 'nearest', 'climatology')
+
+_META_FILE = 'meta.json'
+
+
+def day_ordinals(dates) -> np.ndarray:
+    """Days since 1970-01-01 for a date, datetime or array of either, as int64."""
+    if np.ndim(dates) == 0:
+        dates = [dates]
+    dates = np.asarray(pd.to_datetime(dates), dtype='datetime64[ns]')
+    return dates.astype('datetime64[D]').astype('int64')
+
+
+def weather_version(path: str) -> int:
+    """Modification time of a weather CSV or of a store's metadata, for cache keys."""
+    if os.path.isdir(path):
+        path = os.path.join(path, _META_FILE)
+    return os.stat(path).st_mtime_ns
+
+
+class WeatherStore:
+    """
+    Daily weather averaged over the stations, as one dense float32 array with
+    a row per day from first_day to the last day. Any day is found by integer
+    offset, so a whole array of dates is looked up with one indexing operation.
+    """
+
+    def __init__(self, first_day: int, values: np.ndarray, present: np.ndarray, columns=None):
+        """
+        Args:
+            first_day (int): Day ordinal (days since 1970-01-01) of row 0.
+            values (np.ndarray): (n_days, n_columns) float32 weather, NaN on missing days.
+            present (np.ndarray): (n_days,) bool, True where the day has a weather record.
+            columns (list): Names of the value columns.
+        """
+        self.first_day = int(first_day)
+        self.values = values
+        self.present = present
+        self.columns = list(columns or WEATHER_COLUMNS)
+
+        # Fallback tables are small (n_days ints and 12 rows), so they are built eagerly
+        idx = np.arange(len(present))
+        previous = np.maximum.accumulate(np.where(present, idx, -1))
+        following = np.minimum.accumulate(np.where(present, idx, len(present))[::-1])[::-1]
+        use_following = (previous < 0) | ((following < len(present)) & (following - idx < idx - previous))
+        self._nearest = np.where(use_following, following, previous)
+
+        months = pd.to_datetime((self.first_day + idx).astype('datetime64[D]')).month.to_numpy() - 1
+        self._climatology = np.full((12, len(self.columns)), np.nan, dtype='float32')
+        for month in range(12):
+            rows = values[present & (months == month)]
+            if len(rows):
+                self._climatology[month] = np.nanmean(rows, axis=0)
+
+    def __len__(self):
+        return len(self.present)
+
+    @property
+    def last_day(self) -> int:
+        return self.first_day + len(self) - 1
+
+    @classmethod
+    def from_frame(cls, weather_df: pd.DataFrame, columns=None):
+        """
+        Builds the store from a weather table with a 'Date' or 'date' column,
+        one row per station and day. Stations are averaged per day.
+        """
+        columns = list(columns or WEATHER_COLUMNS)
+        date_col = 'Date' if 'Date' in weather_df.columns else 'date'
+        ordinals = day_ordinals(weather_df[date_col])
+
+        values = weather_df[columns].apply(pd.to_numeric, errors='coerce')
+        daily = values.groupby(ordinals).mean()
+
+        first_day = int(daily.index.min())
+        n_days = int(daily.index.max()) - first_day + 1
+        rows = daily.index.to_numpy() - first_day
+
+        dense = np.full((n_days, len(columns)), np.nan, dtype='float32')
+        dense[rows] = daily.to_numpy(dtype='float32')
+        present = np.zeros(n_days, dtype=bool)
+        present[rows] = True
+        return cls(first_day, dense, present, columns)
+
+    @classmethod
+    def from_csv(cls, path: str, columns=None):
+        return cls.from_frame(pd.read_csv(path), columns)
+
+    def save(self, directory: str = WEATHER_STORE_DIR):
+        """Writes values.npy, present.npy and meta.json. The metadata goes last, so its mtime is the version."""
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        np.save(Path(directory) / 'values.npy', self.values)
+        np.save(Path(directory) / 'present.npy', self.present)
+        with open(Path(directory) / _META_FILE, 'w') as f:
+            json.dump({'first_day': self.first_day, 'columns': self.columns}, f)
+        return directory
+
+    @classmethod
+    def load(cls, directory: str = WEATHER_STORE_DIR, mmap: bool = True):
+        """Opens a saved store. With mmap the value array is paged in on demand instead of read."""
+        with open(Path(directory) / _META_FILE) as f:
+            meta = json.load(f)
+        values = np.load(Path(directory) / 'values.npy', mmap_mode='r' if mmap else None)
+        present = np.load(Path(directory) / 'present.npy')
+        return cls(meta['first_day'], values, present, meta['columns'])
+
+    @classmethod
+    def open(cls, path: str):
+        """A saved store directory, or a CSV that is converted on the fly."""
+        return cls.load(path) if os.path.isdir(path) else cls.from_csv(path)
+
+    def lookup(self, dates, fallback: str = 'raise') -> np.ndarray:
+        """
+        Weather for every date in `dates`.
+
+        Args:
+            dates: A date, datetime or array-like of them.
+            fallback (str): What to do for days without a weather record:
+                'raise' raises a KeyError listing them, 'nan' returns NaN rows
+                (XGBoost treats them as missing), 'nearest' uses the closest
+                day with a record, 'climatology' the mean of the same calendar
+                month over all years.
+
+        Returns:
+            np.ndarray: (len(dates), n_columns) float32 array.
+        """
+        if fallback not in FALLBACK_POLICIES:
+            raise ValueError(f"fallback must be one of {FALLBACK_POLICIES}, got '{fallback}'")
+
+        ordinals = day_ordinals(dates)
+        rows = ordinals - self.first_day
+        in_range = (rows >= 0) & (rows < len(self))
+        clipped = np.clip(rows, 0, len(self) - 1)
+        found = in_range & self.present[clipped]
+
+        if found.all():
+            return np.asarray(self.values[rows], dtype='float32')
+
+        if fallback == 'raise':
+            missing = np.unique(ordinals[~found]).astype('datetime64[D]')
+            raise KeyError(f"No weather data for {len(missing)} day(s): {[str(d) for d in missing[:10]]}")
+
+        result = np.asarray(self.values[clipped], dtype='float32').copy()
+        if fallback == 'nan':
+            result[~found] = np.nan
+        elif fallback == 'nearest':
+            result[~found] = self.values[self._nearest[clipped[~found]]]
+        else:
+            months = pd.to_datetime(ordinals[~found].astype('datetime64[D]')).month.to_numpy() - 1
+            result[~found] = self._climatology[months]
+        return result
+
+    def to_frame(self) -> pd.DataFrame:
+        """The days with a record as a frame indexed by date, like the old daily_weather table."""
+        days = (self.first_day + np.flatnonzero(self.present)).astype('datetime64[D]')
+        return pd.DataFrame(np.asarray(self.values)[self.present], index=pd.DatetimeIndex(days, name='date'),
+                            columns=self.columns)
+
+
+if __name__ == "__main__":
+    from weather_data import get_weather_data
+
+    store = WeatherStore.from_frame(get_weather_data())
+    store.save(WEATHER_STORE_DIR)
+    print(f"Weather store: {len(store)} days ({store.present.sum()} with records) saved to {WEATHER_STORE_DIR}")
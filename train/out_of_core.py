@@ -0,0 +1,188 @@
+import sys
+import resource
+import argparse
+import multiprocessing
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import xgboost as xgb
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'data_preprocessing'))
+from parquet_store import open_dataset, build_filter, read_dataset, training_table_dir  # noqa: E402
+from schema import FEATURES, TARGET  # noqa: E402
+
+TRAIN_YEARS = (2000, 2005)
+TEST_YEARS = (2006, 2006)
+BATCH_SIZE = 1_000_000
+
+DEFAULT_PARAMS = {
+    'objective': 'reg:squarederror',
+    'eval_metric': 'mae',
+    'tree_method': 'hist',
+    'learning_rate': 0.05,
+    'max_depth': 7,
+    'subsample': 0.8,
+    'colsample_bytree': 0.8,
+    'seed': 42,
+    'nthread': -1,
+}
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process so far, in MB (ru_maxrss is KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class ParquetBatchIter(xgb.DataIter):
+    """
+    Feeds a parquet training table to XGBoost one record batch at a time.
+    The year split is a scan filter, so the other years are never read, and
+    at most one batch is held in memory as a numpy array.
+    """
+
+    def __init__(self, path: str, years, batch_size: int = BATCH_SIZE, cache_prefix: str = None):
+        self.dataset = open_dataset(path)
+        self.filter = build_filter(years=years)
+        self.batch_size = batch_size
+        self._batches = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def reset(self):
+        self._batches = None
+
+    def next(self, input_data):
+        if self._batches is None:
+            self._batches = self.dataset.to_batches(
+                columns=FEATURES + [TARGET], filter=self.filter, batch_size=self.batch_size)
+
+        for batch in self._batches:
+            if batch.num_rows == 0:
+                continue
+            X = np.column_stack([batch.column(col).to_numpy().astype('float32') for col in FEATURES])
+            y = batch.column(TARGET).to_numpy().astype('float32')
+            input_data(data=X, label=y, feature_names=FEATURES)
+            return True
+        return False
+
+
+def build_dmatrix(path: str, years, max_bin: int = 256, ref=None, external_memory: bool = False,
+                  cache_dir: str = None):
+    """
+    Builds a quantized DMatrix from the parquet table without loading it into pandas.
+
+    Args:
+        path (str): Training table directory (see parquet_store.training_table_dir).
+        years (tuple): (first_year, last_year) to include.
+        max_bin (int): Histogram bins per feature.
+        ref: DMatrix whose quantile cuts to reuse (pass the training matrix for the eval set).
+        external_memory (bool): Keep the quantized pages on disk (ExtMemQuantileDMatrix)
+            instead of in memory (QuantileDMatrix).
+        cache_dir (str): Where external memory pages go. Defaults to the system temp dir.
+    """
+    if external_memory:
+        import tempfile
+        cache_dir = cache_dir or tempfile.mkdtemp(prefix='xgb-cache-')
+        data_iter = ParquetBatchIter(path, years, cache_prefix=str(Path(cache_dir) / f"{years[0]}_{years[1]}"))
+        return xgb.ExtMemQuantileDMatrix(data_iter, max_bin=max_bin, ref=ref)
+
+    return xgb.QuantileDMatrix(ParquetBatchIter(path, years), max_bin=max_bin, ref=ref)
+
+
+def train_out_of_core(path: str, params=None, num_boost_round: int = 1000, early_stopping_rounds: int = 50,
+                      train_years=TRAIN_YEARS, test_years=TEST_YEARS, external_memory: bool = False):
+    """
+    Trains on the parquet training table streamed batch by batch.
+
+    Returns:
+        xgb.Booster
+    """
+    params = {**DEFAULT_PARAMS, **(params or {})}
+    max_bin = params.pop('max_bin', 256)
+
+    dtrain = build_dmatrix(path, train_years, max_bin=max_bin, external_memory=external_memory)
+    dtest = build_dmatrix(path, test_years, max_bin=max_bin, ref=dtrain, external_memory=external_memory)
+    print(f"Built DMatrix: train {dtrain.num_row()} rows, test {dtest.num_row()} rows. "
+          f"Peak RSS {peak_rss_mb():.0f} MB")
+
+    return xgb.train(
+        {**params, 'max_bin': max_bin},
+        dtrain,
+        num_boost_round=num_boost_round,
+        evals=[(dtest, 'test')],
+        early_stopping_rounds=early_stopping_rounds,
+        verbose_eval=50
+    )
+
+
+def train_in_memory(path: str, params=None, num_boost_round: int = 1000, early_stopping_rounds: int = 50,
+                    train_years=TRAIN_YEARS, test_years=TEST_YEARS):
+    """The pandas path of test_training.py, with the native API, for comparison."""
+    params = {**DEFAULT_PARAMS, **(params or {})}
+
+    train_df = read_dataset(path, columns=FEATURES + [TARGET], years=train_years)
+    test_df = read_dataset(path, columns=FEATURES + [TARGET], years=test_years)
+    dtrain = xgb.DMatrix(train_df[FEATURES], label=train_df[TARGET])
+    dtest = xgb.DMatrix(test_df[FEATURES], label=test_df[TARGET])
+    print(f"Built DMatrix: train {dtrain.num_row()} rows, test {dtest.num_row()} rows. "
+          f"Peak RSS {peak_rss_mb():.0f} MB")
+
+    return xgb.train(
+        params,
+        dtrain,
+        num_boost_round=num_boost_round,
+        evals=[(dtest, 'test')],
+        early_stopping_rounds=early_stopping_rounds,
+        verbose_eval=50
+    )
+
+
+def _run_mode(mode, path, num_boost_round, queue):
+    start = datetime.now()
+    if mode == 'in_memory':
+        booster = train_in_memory(path, num_boost_round=num_boost_round)
+    else:
+        booster = train_out_of_core(path, num_boost_round=num_boost_round, external_memory=(mode == 'external'))
+    queue.put({
+        'mode': mode,
+        'seconds': (datetime.now() - start).total_seconds(),
+        'peak_rss_mb': peak_rss_mb(),
+        'best_score': booster.best_score,
+    })
+
+
+def compare_peak_memory(path: str, num_boost_round: int = 100, modes=('in_memory', 'quantile', 'external')):
+    """
+    Trains once per mode, each in a fresh process so ru_maxrss is not shared,
+    and prints peak RSS and time side by side.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for mode in modes:
+        queue = ctx.Queue()
+        process = ctx.Process(target=_run_mode, args=(mode, path, num_boost_round, queue))
+        process.start()
+        results.append(queue.get())
+        process.join()
+
+    print(f"\n{'mode':<10} {'peak RSS (MB)':>14} {'time (s)':>9} {'best MAE':>9}")
+    for r in results:
+        print(f"{r['mode']:<10} {r['peak_rss_mb']:>14.0f} {r['seconds']:>9.1f} {r['best_score']:>9.4f}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Out-of-core XGBoost training over the partitioned training table.")
+    parser.add_argument('--data', default=training_table_dir(32, 32))
+    parser.add_argument('--rounds', type=int, default=1000)
+    parser.add_argument('--external-memory', action='store_true')
+    parser.add_argument('--compare', action='store_true', help="Compare peak RSS against the in-memory path.")
+    parser.add_argument('--model-out', default='../model/emergency_prediction_model.json')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_peak_memory(args.data, num_boost_round=args.rounds)
+    else:
+        booster = train_out_of_core(args.data, num_boost_round=args.rounds, external_memory=args.external_memory)
+        booster.save_model(args.model_out)
+        print(f"Peak RSS {peak_rss_mb():.0f} MB. Model saved to {args.model_out}")
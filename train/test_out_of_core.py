@@ -0,0 +1,82 @@
+import io
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from out_of_core import ParquetBatchIter, build_dmatrix, train_in_memory, train_out_of_core
+from parquet_store import read_dataset, write_partitioned
+from schema import FEATURES, TARGET, apply_schema
+
+TRAIN_YEARS = (2004, 2005)
+TEST_YEARS = (2006, 2006)
+ROUNDS = 10
+
+
+def training_table(n: int = 6000, seed: int = 0) -> pd.DataFrame:
+    """A small training table of 16 cells over 2004-2006 whose counts depend on the cell, hour and weather."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'cell': rng.integers(1, 17, n),
+        'year': rng.integers(2004, 2007, n),
+        'month': rng.integers(1, 13, n),
+        'day': rng.integers(1, 29, n),
+        'hour': rng.integers(0, 24, n),
+        'fmax': rng.uniform(50, 90, n).round(0),
+        'fmin': rng.uniform(35, 50, n).round(0),
+        'prcp_in': rng.uniform(0, 1, n).round(2),
+        'snow_in': 0.0,
+    })
+    df[TARGET] = rng.poisson(0.5 + df['cell'] % 4 * 0.5 + (df['hour'] > 12) + (df['fmax'] > 75))
+    return apply_schema(df)
+
+
+class TestOutOfCore(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = f'{cls.directory.name}/training'
+        write_partitioned(training_table(), cls.path)
+        cls.test_df = read_dataset(cls.path, columns=FEATURES + [TARGET], years=TEST_YEARS)
+        with redirect_stdout(io.StringIO()):
+            cls.reference = train_in_memory(cls.path, num_boost_round=ROUNDS, train_years=TRAIN_YEARS,
+                                            test_years=TEST_YEARS)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def predict(self, booster):
+        return booster.predict(xgb.DMatrix(self.test_df[FEATURES]))
+
+    def test_batches_cover_the_years(self):
+        """Small batches of the year filter feed every train row, and only those, to the DMatrix."""
+        expected = read_dataset(self.path, columns=FEATURES + [TARGET], years=TRAIN_YEARS)
+        dmatrix = xgb.QuantileDMatrix(ParquetBatchIter(self.path, TRAIN_YEARS, batch_size=500))
+        self.assertEqual(dmatrix.num_row(), len(expected))
+        self.assertEqual(dmatrix.feature_names, FEATURES)
+        np.testing.assert_allclose(np.sort(dmatrix.get_label()), np.sort(expected[TARGET].to_numpy()))
+
+    def test_external_memory_dmatrix(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            dtrain = build_dmatrix(self.path, TRAIN_YEARS, external_memory=True, cache_dir=cache_dir)
+            dtest = build_dmatrix(self.path, TEST_YEARS, ref=dtrain, external_memory=True, cache_dir=cache_dir)
+            self.assertIsInstance(dtrain, xgb.ExtMemQuantileDMatrix)
+            self.assertEqual(dtest.num_row(), len(self.test_df))
+            del dtrain, dtest  # release the pages before their directory goes
+
+    def test_matches_in_memory(self):
+        """Both streamed modes train the same model as the pandas path, up to float rounding."""
+        for external_memory in (False, True):
+            with self.subTest(external_memory=external_memory), redirect_stdout(io.StringIO()):
+                booster = train_out_of_core(self.path, num_boost_round=ROUNDS, train_years=TRAIN_YEARS,
+                                            test_years=TEST_YEARS, external_memory=external_memory)
+                np.testing.assert_allclose(self.predict(booster), self.predict(self.reference), rtol=1e-4, atol=1e-4)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -1,133 +1,288 @@
-import pandas as pd
-import xgboost as xgb
+"""
+Trains the emergency count model.
+
+    python test_training.py --data ../data/training/grid=50x50 --train-years 2000 2005 --test-years 2006 2006 \
+        --max-bin 256 --nthread 8 --run-record ../model/runs/50x50.json
+
+Every run writes a JSON record with the configuration, per-phase timings
+(load, DMatrix build, per-round training, evaluation, save), throughput and
+metrics, so training cost can be compared across grid sizes and machines.
+"""
+import re
+import sys
+import json
+import time
+import argparse
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
 import joblib
+import numpy as np
+import xgboost as xgb
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
-from datetime import datetime
 
-# --- 1. Load and Prepare Data ---
-
-# Load your final dataset
-# This assumes the data is in the same directory. Update the path if needed.
-try:
-    df = pd.read_parquet('../data/2000_2006_32x32_training.parquet')
-except FileNotFoundError:
-    print("Error: Data file not found. Please update the path to your dataset.")
-    # Create a dummy dataframe based on your example to allow the script to run
-    df = pd.DataFrame({
-        'cell': [0, 1, 2, 3, 4],
-        'year': [2000] * 5,
-        'month': [4] * 5,
-        'day': [1] * 5,
-        'hour': [20, 21, 22, 23, 24],
-        'fmax': [73.0] * 5,
-        'fmin': [52.0] * 5,
-        'prcp_in': [0.26] * 5,
-        'snow_in': [0.0] * 5,
-        'emergency_count': [0, 1, 0, 0, 2]
-    })
-
-print("Data loaded successfully.")
-print(f"Dataset shape: {df.shape}")
-
-# Define features (X) and the target (y)
-# We drop non-feature columns. 'date_hour' is used for splitting but not for training.
-features = [
-    'cell', 'year', 'month', 'day', 'hour',
-    'fmax', 'fmin', 'prcp_in', 'snow_in'
-]
-target = 'emergency_count'
-
-X = df[features]
-y = df[target]
-
-
-# --- 2. Time-Based Data Splitting ---
-
-# CRITICAL: For time-series data, you must split by time, not randomly.
-# We will use 2000-2005 for training and 2006 for testing.
-
-train_df = df[df['year'] <= 2005]
-test_df = df[df['year'] == 2006]
-
-# Check if the test set is empty
-if test_df.empty:
-    raise ValueError("The test set is empty. Please ensure your data includes the year 2006.")
-
-# Separate features and target for train and test sets
-X_train = train_df[features]
-y_train = train_df[target]
-X_test = test_df[features]
-y_test = test_df[target]
-
-print(f"Training data shape: {X_train.shape}")
-print(f"Testing data shape: {X_test.shape}")
-print(f"Training on years: {sorted(train_df['year'].unique())}")
-print(f"Testing on year: {sorted(test_df['year'].unique())}")
-
-
-# --- 3. Train the XGBoost Regressor Model ---
-
-print("\nTraining XGBoost model...")
-start = datetime.now()
-
-# Initialize the XGBoost Regressor
-# These are good starting hyperparameters.
-# n_estimators: Number of boosting rounds (trees).
-# learning_rate: Step size shrinkage to prevent overfitting.
-# max_depth: Maximum depth of a tree.
-# subsample: Fraction of samples to be used for fitting each tree.
-# colsample_bytree: Fraction of features to be used for fitting each tree.
-# enable_categorical=True: Lets XGBoost handle the 'cell' column automatically.
-xgb_reg = xgb.XGBRegressor(
-    n_estimators=1000,
-    learning_rate=0.05,
-    max_depth=7,
-    subsample=0.8,
-    colsample_bytree=0.8,
-    random_state=42,
-    enable_categorical=True,  # Important for handling the 'cell' feature
-    n_jobs=-1,  # Use all available CPU cores,
-    early_stopping_rounds=50,  # Stop if MAE doesn't improve for 50 rounds
-    eval_metric='mae' # Mean Absolute Error
-)
-
-# Train the model with early stopping
-# Early stopping prevents overfitting by stopping training when the validation score stops improving.
-xgb_reg.fit(
-    X_train, y_train,
-    eval_set=[(X_test, y_test)],
-    verbose=True
-)
-
-print(f"Total training time: {(datetime.now() - start).total_seconds():.2f} seconds")
-print("\nModel training complete.")
-
-
-# --- 4. Evaluate the Model ---
-
-print("\nEvaluating model performance...")
-
-# Make predictions on the test set
-y_pred = xgb_reg.predict(X_test)
-
-# Calculate evaluation metrics
-mae = mean_absolute_error(y_test, y_pred)
-mse = mean_squared_error(y_test, y_pred)
-r2 = r2_score(y_test, y_pred)
-
-print(f"Mean Absolute Error (MAE): {mae:.4f}")
-print(f"Mean Squared Error (MSE): {mse:.4f}")
-print(f"R-squared (R²): {r2:.4f}")
-
-# Interpretation of metrics:
-# MAE: On average, the model's prediction is off by ~{mae:.2f} emergencies.
-# R²: The model explains ~{r2:.1%} of the variance in the emergency count.
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'data_preprocessing'))
+sys.path.append(str(Path(__file__).resolve().parent))
+from parquet_store import read_dataset, read_grid_spec, training_table_dir  # noqa: E402
+from schema import FEATURES, TARGET, apply_schema  # noqa: E402
+from out_of_core import DEFAULT_PARAMS, build_dmatrix, peak_rss_mb  # noqa: E402
+
+DEFAULT_DATA_PATH = training_table_dir(32, 32)
+DEFAULT_MODEL_PATH = '../model/emergency_prediction_model.ubj'
+DEFAULT_RUNS_DIR = '../model/runs'
+
+
+class RoundTimer(xgb.callback.TrainingCallback):
+    """Records the wall time of every boosting round."""
+
+    def __init__(self):
+        super().__init__()
+        self.round_seconds = []
+        self._start = None
+
+    def before_iteration(self, model, epoch, evals_log):
+        self._start = time.perf_counter()
+        return False
+
+    def after_iteration(self, model, epoch, evals_log):
+        self.round_seconds.append(time.perf_counter() - self._start)
+        return False
+
+
+class PhaseTimer:
+    """Collects named phase durations for the run record."""
+
+    def __init__(self):
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        print(f"\n[{name}] ...")
+        start = time.perf_counter()
+        yield
+        self.phases[name] = time.perf_counter() - start
+        print(f"[{name}] {self.phases[name]:.2f} s")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train the emergency count model.")
+    parser.add_argument('--data', default=DEFAULT_DATA_PATH, help="Training table (partitioned dir or parquet file).")
+    parser.add_argument('--train-years', type=int, nargs=2, default=[2000, 2005], metavar=('FIRST', 'LAST'))
+    parser.add_argument('--test-years', type=int, nargs=2, default=[2006, 2006], metavar=('FIRST', 'LAST'))
+    parser.add_argument('--out-of-core', action='store_true',
+                        help="Stream the table into a QuantileDMatrix instead of loading it into pandas (hist only).")
+    parser.add_argument('--tree-method', default='hist', choices=['hist', 'approx', 'exact'])
+    parser.add_argument('--max-bin', type=int, default=256)
+    parser.add_argument('--nthread', type=int, default=-1)
+    parser.add_argument('--rounds', type=int, default=1000)
+    parser.add_argument('--early-stopping', type=int, default=50, help="Rounds without improvement before stopping.")
+    parser.add_argument('--learning-rate', type=float, default=0.05)
+    parser.add_argument('--max-depth', type=int, default=7)
+    parser.add_argument('--model-out', default=DEFAULT_MODEL_PATH)
+    parser.add_argument('--run-record', default=None, help="JSON run record path. Defaults to ../model/runs/<time>.json")
+    args = parser.parse_args(argv)
+    if args.out_of_core and args.tree_method != 'hist':
+        # build_dmatrix makes a QuantileDMatrix, which XGBoost only trains with hist
+        parser.error(f"--out-of-core needs --tree-method hist, got '{args.tree_method}'.")
+    return args
+
+
+def load_split(data_path, train_years, test_years):
+    """Loads the train and test years as two frames, filtered at the parquet scan."""
+    columns = FEATURES + [TARGET]
+    train_df = apply_schema(read_dataset(data_path, columns=columns, years=tuple(train_years)))
+    test_df = apply_schema(read_dataset(data_path, columns=columns, years=tuple(test_years)))
+
+    if train_df.empty:
+        raise ValueError(f"The training set is empty. Please ensure {data_path} includes {train_years}.")
+    if test_df.empty:
+        raise ValueError(f"The test set is empty. Please ensure {data_path} includes {test_years}.")
+    return train_df, test_df
+
+
+def run_training(args):
+    """
+    Trains, evaluates and saves a model.
+
+    Returns:
+        tuple: (xgb.Booster, run record dict)
+    """
+    started_at = datetime.now().isoformat(timespec='seconds')
+    timer = PhaseTimer()
+    params = {
+        **DEFAULT_PARAMS,
+        'tree_method': args.tree_method,
+        'max_bin': args.max_bin,
+        'nthread': args.nthread,
+        'learning_rate': args.learning_rate,
+        'max_depth': args.max_depth,
+    }
+
+    if args.out_of_core:
+        # Loading and building are one streaming pass here, it all counts as 'dmatrix'
+        timer.phases['load'] = 0.0
+        with timer.phase('dmatrix'):
+            dtrain = build_dmatrix(args.data, args.train_years, max_bin=args.max_bin)
+            dtest = build_dmatrix(args.data, args.test_years, max_bin=args.max_bin, ref=dtrain)
+    else:
+        with timer.phase('load'):
+            train_df, test_df = load_split(args.data, args.train_years, args.test_years)
+        with timer.phase('dmatrix'):
+            if args.tree_method == 'hist':
+                dtrain = xgb.QuantileDMatrix(train_df[FEATURES], label=train_df[TARGET], max_bin=args.max_bin)
+                dtest = xgb.QuantileDMatrix(test_df[FEATURES], label=test_df[TARGET], ref=dtrain)
+            else:
+                dtrain = xgb.DMatrix(train_df[FEATURES], label=train_df[TARGET])
+                dtest = xgb.DMatrix(test_df[FEATURES], label=test_df[TARGET])
+        del train_df
+
+    print(f"Training rows: {dtrain.num_row()}, test rows: {dtest.num_row()}")
+
+    round_timer = RoundTimer()
+    with timer.phase('train'):
+        booster = xgb.train(
+            params,
+            dtrain,
+            num_boost_round=args.rounds,
+            evals=[(dtest, 'test')],
+            early_stopping_rounds=args.early_stopping,
+            callbacks=[round_timer],
+            verbose_eval=50
+        )
+
+    with timer.phase('eval'):
+        y_test = dtest.get_label()
+        y_pred = booster.predict(dtest, iteration_range=(0, booster.best_iteration + 1)).clip(0)
+        metrics = {
+            'mae': float(mean_absolute_error(y_test, y_pred)),
+            'mse': float(mean_squared_error(y_test, y_pred)),
+            'r2': float(r2_score(y_test, y_pred)),
+        }
+    print(f"Mean Absolute Error (MAE): {metrics['mae']:.4f}")
+    print(f"Mean Squared Error (MSE): {metrics['mse']:.4f}")
+    print(f"R-squared (R²): {metrics['r2']:.4f}")
+
+    with timer.phase('save'):
+        save_model(booster, args.model_out, model_metadata(booster, args))
+
+    round_seconds = np.array(round_timer.round_seconds)
+    record = {
+        'started_at': started_at,
+        'config': vars(args),
+        'params': params,
+        'train_rows': int(dtrain.num_row()),
+        'test_rows': int(dtest.num_row()),
+        'rounds': len(round_seconds),
+        'best_iteration': int(booster.best_iteration),
+        'phases_seconds': timer.phases,
+        'round_seconds': {
+            'mean': float(round_seconds.mean()),
+            'p50': float(np.percentile(round_seconds, 50)),
+            'max': float(round_seconds.max()),
+        },
+        # row-rounds per second is comparable across grid sizes and round counts
+        'train_row_rounds_per_second': float(dtrain.num_row() * len(round_seconds) / timer.phases['train']),
+        'peak_rss_mb': peak_rss_mb(),
+        'metrics': metrics,
+    }
+    return booster, record
+
+
+def grid_spec(data_path: str):
+    """
+    The grid the training table was built on: the spec training_data.py writes
+    next to the table, with its bounds, or else just the size read off a path
+    such as ../data/training/grid=50x50.
+    """
+    spec = read_grid_spec(data_path) if Path(data_path).is_dir() else None
+    if spec is not None:
+        return spec
+    match = re.search(r'grid=(\d+)x(\d+)', str(data_path))
+    if match is None:
+        return None
+    columns, rows = int(match.group(1)), int(match.group(2))
+    print(f"Warning: {data_path} has no grid spec, the model's grid bounds are unknown.")
+    return {'columns': columns, 'rows': rows, 'num_cells': columns * rows}
+
+
+def model_metadata(booster: xgb.Booster, args):
+    """What the predictor needs to know about a model besides its trees."""
+    return {
+        'features': list(FEATURES),
+        'target': TARGET,
+        'grid': grid_spec(args.data),
+        'train_years': list(args.train_years),
+        'test_years': list(args.test_years),
+        'best_iteration': int(booster.best_iteration),
+        'xgboost_version': xgb.__version__,
+        'trained_at': datetime.now().isoformat(timespec='seconds'),
+    }
+
+
+def metadata_path(model_path: str) -> Path:
+    """model.ubj -> model.meta.json"""
+    return Path(model_path).with_suffix('.meta.json')
+
+
+def save_model(booster: xgb.Booster, model_path: str, metadata=None):
+    """
+    Saves the booster. .ubj/.json paths get the native XGBoost format plus a
+    .meta.json sidecar, which is what EmergencyPredictor loads fastest.
+    .joblib paths still get the pickled sklearn XGBRegressor wrapper.
+    """
+    Path(model_path).parent.mkdir(parents=True, exist_ok=True)
+    if model_path.endswith('.joblib'):
+        regressor = xgb.XGBRegressor()
+        regressor.load_model(booster.save_raw('ubj'))
+        joblib.dump(regressor, model_path)
+    else:
+        booster.save_model(model_path)
+        if metadata is not None:
+            with open(metadata_path(model_path), 'w') as f:
+                json.dump(metadata, f, indent=2)
+    print(f"Model saved successfully to {model_path}")
+
+
+def export_joblib_model(joblib_path: str, model_path: str, metadata=None):
+    """
+    Converts a pickled XGBRegressor (the old .joblib artifact) to the native
+    format with a metadata sidecar. Without metadata, the feature order is
+    taken from the model and the grid/training window are left unknown.
+    """
+    booster = joblib.load(joblib_path).get_booster()
+    if metadata is None:
+        best_iteration = booster.attr('best_iteration')
+        metadata = {
+            'features': booster.feature_names or list(FEATURES),
+            'target': TARGET,
+            'grid': None,
+            'train_years': None,
+            'test_years': None,
+            'best_iteration': int(best_iteration) if best_iteration is not None else None,
+            'xgboost_version': xgb.__version__,
+            'trained_at': None,
+        }
+    save_model(booster, model_path, metadata)
+    return model_path
+
+
+def write_run_record(record, path=None):
+    if path is None:
+        path = Path(DEFAULT_RUNS_DIR) / f"{datetime.now().strftime('%Y%m%dT%H%M%S')}.json"
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(record, f, indent=2)
+    print(f"Run record written to {path}")
+    return path
 
 
-# --- 5. Save the Trained Model ---
+def main(argv=None):
+    args = parse_args(argv)
+    booster, record = run_training(args)
+    write_run_record(record, args.run_record)
+    return booster, record
 
-# Save the model to a file for later use (e.g., in your mapping script)
-model_filename = '../model/emergency_prediction_model.joblib'
-joblib.dump(xgb_reg, model_filename)
 
-print(f"\nModel saved successfully to {model_filename}")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+"""
+Scores every (hour, cell) of a historical period on a process pool and
+writes the predictions to a partitioned parquet store.
+
+    python backfill.py --start 2007-01-01 --end 2007-12-31 --workers 32 \
+        --model ../model/emergency_prediction_model.ubj --grid 32 32
+
+The features are built the way training_data.py builds them: each cell
+takes the weather of the station nearest to its corner on that day,
+missing snow counts as 0 and hours with other weather missing are skipped.
+The weather (station x day) and per-cell arrays are put in shared memory
+once; workers attach to them instead of receiving pickled copies, and each
+chunk of hours is scored and written by the worker that built it.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xgboost as xgb
+
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'data_preprocessing'))
+from grid import SF_MIN_IN, SF_MAX_IN, create_grid_axes, grid_to_coords_vectorized  # noqa: E402
+from match_weather_data import build_weather_array, nearest_station  # noqa: E402
+from parquet_store import PREDICTIONS_DATA_DIR  # noqa: E402
+from schema import FEATURES, TRAINING_SCHEMA  # noqa: E402
+from weather_store import WEATHER_COLUMNS  # noqa: E402
+
+CHUNK_HOURS = 24 * 7
+
+OUTPUT_SCHEMA = pa.schema([
+    ('cell', pa.uint16()),
+    ('day', pa.uint8()),
+    ('hour', pa.uint8()),
+    ('prediction', pa.float32()),
+])
+
+
+def build_feature_arrays(weather_data: pd.DataFrame, num_cols: int, num_rows: int, min_in=None, max_in=None):
+    """
+    The arrays every worker needs, independent of the hours being scored.
+
+    Args:
+        weather_data (pd.DataFrame): Daily weather per station, as returned by
+            weather_data.get_weather_data().
+        num_cols, num_rows (int): Grid size.
+        min_in, max_in (list): [lat, lon] corners of the grid.
+
+    Returns:
+        dict: 'cells' (n_cells,) 1-based IDs, 'cell_station' (n_cells,) index
+        of each cell's nearest station, 'weather' (n_stations, n_days, 4)
+        float32, 'present' (n_stations, n_days) bool and 'first_day' as a
+        (1,) int64 day ordinal.
+    """
+    min_in = min_in or SF_MIN_IN
+    max_in = max_in or SF_MAX_IN
+    lats, lons = create_grid_axes(min_in[0], max_in[0], min_in[1], max_in[1], num_cols, num_rows)
+
+    cells = np.arange(1, num_cols * num_rows + 1)
+    cell_lats, cell_lons = grid_to_coords_vectorized(cells, lats, lons)
+
+    weather_data = weather_data.copy()
+    for col in WEATHER_COLUMNS:
+        weather_data[col] = pd.to_numeric(weather_data[col], errors='coerce').astype('float32')
+    weather_data['snow_in'] = weather_data['snow_in'].fillna(0.0)
+    weather_array = build_weather_array(weather_data[['date', 'latitude', 'longitude'] + WEATHER_COLUMNS])
+
+    weather = np.stack([weather_array['values'][col] for col in WEATHER_COLUMNS], axis=-1)
+    # A day counts as present only if all the features the model needs are there
+    present = weather_array['present'] & ~np.isnan(weather).any(axis=-1)
+
+    return {
+        'cells': cells.astype(TRAINING_SCHEMA['cell']),
+        'cell_station': nearest_station(np.column_stack([cell_lats, cell_lons]), weather_array['stations']),
+        'weather': weather.astype('float32'),
+        'present': present,
+        'first_day': np.array([weather_array['first_day']], dtype='int64'),
+    }
+
+
+class SharedArrays:
+    """
+    Copies a dict of numpy arrays into shared memory blocks once. specs() is
+    what gets sent to the workers, attach() rebuilds the arrays there as
+    zero-copy views.
+    """
+
+    def __init__(self, arrays: dict):
+        self._blocks = {}
+        self._specs = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[...] = array
+            self._blocks[name] = block
+            self._specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def specs(self) -> dict:
+        return dict(self._specs)
+
+    @staticmethod
+    def attach(specs: dict):
+        """Returns (arrays, blocks). Keep the blocks referenced for as long as the arrays are used."""
+        arrays, blocks = {}, []
+        for name, (block_name, shape, dtype) in specs.items():
+            block = shared_memory.SharedMemory(name=block_name)
+            arrays[name] = np.ndarray(shape, np.dtype(dtype), buffer=block.buf)
+            blocks.append(block)
+        return arrays, blocks
+
+    def close(self):
+        for block in self._blocks.values():
+            block.close()
+            block.unlink()
+        self._blocks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def month_chunks(start, end, chunk_hours: int = CHUNK_HOURS):
+    """(first hour, n_hours) chunks covering [start, end], never crossing a month boundary."""
+    hours = pd.date_range(pd.Timestamp(start).floor('h'), pd.Timestamp(end).floor('h'), freq='h')
+    chunks = []
+    for _, month in pd.Series(hours).groupby([hours.year, hours.month]):
+        for i in range(0, len(month), chunk_hours):
+            part = month.iloc[i:i + chunk_hours]
+            chunks.append((part.iloc[0], len(part)))
+    return chunks
+
+
+# --- Worker process state, set once by _init_worker ---
+_worker = {}
+
+
+def _init_worker(specs: dict, model_path: str, features_order, out_dir: str, threads_per_worker: int):
+    arrays, blocks = SharedArrays.attach(specs)
+    booster = xgb.Booster(model_file=model_path)
+    # Parallelism comes from the process pool, one thread each avoids oversubscription
+    booster.set_param({'nthread': threads_per_worker})
+    best_iteration = booster.attr('best_iteration')
+    _worker.update(
+        arrays=arrays,
+        blocks=blocks,
+        booster=booster,
+        iteration_range=(0, int(best_iteration) + 1) if best_iteration is not None else (0, 0),
+        features_order=list(features_order),
+        out_dir=out_dir,
+    )
+
+
+def score_chunk(arrays: dict, booster: xgb.Booster, features_order, chunk_start, n_hours: int, iteration_range=(0, 0)):
+    """
+    Scores every cell for n_hours hours from chunk_start.
+
+    Returns:
+        pd.DataFrame: cell, day, hour and prediction for the (hour, cell)
+        pairs that have weather, hour-major.
+    """
+    times = pd.date_range(chunk_start, periods=n_hours, freq='h')
+    cells = arrays['cells']
+    stations = arrays['cell_station']
+
+    day_idx = times.to_numpy().astype('datetime64[D]').astype('int64') - arrays['first_day'][0]
+    in_range = (day_idx >= 0) & (day_idx < arrays['weather'].shape[1])
+    day_idx = np.clip(day_idx, 0, arrays['weather'].shape[1] - 1)
+
+    # (n_hours, n_cells) index into the station x day arrays
+    keep = arrays['present'][stations[None, :], day_idx[:, None]] & in_range[:, None]
+    weather = arrays['weather'][stations[None, :], day_idx[:, None]]
+
+    columns = {
+        'cell': np.broadcast_to(cells[None, :], keep.shape),
+        'year': np.broadcast_to(times.year.to_numpy()[:, None], keep.shape),
+        'month': np.broadcast_to(times.month.to_numpy()[:, None], keep.shape),
+        'day': np.broadcast_to(times.day.to_numpy()[:, None], keep.shape),
+        'hour': np.broadcast_to(times.hour.to_numpy()[:, None], keep.shape),
+    }
+    for i, col in enumerate(WEATHER_COLUMNS):
+        columns[col] = weather[:, :, i]
+
+    X = np.empty((int(keep.sum()), len(features_order)), dtype='float32')
+    for i, feature in enumerate(features_order):
+        X[:, i] = columns[feature][keep]
+
+    predictions = booster.inplace_predict(X, iteration_range=iteration_range) if len(X) else np.empty(0)
+    return pd.DataFrame({
+        'cell': columns['cell'][keep].astype(TRAINING_SCHEMA['cell']),
+        'day': columns['day'][keep].astype(TRAINING_SCHEMA['day']),
+        'hour': columns['hour'][keep].astype(TRAINING_SCHEMA['hour']),
+        'prediction': np.asarray(predictions, dtype='float32').clip(0),
+    })
+
+
+def _run_chunk(chunk):
+    chunk_start, n_hours = chunk
+    began = time.perf_counter()
+    df = score_chunk(_worker['arrays'], _worker['booster'], _worker['features_order'], chunk_start, n_hours,
+                     _worker['iteration_range'])
+
+    # Deterministic file names, so re-running a period overwrites its chunks
+    partition = Path(_worker['out_dir']) / f"year={chunk_start.year}" / f"month={chunk_start.month}"
+    partition.mkdir(parents=True, exist_ok=True)
+    path = partition / f"part-{chunk_start:%Y%m%d%H}.parquet"
+    pq.write_table(pa.Table.from_pandas(df, schema=OUTPUT_SCHEMA, preserve_index=False), path)
+    return {'start': chunk_start, 'hours': n_hours, 'rows': len(df), 'seconds': time.perf_counter() - began}
+
+
+def backfill(model_path: str, start, end, weather_data: pd.DataFrame = None, out_dir: str = PREDICTIONS_DATA_DIR,
+             num_cols: int = 32, num_rows: int = 32, min_in=None, max_in=None, workers: int = None,
+             chunk_hours: int = CHUNK_HOURS, threads_per_worker: int = 1):
+    """
+    Scores every hour from start to end (inclusive) for all cells.
+
+    Args:
+        model_path (str): Native XGBoost model (.ubj/.json). The feature order
+            comes from its .meta.json sidecar when there is one.
+        start, end: First and last hour.
+        weather_data (pd.DataFrame): Daily weather per station. Defaults to
+            weather_data.get_weather_data().
+        out_dir (str): Root of the prediction store (out_dir/year=/month=/part-*.parquet).
+        num_cols, num_rows (int): Grid size. min_in, max_in: grid corners.
+        workers (int): Processes. Defaults to os.cpu_count().
+        chunk_hours (int): Hours per task; chunks never cross months.
+        threads_per_worker (int): XGBoost threads in each worker.
+
+    Returns:
+        dict: hours, rows, seconds, rows_per_second and workers.
+    """
+    if weather_data is None:
+        from weather_data import get_weather_data
+        weather_data = get_weather_data()
+
+    features_order = FEATURES
+    sidecar = Path(model_path).with_suffix('.meta.json')
+    if sidecar.exists():
+        with open(sidecar) as f:
+            features_order = json.load(f).get('features') or FEATURES
+
+    workers = workers or os.cpu_count()
+    chunks = month_chunks(start, end, chunk_hours)
+    arrays = build_feature_arrays(weather_data, num_cols, num_rows, min_in, max_in)
+
+    print(f"Backfilling {sum(n for _, n in chunks)} hours x {len(arrays['cells'])} cells "
+          f"in {len(chunks)} chunks on {workers} workers...")
+    began = time.perf_counter()
+    rows = 0
+    with SharedArrays(arrays) as shared:
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(workers, initializer=_init_worker,
+                      initargs=(shared.specs(), model_path, features_order, out_dir, threads_per_worker)) as pool:
+            for done, result in enumerate(pool.imap_unordered(_run_chunk, chunks), start=1):
+                rows += result['rows']
+                if done % 10 == 0 or done == len(chunks):
+                    print(f"  {done}/{len(chunks)} chunks, {rows:,} rows")
+
+    seconds = time.perf_counter() - began
+    summary = {
+        'hours': sum(n for _, n in chunks),
+        'rows': rows,
+        'seconds': seconds,
+        'rows_per_second': rows / seconds,
+        'workers': workers,
+    }
+    print(f"Backfill done: {rows:,} predictions in {seconds:.1f}s "
+          f"({summary['rows_per_second']:,.0f} rows/s) written to {out_dir}")
+    return summary
+
+
+def measure_scaling(model_path: str, start, end, worker_counts=(1, 2, 4, 8, 16, 32), **kwargs):
+    """Runs the same backfill with each worker count and prints the speedup over one worker."""
+    results = [backfill(model_path, start, end, workers=n, **kwargs) for n in worker_counts]
+    base = results[0]['seconds']
+    print(f"\n{'workers':>7} {'seconds':>8} {'rows/s':>12} {'speedup':>8} {'efficiency':>10}")
+    for r in results:
+        speedup = base / r['seconds']
+        print(f"{r['workers']:>7} {r['seconds']:>8.1f} {r['rows_per_second']:>12,.0f} "
+              f"{speedup:>8.2f} {speedup * worker_counts[0] / r['workers']:>10.0%}")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Score historical hours into the partitioned prediction store.")
+    parser.add_argument('--model', default='../model/emergency_prediction_model.ubj')
+    parser.add_argument('--start', required=True, help="First hour, e.g. 2007-01-01")
+    parser.add_argument('--end', required=True, help="Last hour (inclusive), e.g. 2007-12-31T23:00")
+    parser.add_argument('--out', default=PREDICTIONS_DATA_DIR)
+    parser.add_argument('--grid', type=int, nargs=2, default=[32, 32], metavar=('COLUMNS', 'ROWS'))
+    parser.add_argument('--workers', type=int, default=None, help="Defaults to the number of CPUs.")
+    parser.add_argument('--chunk-hours', type=int, default=CHUNK_HOURS)
+    parser.add_argument('--scaling', type=int, nargs='+', default=None, metavar='WORKERS',
+                        help="Measure throughput for these worker counts instead of a single run.")
+    args = parser.parse_args()
+
+    options = dict(out_dir=args.out, num_cols=args.grid[0], num_rows=args.grid[1], chunk_hours=args.chunk_hours)
+    if args.scaling:
+        measure_scaling(args.model, args.start, args.end, worker_counts=args.scaling, **options)
+    else:
+        backfill(args.model, args.start, args.end, workers=args.workers, **options)
@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The modules in this folder and data_preprocessing import each other by plain module name
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+sys.path.insert(1, str(HERE.parent / 'data_preprocessing'))
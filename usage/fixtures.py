@@ -0,0 +1,66 @@
+"""
+A small synthetic model and weather store for the tests in this folder.
+
+The model is trained on a 4x4 grid. Its predictions depend on the cell, the
+hour, the weather and the year, so tests can tell those inputs apart. The
+weather covers 2004-2008 except MISSING_DAY.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from schema import FEATURES, TARGET
+from weather_store import WEATHER_COLUMNS, WeatherStore
+
+# Not the San Francisco bounds, so tests can tell the model's grid from the fallback
+GRID = {'columns': 4, 'rows': 4, 'num_cells': 16, 'min_in': [37.72, -122.50], 'max_in': [37.80, -122.38]}
+MISSING_DAY = '2007-07-20'
+
+
+def weather_frame(seed: int = 0) -> pd.DataFrame:
+    """Daily weather of one station downtown, 2004-2008 without MISSING_DAY, like weather_data.get_weather_data()."""
+    rng = np.random.default_rng(seed)
+    days = pd.date_range('2004-01-01', '2008-12-31')
+    days = days[days != pd.Timestamp(MISSING_DAY)]
+    return pd.DataFrame({
+        'date': days, 'latitude': 37.7705, 'longitude': -122.4269,
+        'fmax': rng.uniform(50, 90, len(days)), 'fmin': rng.uniform(35, 50, len(days)),
+        'prcp_in': rng.uniform(0, 1, len(days)) * (rng.random(len(days)) < 0.3), 'snow_in': 0.0,
+    })
+
+
+def make_weather_store(directory, seed: int = 0) -> str:
+    """Saves weather_frame(seed) as a weather store and returns its path."""
+    path = str(Path(directory) / 'weather_store')
+    WeatherStore.from_frame(weather_frame(seed), WEATHER_COLUMNS).save(path)
+    return path
+
+
+def make_model(directory, grid=GRID, rounds: int = 30, seed: int = 0) -> str:
+    """Trains a small XGBRegressor on synthetic rows, saves it as .ubj with a .meta.json sidecar."""
+    rng = np.random.default_rng(seed)
+    n = 20000
+    X = pd.DataFrame({
+        'cell': rng.integers(1, grid['num_cells'] + 1, n),
+        'year': rng.integers(2004, 2009, n),
+        'month': rng.integers(1, 13, n),
+        'day': rng.integers(1, 29, n),
+        'hour': rng.integers(0, 24, n),
+        'fmax': rng.uniform(50, 90, n),
+        'fmin': rng.uniform(35, 50, n),
+        'prcp_in': rng.uniform(0, 1, n),
+        'snow_in': np.zeros(n),
+    })[FEATURES]
+    y = (X['cell'] % 5 + 3 * np.sin(X['hour'] / 24 * 2 * np.pi) + (X['fmax'] - 70) / 10
+         + (X['year'] - 2004) * 0.5 + rng.normal(0, 0.1, n))
+
+    model = xgb.XGBRegressor(n_estimators=rounds, max_depth=4, learning_rate=0.3, random_state=seed)
+    model.fit(X.astype('float32'), y)
+    path = Path(directory) / 'model.ubj'
+    model.save_model(path)
+    with open(path.with_suffix('.meta.json'), 'w') as f:
+        json.dump({'features': list(FEATURES), 'target': TARGET, 'grid': dict(grid)}, f)
+    return str(path)
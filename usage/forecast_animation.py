@@ -0,0 +1,161 @@
+"""
+An animated forecast layer for folium maps that ships the grid once.
+
+The cell polygons are embedded a single time. Every hour after that is one
+byte per cell, a colour level from 0 to 255 stored as the difference from
+the previous hour and deflated, so a week of 2,500 cells costs far less
+than one extra copy of the geometry. The browser inflates the frames,
+recolours the cells on a canvas renderer and animates them with a slider
+and a play button, without a round trip to Python.
+
+    m = folium.Map(location=[37.76, -122.4], zoom_start=12)
+    ForecastAnimation(predictions, times, *predictor.grid_pyramid(2500).levels[0]).add_to(m)
+"""
+import json
+import zlib
+import base64
+
+import numpy as np
+import pandas as pd
+from branca.element import MacroElement
+from jinja2 import Template
+
+from heatmap_tiles import PALETTE, colorize
+from grid import grid_shapes
+
+# Colour levels per frame; level 0 is transparent
+FRAME_LEVELS = 256
+
+
+def encode_frames(predictions: np.ndarray, vmax: float) -> bytes:
+    """
+    Quantizes (hours, cells) predictions to uint8 colour levels, replaces
+    every hour after the first by its difference from the previous one
+    (wrapping modulo 256) and deflates the result. Neighbouring hours are
+    similar, so the differences compress far better than the levels.
+    """
+    levels = np.ceil(np.clip(np.nan_to_num(predictions) / max(vmax, 1e-9), 0, 1) * (FRAME_LEVELS - 1))
+    levels = levels.astype('uint8')
+    deltas = levels.copy()
+    deltas[1:] -= levels[:-1]
+    return zlib.compress(deltas.tobytes(), 9)
+
+
+def decode_frames(payload: bytes, num_cells: int) -> np.ndarray:
+    """The inverse of encode_frames, what the browser does: (hours, cells) uint8 levels."""
+    deltas = np.frombuffer(zlib.decompress(payload), dtype='uint8').reshape(-1, num_cells)
+    return np.cumsum(deltas, axis=0, dtype='uint8')
+
+
+def level_colors(palette=PALETTE) -> list:
+    """Hex colour of each of the FRAME_LEVELS levels, interpolated like heatmap_tiles.colorize."""
+    rgba = colorize(np.arange(FRAME_LEVELS, dtype='float32')[None, :], FRAME_LEVELS - 1, palette)[0]
+    return ['#%02x%02x%02x' % tuple(color[:3]) for color in rgba]
+
+
+class ForecastAnimation(MacroElement):
+    """
+    Args:
+        predictions (np.ndarray): (hours, cells) predictions, cells in cell_id order.
+        times: The hour of each row, for the label.
+        lats (list): Latitude boundary lines of the grid.
+        lons (list): Longitude boundary lines of the grid.
+        vmax (float): Colour scale maximum, defaults to the largest prediction.
+        precision (int): Decimal places of the embedded cell corners.
+        interval_ms (int): Time between frames while playing.
+    """
+
+    _template = Template("""
+{% macro script(this, kwargs) %}
+(function() {
+    var map = {{ this._parent.get_name() }};
+    var colors = {{ this.colors_json }};
+    var labels = {{ this.labels_json }};
+    var nCells = {{ this.num_cells }};
+
+    var layer = L.geoJSON({{ this.geometry_json }}, {
+        renderer: L.canvas(),
+        style: {weight: 0.2, color: '#555555', fillOpacity: 0, fillColor: colors[0]}
+    }).addTo(map);
+    var cells = new Array(nCells);
+    layer.eachLayer(function(cell) { cells[cell.feature.properties.cell_id - 1] = cell; });
+
+    var control = L.control({position: 'topright'});
+    control.onAdd = function() {
+        var div = L.DomUtil.create('div', 'leaflet-bar');
+        div.style.background = 'white';
+        div.style.padding = '6px';
+        div.innerHTML = '<button type="button" style="width:32px">&#9654;</button> ' +
+            '<input type="range" min="0" max="' + (labels.length - 1) + '" value="0" ' +
+            'style="width:240px;vertical-align:middle"> <span style="font:12px monospace"></span>';
+        L.DomEvent.disableClickPropagation(div);
+        return div;
+    };
+    control.addTo(map);
+    var container = control.getContainer();
+    var button = container.querySelector('button');
+    var slider = container.querySelector('input');
+    var label = container.querySelector('span');
+
+    var bytes = Uint8Array.from(atob('{{ this.frames }}'), function(c) { return c.charCodeAt(0); });
+    var stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'));
+    new Response(stream).arrayBuffer().then(function(buffer) {
+        // Every frame after the first holds deltas; Uint8Array arithmetic wraps like the encoder
+        var levels = new Uint8Array(buffer);
+        for (var i = nCells; i < levels.length; i++) {
+            levels[i] = levels[i] + levels[i - nCells];
+        }
+        var shown = new Int16Array(nCells).fill(-1);
+        function show(frame) {
+            var offset = frame * nCells;
+            for (var c = 0; c < nCells; c++) {
+                var level = levels[offset + c];
+                if (level !== shown[c]) {  // only cells whose colour changed are restyled
+                    cells[c].setStyle({fillColor: colors[level], fillOpacity: level ? 0.6 : 0});
+                    shown[c] = level;
+                }
+            }
+            slider.value = frame;
+            label.textContent = labels[frame];
+        }
+        var timer = null;
+        slider.addEventListener('input', function() { show(+slider.value); });
+        button.addEventListener('click', function() {
+            if (timer) {
+                clearInterval(timer);
+                timer = null;
+                button.innerHTML = '&#9654;';
+                return;
+            }
+            button.innerHTML = '&#10074;&#10074;';
+            timer = setInterval(function() { show((+slider.value + 1) % labels.length); }, {{ this.interval_ms }});
+        });
+        show(0);
+    });
+})();
+{% endmacro %}
+""")
+
+    def __init__(self, predictions: np.ndarray, times, lats, lons, vmax: float = None, precision: int = 5,
+                 interval_ms: int = 250):
+        super().__init__()
+        self._name = 'ForecastAnimation'
+        predictions = np.asarray(predictions)
+        self.num_cells = predictions.shape[1]
+        if self.num_cells != (len(lats) - 1) * (len(lons) - 1):
+            raise ValueError(f"{self.num_cells} predictions per hour do not match a "
+                             f"{len(lons) - 1}x{len(lats) - 1} grid")
+        vmax = float(predictions.max()) if vmax is None else vmax
+
+        # Pre-serialized, the template only pastes them in
+        separators = (',', ':')
+        self.geometry_json = json.dumps(grid_shapes(lats, lons, precision=precision), separators=separators)
+        self.frames = base64.b64encode(encode_frames(predictions, vmax)).decode('ascii')
+        self.colors_json = json.dumps(level_colors(), separators=separators)
+        self.labels_json = json.dumps([pd.Timestamp(t).strftime('%a %Y-%m-%d %H:00') for t in times],
+                                      separators=separators)
+        self.interval_ms = int(interval_ms)
+
+    def transfer_sizes(self) -> dict:
+        """Bytes of embedded geometry and frames, as sent to the browser."""
+        return {'geometry': len(self.geometry_json), 'frames': len(self.frames)}
@@ -0,0 +1,178 @@
+"""
+Pre-rendered raster heatmaps, one PNG per forecast hour.
+
+Each image has one pixel per grid cell, coloured with NumPy and written
+without any imaging library. The browser scales it up (pixelated) over the
+grid bounds, so drawing an hour costs the same whatever the cell count.
+
+    python heatmap_tiles.py --start 2007-07-15 --hours 48 --cells 2500
+
+writes ../data/heatmap_tiles/<model>_<columns>x<rows>/<YYYY-MM-DDTHH>.png
+plus a meta.json with the bounds and each hour's colour scale. Every image
+of a layer is drawn on the scale of its first render, so images rendered
+by different calls stay comparable.
+
+Leaflet stretches an overlay linearly in Web Mercator while the grid rows
+are linear in latitude. Over the height of San Francisco that shifts a row
+by well under a pixel.
+"""
+import json
+import zlib
+import struct
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from model_usage import EmergencyPredictor
+
+HEATMAP_TILES_DIR = '../data/heatmap_tiles'
+# YlOrRd, light to dark, the dashboard's palette
+PALETTE = ['#ffffcc', '#ffeda0', '#fed976', '#feb24c', '#fd8d3c', '#fc4e2a', '#e31a1c', '#bd0026', '#800026']
+
+_META_FILE = 'meta.json'
+
+
+def colorize(values: np.ndarray, vmax: float, palette=PALETTE, alpha: int = 255) -> np.ndarray:
+    """
+    Maps values in [0, vmax] onto the palette, interpolating between its
+    colours. Cells at or below zero, or NaN, are transparent.
+
+    Args:
+        values (np.ndarray): (n_lat_cells, n_lon_cells) array, row 0 the southernmost.
+        vmax (float): Value drawn with the last palette colour.
+        palette (list): Hex colours, low to high.
+        alpha (int): Opacity of the other cells, 0-255.
+
+    Returns:
+        np.ndarray: (n_lat_cells, n_lon_cells, 4) uint8 RGBA image, row 0 the northernmost.
+    """
+    stops = np.array([[int(color[i:i + 2], 16) for i in (1, 3, 5)] for color in palette], dtype='float32')
+    position = np.clip(np.nan_to_num(values) / max(vmax, 1e-9), 0, 1) * (len(stops) - 1)
+    lower = np.minimum(position.astype('int64'), len(stops) - 2)
+    fraction = (position - lower)[..., None]
+
+    rgba = np.empty(values.shape + (4,), dtype='uint8')
+    rgba[..., :3] = np.round(stops[lower] * (1 - fraction) + stops[lower + 1] * fraction)
+    rgba[..., 3] = np.where(np.nan_to_num(values) > 0, alpha, 0)
+    # Images are stored top row first
+    return rgba[::-1]
+
+
+def encode_png(rgba: np.ndarray) -> bytes:
+    """An 8-bit RGBA PNG of the image, built with zlib and struct."""
+    height, width = rgba.shape[:2]
+    # Every scanline starts with filter type 0 (none)
+    scanlines = np.concatenate([np.zeros((height, 1), dtype='uint8'), rgba.reshape(height, width * 4)], axis=1)
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+
+    return (b'\x89PNG\r\n\x1a\n'
+            + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(scanlines.tobytes(), 6))
+            + chunk(b'IEND', b''))
+
+
+def hour_name(hour) -> str:
+    return pd.Timestamp(hour).strftime('%Y-%m-%dT%H')
+
+
+class HeatmapTileCache:
+    """
+    A directory of per-hour heatmap PNGs, one subdirectory per model and
+    grid, so a retrained model or a different grid size never shows stale
+    images.
+    """
+
+    def __init__(self, directory: str = HEATMAP_TILES_DIR):
+        self.directory = Path(directory)
+
+    def layer_dir(self, predictor: EmergencyPredictor, num_cells: int) -> Path:
+        rows, columns = predictor.grid_pyramid(num_cells).shape(0)
+        return self.directory / f"{predictor.model_fingerprint[:12]}_{columns}x{rows}"
+
+    def meta(self, predictor: EmergencyPredictor, num_cells: int) -> dict:
+        """
+        bounds [[south, west], [north, east]], shape, the layer's colour scale
+        'layer_vmax' and {hour: vmax}, or {} before anything is rendered.
+        """
+        path = self.layer_dir(predictor, num_cells) / _META_FILE
+        if not path.exists():
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def hour_path(self, predictor: EmergencyPredictor, hour, num_cells: int):
+        """Path of an hour's PNG, or None if it has not been rendered."""
+        path = self.layer_dir(predictor, num_cells) / f"{hour_name(hour)}.png"
+        return path if path.exists() else None
+
+    def render(self, predictor: EmergencyPredictor, start, end, num_cells: int = 2500, vmax: float = None,
+               overwrite: bool = False) -> int:
+        """
+        Predicts every hour in [start, end] in one call and writes its PNG.
+
+        Args:
+            predictor (EmergencyPredictor): Model and weather to render.
+            start, end: First and last hour (inclusive).
+            num_cells (int): Grid size, must be a square or the model's grid.
+            vmax (float): Colour scale maximum. Defaults to the layer's scale,
+                which the first render sets to the largest prediction in its
+                range, so images from separate calls are comparable. Higher
+                predictions are drawn with the last palette colour.
+            overwrite (bool): Re-render hours that already have an image.
+
+        Returns:
+            int: Number of images written.
+        """
+        began = time.perf_counter()
+        layer_dir = self.layer_dir(predictor, num_cells)
+        layer_dir.mkdir(parents=True, exist_ok=True)
+        hours = pd.date_range(pd.Timestamp(start).floor('h'), pd.Timestamp(end).floor('h'), freq='h')
+        if not overwrite:
+            hours = hours[[not (layer_dir / f"{hour_name(hour)}.png").exists() for hour in hours]]
+        if len(hours) == 0:
+            return 0
+
+        pyramid = predictor.grid_pyramid(num_cells)
+        rows, columns = pyramid.shape(0)
+        predictions = predictor.predict_hours(hours, num_cells).reshape(len(hours), rows, columns)
+        meta = self.meta(predictor, num_cells)
+        if vmax is None:
+            vmax = meta.get('layer_vmax', float(predictions.max()))
+        meta.setdefault('layer_vmax', vmax)
+
+        for hour, values in zip(hours, predictions):
+            (layer_dir / f"{hour_name(hour)}.png").write_bytes(encode_png(colorize(values, vmax)))
+
+        lats, lons = pyramid.levels[0]
+        meta.update(bounds=[[float(lats[0]), float(lons[0])], [float(lats[-1]), float(lons[-1])]],
+                    shape=[rows, columns], model_fingerprint=predictor.model_fingerprint)
+        meta.setdefault('vmax', {}).update({hour_name(hour): vmax for hour in hours})
+        with open(layer_dir / _META_FILE, 'w') as f:
+            json.dump(meta, f)
+
+        print(f"Rendered {len(hours)} heatmap images of {columns}x{rows} cells to {layer_dir} "
+              f"in {time.perf_counter() - began:.2f}s")
+        return len(hours)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pre-render heatmap images for a range of forecast hours.")
+    parser.add_argument('--model', default='../model/emergency_prediction_model.ubj')
+    parser.add_argument('--weather', default='../data/weather_store')
+    parser.add_argument('--out', default=HEATMAP_TILES_DIR)
+    parser.add_argument('--start', required=True)
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--cells', type=int, default=2500)
+    parser.add_argument('--overwrite', action='store_true')
+    args = parser.parse_args()
+
+    predictor = EmergencyPredictor(args.model, args.weather, cache_size=0)
+    start = pd.Timestamp(args.start)
+    HeatmapTileCache(args.out).render(predictor, start, start + pd.Timedelta(hours=args.hours - 1),
+                                      num_cells=args.cells, overwrite=args.overwrite)
@@ -1,8 +1,115 @@
+import os
+import sys
+import json
+import time
+import math
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
-import joblib
+import xgboost as xgb
 from datetime import datetime
+from pathlib import Path
 from typing import Optional
 
+sys.path.append(str(Path(__file__).resolve().parent.parent / 'data_preprocessing'))
+from grid import SF_MIN_IN, SF_MAX_IN, create_grid_axes, grid_to_coords_vectorized  # noqa: E402
+from grid_pyramid import GridPyramid  # noqa: E402
+from schema import FEATURES, TRAINING_SCHEMA, apply_schema  # noqa: E402
+from weather_store import WeatherStore, weather_version  # noqa: E402
+from prediction_cube import PredictionCube  # noqa: E402
+from timing import span, count  # noqa: E402
+
+
+AGGREGATES = {'sum': np.add, 'max': np.maximum, 'mean': np.add}
+# Predictions held in memory at once by the range queries, in cell-hours
+QUERY_CHUNK_ROWS = 2_000_000
+# Grid size of models whose metadata has no grid
+DEFAULT_NUM_CELLS = 256
+
+
+def top_k_indices(values: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k largest values, largest first. np.argpartition finds
+    them in O(n), only those k are then sorted. Empty for k < 1.
+    """
+    values = np.asarray(values).ravel()
+    if k < 1:
+        return np.empty(0, dtype='int64')
+    if k >= len(values):
+        return np.argsort(values)[::-1]
+    top = np.argpartition(values, len(values) - k)[len(values) - k:]
+    return top[np.argsort(values[top])[::-1]]
+
+
+class PredictionCache:
+    """
+    Thread-safe LRU cache of per-hour prediction arrays with an optional TTL.
+    Keys are (model fingerprint, weather version, hour, num_cells).
+    """
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: Optional[float] = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if self.ttl_seconds is None or time.monotonic() - stored_at < self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and (
+                self.ttl_seconds is None or time.monotonic() - entry[0] < self.ttl_seconds)
+
+    def put(self, key, value):
+        # Stored arrays are shared between callers, so make them read-only
+        value.setflags(write=False)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+def replay_clock(start: datetime, speed: float = 1.0):
+    """A clock for start_warmer that starts at `start` and runs `speed` times as fast as real time."""
+    start = pd.Timestamp(start)
+    began = time.monotonic()
+    return lambda: start + pd.Timedelta(seconds=(time.monotonic() - began) * speed)
+
 
 class EmergencyPredictor:
     """
@@ -10,101 +117,637 @@ class EmergencyPredictor:
     the number of emergencies using historical weather data.
     """
 
-    def __init__(self, model_path: str, weather_data_path: str):
+    def __init__(self, model_path: str, weather_data_path: str, cache_size: int = 256,
+                 cache_ttl: Optional[float] = None, inference: str = 'native',
+                 weather_fallback: str = 'raise', cube_path: str = None, cube_method: str = 'linear'):
         """
-        Initializes the predictor by loading the model and historical weather data.
+        Initializes the predictor by loading the model. The historical weather
+        is loaded lazily, on the first prediction that needs it.
 
         Args:
-            model_path (str): The file path to the saved .joblib model.
-            weather_data_path (str): Path to the CSV file containing historical weather.
+            model_path (str): The saved model. Native XGBoost files (.ubj, .json)
+                load fastest and may have a .meta.json sidecar; .joblib files
+                (the pickled XGBRegressor) are still accepted.
+            weather_data_path (str): A weather store directory (see
+                data_preprocessing/weather_store.py), memory-mapped, or a CSV
+                file containing historical weather, converted on load.
+            cache_size (int): Number of (hour, num_cells) predictions kept in memory.
+                0 disables the cache.
+            cache_ttl (float): Seconds after which a cached prediction is recomputed.
+                None keeps entries until they are evicted or the weather is refreshed.
+            inference (str): 'native' scores a float32 numpy matrix with the raw
+                Booster's inplace_predict (no pandas, thread-safe on one shared
+                booster). 'sklearn' goes through the XGBRegressor wrapper with a
+                pandas frame, as before. 'cube' reads a precomputed
+                PredictionCube instead of evaluating any trees, except for
+                hours with a missing weather value, which the booster scores.
+            weather_fallback (str): Policy for days missing from the weather
+                history, see WeatherStore.lookup. 'raise' raises a KeyError.
+                'nan' cannot be combined with inference='cube'.
+            cube_path (str): Directory of a saved PredictionCube, for inference='cube'.
+                It must have been built from this model.
+            cube_method (str): 'linear' interpolates between weather bins,
+                'nearest' reads the closest bin.
         """
-        self.model = self._load_model(model_path)
-        self.daily_weather = self._load_and_prepare_weather(weather_data_path)
-        self.features_order = [
-            'cell', 'year', 'month', 'day', 'hour',
-            'fmax', 'fmin', 'prcp_in', 'snow_in'
-        ]
+        if inference not in ('native', 'sklearn', 'cube'):
+            raise ValueError(f"inference must be 'native', 'sklearn' or 'cube', got '{inference}'")
+        self.inference = inference
+        self.model_path = model_path
+        self.metadata = self._load_metadata(model_path)
+        with span('predictor.load_model'):
+            self.model = self._load_model(model_path)
+        self.booster = self.model if isinstance(self.model, xgb.Booster) else self.model.get_booster()
+        # The wrapper predicts with the best iteration when early stopping was used, so must we
+        best_iteration = self.booster.attr('best_iteration')
+        self.iteration_range = (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+        self.model_fingerprint = self._fingerprint(model_path)
+        self.features_order = list(self.metadata.get('features') or FEATURES)
+        self.grid = self.metadata.get('grid')
+        # What num_cells=None means in every method below
+        self.default_num_cells = (self.grid or {}).get('num_cells') or DEFAULT_NUM_CELLS
+
+        self.cube = None
+        self.cube_method = cube_method
+        if inference == 'cube':
+            if cube_path is None:
+                raise ValueError("inference='cube' needs a cube_path.")
+            if weather_fallback == 'nan':
+                raise ValueError("inference='cube' cannot serve missing weather, use another weather_fallback.")
+            self.cube = PredictionCube.load(cube_path)
+            if self.cube.model_fingerprint != self.model_fingerprint:
+                raise ValueError(f"The cube at {cube_path} was built from a different model.")
+
+        self.weather_data_path = weather_data_path
+        self.weather_version = weather_version(weather_data_path)
+        self.weather_fallback = weather_fallback
+        self._weather = None
+        self._weather_lock = threading.Lock()
+
+        self.cache = PredictionCache(cache_size, cache_ttl) if cache_size > 0 else None
+        self._warmer = None
+        self._warmer_stop = threading.Event()
+        self._pyramids = {}
+
+    @property
+    def weather(self) -> WeatherStore:
+        """Day-indexed weather store, opened from weather_data_path on first access."""
+        if self._weather is None:
+            with self._weather_lock:
+                if self._weather is None:
+                    with span('predictor.load_weather'):
+                        self._weather = self._load_and_prepare_weather(self.weather_data_path)
+        return self._weather
+
+    @staticmethod
+    def _load_metadata(model_path: str) -> dict:
+        """Reads the model.meta.json sidecar written by train/test_training.py, if there is one."""
+        sidecar = Path(model_path).with_suffix('.meta.json')
+        if not sidecar.exists():
+            return {}
+        with open(sidecar) as f:
+            return json.load(f)
+
+    @staticmethod
+    def _fingerprint(path: str) -> str:
+        """Content hash of the model file, so a retrained model never hits old cache entries."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        return digest.hexdigest()[:16]
 
     def _load_model(self, model_path: str):
         """Loads the saved XGBoost model from a file."""
         try:
             print(f"Loading model from {model_path}...")
-            model = joblib.load(model_path)
+            if model_path.endswith('.joblib'):
+                import joblib
+                model = joblib.load(model_path)
+            elif self.inference == 'sklearn':
+                model = xgb.XGBRegressor()
+                model.load_model(model_path)
+            else:
+                model = xgb.Booster(model_file=model_path)
             print("Model loaded successfully.")
             return model
-        except FileNotFoundError:
-            print(f"Error: Model file not found at '{model_path}'.")
+        except (FileNotFoundError, xgb.core.XGBoostError):
+            if not os.path.exists(model_path):
+                print(f"Error: Model file not found at '{model_path}'.")
             raise
 
-    def _load_and_prepare_weather(self, weather_path: str) -> pd.DataFrame:
-        """Loads and prepares weather data for quick lookups."""
+    def _load_and_prepare_weather(self, weather_path: str) -> WeatherStore:
+        """Opens the weather store, averaging the stations per day if it is a CSV."""
         print(f"Loading and preparing weather data from {weather_path}...")
-        weather_df = pd.read_csv(weather_path)
-        weather_df['date'] = pd.to_datetime(weather_df['Date']).dt.date
-
-        # We average the weather from all stations for each day
-        # This provides a single set of weather values for any given day
-        daily_avg_weather = weather_df.groupby('date').mean(numeric_only=True)
+        store = WeatherStore.open(weather_path)
         print("Weather data is ready.")
-        return daily_avg_weather
+        return store
 
-    def predict(self, target_datetime: datetime, num_cells: int = 256) -> pd.DataFrame:
+    def predict(self, target_datetime: datetime, num_cells: int = None) -> pd.DataFrame:
         """
         Makes a prediction for a specific date and time across all grid cells
         using historical weather data.
 
         Args:
             target_datetime (datetime): The date and time to generate a prediction for.
-            num_cells (int): The total number of grid cells in the map.
+            num_cells (int): The total number of grid cells in the map. Defaults to the model's grid.
 
         Returns:
             pd.DataFrame: A DataFrame containing 'cell_id' and 'prediction' columns.
         """
         if self.model is None:
             raise RuntimeError("Model is not loaded. Cannot make predictions.")
+        num_cells = num_cells or self.default_num_cells
+
+        key = self._cache_key(target_datetime, num_cells)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            count('predictor.cache_hit' if cached is not None else 'predictor.cache_miss')
+            if cached is not None:
+                cells = np.arange(1, num_cells + 1).astype(TRAINING_SCHEMA['cell'])
+                return pd.DataFrame({'cell_id': cells, 'prediction': cached})
 
         print(f"\nGenerating predictions for {target_datetime.strftime('%Y-%m-%d %H:%M:%S')}...")
 
         # --- 1. Look up the historical weather for the target day ---
-        target_date = target_datetime.date()
         try:
-            weather_for_day = self.daily_weather.loc[target_date]
+            with span('predictor.weather_lookup'):
+                weather = self.weather.lookup(target_datetime, self.weather_fallback)
         except KeyError:
-            print(f"Error: No historical weather data found for {target_date}.")
+            print(f"Error: No historical weather data found for {target_datetime.date()}.")
             raise
 
-        # --- 2. Create the model input DataFrame ---
-        df = pd.DataFrame({'cell': range(1, num_cells + 1)})
-        df['year'] = target_datetime.year
-        df['month'] = target_datetime.month
-        df['day'] = target_datetime.day
-        df['hour'] = target_datetime.hour
-
-        # Use the actual historical weather data
-        df['fmax'] = weather_for_day['fmax']
-        df['fmin'] = weather_for_day['fmin']
-        df['prcp_in'] = weather_for_day['prcp_in']
-        df['snow_in'] = weather_for_day['snow_in']
-
-        # --- 3. Predict and format results ---
-        predictions = self.model.predict(df[self.features_order])
-        predictions = predictions.clip(0)  # Ensure no negative predictions
+        # --- 2. Score all cells for this hour ---
+        predictions = self._score(pd.DatetimeIndex([target_datetime]), weather, num_cells)[0]
 
         result_df = pd.DataFrame({
-            'cell_id': df['cell'],
+            'cell_id': np.arange(1, num_cells + 1).astype(TRAINING_SCHEMA['cell']),
             'prediction': predictions
         })
 
+        if self.cache is not None:
+            self.cache.put(key, predictions.copy())
+
         print("Prediction complete.")
         return result_df
 
+    def _feature_matrix(self, times: pd.DatetimeIndex, weather: np.ndarray, num_cells: int) -> np.ndarray:
+        """
+        Builds the contiguous float32 model input for every (hour, cell) pair,
+        hour-major, with columns in features_order.
+
+        Args:
+            times (pd.DatetimeIndex): The hours to predict.
+            weather (np.ndarray): (len(times), n_columns) weather per hour, in the
+                column order of the weather store.
+            num_cells (int): The total number of grid cells in the map. Defaults to the model's grid.
+
+        Returns:
+            np.ndarray: float32 array of shape (len(times) * num_cells, n_features).
+        """
+        per_hour = {'year': times.year, 'month': times.month, 'day': times.day, 'hour': times.hour}
+        per_hour.update(zip(self.weather.columns, weather.T))
+        X = np.empty((len(times), num_cells, len(self.features_order)), dtype='float32')
+        for i, feature in enumerate(self.features_order):
+            if feature == 'cell':
+                X[:, :, i] = np.arange(1, num_cells + 1, dtype='float32')[None, :]
+            else:
+                X[:, :, i] = np.asarray(per_hour[feature], dtype='float32')[:, None]
+        return X.reshape(-1, len(self.features_order))
+
+    def _score(self, times: pd.DatetimeIndex, weather: np.ndarray, num_cells: int) -> np.ndarray:
+        """Runs the model and returns clipped float32 predictions of shape (len(times), num_cells)."""
+        if self.inference == 'cube':
+            if num_cells > self.cube.num_cells:
+                raise ValueError(f"The cube covers {self.cube.num_cells} cells, {num_cells} were requested.")
+            # The cube has no answer for missing weather, the trees' default branches do
+            missing = np.isnan(weather).any(axis=1)
+            if not missing.any():
+                with span('predictor.cube_lookup'):
+                    return self.cube.lookup(times, weather, self.cube_method)[:, :num_cells]
+            predictions = np.empty((len(times), num_cells), dtype='float32')
+            with span('predictor.cube_lookup'):
+                predictions[~missing] = self.cube.lookup(times[~missing], weather[~missing],
+                                                         self.cube_method)[:, :num_cells]
+            predictions[missing] = self._score_trees(times[missing], weather[missing], num_cells)
+            count('predictor.cube_fallback_hours', int(missing.sum()))
+            return predictions
+
+        return self._score_trees(times, weather, num_cells)
+
+    def _score_trees(self, times: pd.DatetimeIndex, weather: np.ndarray, num_cells: int) -> np.ndarray:
+        """_score with the booster, the sklearn wrapper for inference='sklearn'."""
+        with span('predictor.features'):
+            X = self._feature_matrix(times, weather, num_cells)
+
+        with span('predictor.model'):
+            if self.inference == 'sklearn':
+                df = apply_schema(pd.DataFrame(X, columns=self.features_order))
+                predictions = self.model.predict(df)
+            else:
+                predictions = self.booster.inplace_predict(X, iteration_range=self.iteration_range)
+        count('predictor.cells_scored', len(X))
+
+        predictions = np.asarray(predictions, dtype='float32').clip(0)  # Ensure no negative predictions
+        return predictions.reshape(len(times), num_cells)
+
+    def _cache_key(self, target_datetime: datetime, num_cells: int):
+        hour = pd.Timestamp(target_datetime).floor('h')
+        return self.model_fingerprint, self.weather_version, hour, num_cells
+
+    def refresh_weather(self) -> bool:
+        """
+        Marks the weather for reloading if the file changed on disk. Cached
+        predictions made with the old weather are dropped.
+
+        Returns:
+            bool: True if the weather changed.
+        """
+        version = weather_version(self.weather_data_path)
+        if version == self.weather_version:
+            return False
+        with self._weather_lock:
+            self._weather = None  # re-read on next use
+            self.weather_version = version
+        if self.cache is not None:
+            self.cache.clear()
+        return True
+
+    def warm(self, start: datetime, hours: int, num_cells: int = None) -> int:
+        """
+        Fills the cache for the `hours` hours from `start` that are not cached
+        yet, with one predict_range call.
+
+        Returns:
+            int: Number of hours computed.
+        """
+        if self.cache is None:
+            return 0
+        num_cells = num_cells or self.default_num_cells
+        start = pd.Timestamp(start).floor('h')
+        missing = [t for t in pd.date_range(start, periods=hours, freq='h')
+                   if self._cache_key(t, num_cells) not in self.cache]
+        if not missing:
+            return 0
+
+        predictions, times, _ = self.predict_range(missing[0], missing[-1], num_cells=num_cells)
+        missing = set(missing)
+        for i, t in enumerate(times):
+            if t in missing:
+                self.cache.put(self._cache_key(t, num_cells), predictions[i].copy())
+        return len(missing)
+
+    def start_warmer(self, hours_ahead: int = 24, num_cells: int = None, interval_seconds: float = 300,
+                     clock=None):
+        """
+        Starts a background thread that keeps the current hour and the next
+        `hours_ahead` hours in the cache, so "now" and "next hour" views are hits.
+        The warmer stops with a message once the clock runs past the weather.
+
+        Args:
+            hours_ahead (int): Hours after the current one to precompute.
+            num_cells (int): Grid size to precompute for. Defaults to the model's grid.
+            interval_seconds (float): Time between warming passes.
+            clock (callable): Returns the current datetime. Required: the weather
+                is historical, so datetime.now only works with a store that is
+                kept up to date; replay_clock(start) serves a historical period.
+        """
+        if self.cache is None:
+            raise RuntimeError("The prediction cache is disabled (cache_size=0).")
+        if clock is None:
+            raise ValueError("start_warmer needs a clock, e.g. replay_clock(start) for a historical period, "
+                             "or datetime.now if the weather store is kept current.")
+        self.stop_warmer()
+        self._warmer_stop.clear()
+
+        def run():
+            while not self._warmer_stop.is_set():
+                try:
+                    self.refresh_weather()
+                    self.warm(clock(), hours_ahead + 1, num_cells)
+                except KeyError as e:
+                    # Later passes would only ask for later days
+                    print(f"Cache warmer stopped, the clock is past the weather: {e}")
+                    return
+                except FileNotFoundError as e:
+                    print(f"Cache warmer skipped a pass: {e}")
+                self._warmer_stop.wait(interval_seconds)
+
+        self._warmer = threading.Thread(target=run, name='prediction-cache-warmer', daemon=True)
+        self._warmer.start()
+
+    def stop_warmer(self):
+        if self._warmer is not None:
+            self._warmer_stop.set()
+            self._warmer.join()
+            self._warmer = None
+
+    def cache_stats(self) -> dict:
+        """Hit/miss/eviction counters of the prediction cache."""
+        if self.cache is None:
+            return {}
+        return self.cache.stats()
+
+    def predict_range(self, start: datetime, end: datetime, freq: str = 'h', num_cells: int = None):
+        """
+        Predicts every hour in [start, end] for all grid cells with a single
+        model call, instead of one predict() call per hour.
+
+        Args:
+            start (datetime): First hour to predict.
+            end (datetime): Last hour to predict (inclusive).
+            freq (str): Step between predictions, as a pandas frequency string.
+            num_cells (int): The total number of grid cells in the map. Defaults to the model's grid.
+
+        Returns:
+            tuple: (predictions, times, cells) where predictions is a float32
+            array of shape (len(times), len(cells)), times is a DatetimeIndex
+            and cells is an array of the 1-based cell IDs.
+        """
+        num_cells = num_cells or self.default_num_cells
+        times = pd.date_range(start, end, freq=freq)
+        predictions = self.predict_hours(times, num_cells)
+        print(f"Predicted {len(times)} hours x {num_cells} cells.")
+        return predictions, times, np.arange(1, num_cells + 1)
+
+    def predict_hours(self, times, num_cells: int = None) -> np.ndarray:
+        """
+        Predicts an arbitrary set of hours (not necessarily contiguous) for all
+        grid cells with a single model call. The prediction service uses this
+        to score a micro-batch of unrelated requests at once.
+
+        Args:
+            times: Array-like of datetimes.
+            num_cells (int): The total number of grid cells in the map. Defaults to the model's grid.
+
+        Returns:
+            np.ndarray: float32 array of shape (len(times), num_cells).
+        """
+        if self.model is None:
+            raise RuntimeError("Model is not loaded. Cannot make predictions.")
+        num_cells = num_cells or self.default_num_cells
+        times = pd.DatetimeIndex(times)
+
+        # --- 1. Look up the weather of every hour in one indexing operation ---
+        try:
+            with span('predictor.weather_lookup'):
+                weather = self.weather.lookup(times, self.weather_fallback)
+        except KeyError as e:
+            print(f"Error: {e}")
+            raise
+
+        # --- 2. One model call for all hours ---
+        return self._score(times, weather, num_cells)
+
+    def _iter_range(self, start: datetime, end: datetime, freq: str, num_cells: int):
+        """Yields (times, predictions) over [start, end] in chunks of at most QUERY_CHUNK_ROWS cell-hours."""
+        if pd.Timestamp(start) > pd.Timestamp(end):
+            raise ValueError(f"start ({start}) is after end ({end}).")
+        times = pd.date_range(start, end, freq=freq)
+        chunk_hours = max(1, QUERY_CHUNK_ROWS // num_cells)
+        for i in range(0, len(times), chunk_hours):
+            chunk = times[i:i + chunk_hours]
+            yield chunk, self.predict_hours(chunk, num_cells)
+
+    def grid_axes(self, num_cells: int):
+        """
+        Latitude and longitude boundary lines of the grid with num_cells cells.
+        The model's grid spec is used when its size matches, any other size
+        is taken to be a square grid over the San Francisco bounds.
+        """
+        grid = self.grid or {}
+        if grid.get('num_cells') == num_cells:
+            columns, rows = grid['columns'], grid['rows']
+        else:
+            columns = rows = math.isqrt(num_cells)
+            if columns * rows != num_cells:
+                raise ValueError(f"Cannot infer the grid shape of {num_cells} cells; it is not a square.")
+        min_in, max_in = grid.get('min_in', SF_MIN_IN), grid.get('max_in', SF_MAX_IN)
+        return create_grid_axes(min_in[0], max_in[0], min_in[1], max_in[1], columns, rows)
+
+    def grid_pyramid(self, num_cells: int) -> GridPyramid:
+        """
+        The grid with num_cells cells and its 2x2-summed coarser levels, built
+        once per size. Aggregate predictions with pyramid.aggregate(predictions, level)
+        and draw them with pyramid.geojson(level).
+        """
+        if num_cells not in self._pyramids:
+            self._pyramids[num_cells] = GridPyramid(*self.grid_axes(num_cells))
+        return self._pyramids[num_cells]
+
+    def _with_coordinates(self, df: pd.DataFrame, num_cells: int) -> pd.DataFrame:
+        """Adds the latitude and longitude of each cell's centre, half a cell from grid_to_coords' corner."""
+        lats, lons = (np.asarray(axis, dtype='float64') for axis in self.grid_axes(num_cells))
+        cells = df['cell_id'].to_numpy(dtype='int64')
+        rows, columns = (cells - 1) // (len(lons) - 1), (cells - 1) % (len(lons) - 1)
+        df['latitude'], df['longitude'] = grid_to_coords_vectorized(cells, lats, lons)
+        df['latitude'] += np.diff(lats)[rows] / 2
+        df['longitude'] += np.diff(lons)[columns] / 2
+        return df
+
+    def hotspots(self, start: datetime, end: datetime, k: int = 20, num_cells: int = None,
+                 aggregate: Optional[str] = 'sum', freq: str = 'h') -> pd.DataFrame:
+        """
+        The k hottest cells over [start, end], e.g. "the 20 hottest cells over the next 6 hours".
+
+        Args:
+            start (datetime): First hour.
+            end (datetime): Last hour (inclusive).
+            k (int): Number of results, at least 1.
+            num_cells (int): The total number of grid cells in the map. Defaults to the model's grid.
+            aggregate (str): How each cell's hours are combined before ranking:
+                'sum' (expected calls over the range), 'mean' or 'max'. None
+                ranks individual (hour, cell) predictions instead.
+            freq (str): Step between hours, as a pandas frequency string.
+
+        Returns:
+            pd.DataFrame: rank, cell_id, prediction (the aggregate), latitude and
+            longitude of the cell's centre, plus 'time' when aggregate is None.
+            Hottest first.
+
+        Raises:
+            ValueError: If k < 1, start is after end or aggregate is unknown.
+        """
+        if aggregate is not None and aggregate not in AGGREGATES:
+            raise ValueError(f"aggregate must be one of {list(AGGREGATES)} or None, got '{aggregate}'")
+        if k < 1:
+            raise ValueError(f"k must be at least 1, got {k}")
+        num_cells = num_cells or self.default_num_cells
+
+        if aggregate is None:
+            # Keep the best k of each chunk plus the running best k, never the whole range
+            best_scores = np.empty(0, dtype='float32')
+            best_times = np.empty(0, dtype='datetime64[ns]')
+            best_cells = np.empty(0, dtype='int64')
+            for times, predictions in self._iter_range(start, end, freq, num_cells):
+                top = top_k_indices(predictions, k)
+                best_scores = np.concatenate([best_scores, predictions.ravel()[top]])
+                best_times = np.concatenate([best_times, times.to_numpy()[top // num_cells]])
+                best_cells = np.concatenate([best_cells, top % num_cells + 1])
+                keep = top_k_indices(best_scores, k)
+                best_scores, best_times, best_cells = best_scores[keep], best_times[keep], best_cells[keep]
+            df = pd.DataFrame({'time': best_times, 'cell_id': best_cells, 'prediction': best_scores})
+        else:
+            scores, n_hours = None, 0
+            for _, predictions in self._iter_range(start, end, freq, num_cells):
+                chunk = predictions.max(axis=0) if aggregate == 'max' else predictions.sum(axis=0, dtype='float64')
+                scores = chunk if scores is None else AGGREGATES[aggregate](scores, chunk)
+                n_hours += len(predictions)
+            if aggregate == 'mean':
+                scores = scores / n_hours
+            top = top_k_indices(scores, k)
+            df = pd.DataFrame({'cell_id': top + 1, 'prediction': scores[top].astype('float32')})
+
+        df.insert(0, 'rank', np.arange(1, len(df) + 1))
+        df['cell_id'] = df['cell_id'].astype(TRAINING_SCHEMA['cell'])
+        return self._with_coordinates(df, num_cells)
+
+    def cells_above(self, start: datetime, end: datetime, threshold: float, num_cells: int = None,
+                    aggregate: Optional[str] = None, freq: str = 'h') -> pd.DataFrame:
+        """
+        Every cell whose prediction is at least `threshold` in [start, end],
+        e.g. "all cells above 1.5 expected calls".
+
+        Args:
+            threshold (float): Minimum prediction (or aggregate) to report.
+            aggregate (str): None reports each (hour, cell) above the threshold;
+                'sum', 'mean' or 'max' compare each cell's aggregate over the range.
+            Other arguments as in hotspots.
+
+        Returns:
+            pd.DataFrame: cell_id, prediction, latitude and longitude of the cell's
+            centre (and 'time' when aggregate is None), ordered by time then
+            prediction, highest first. Empty when no cell reaches the threshold.
+
+        Raises:
+            ValueError: If start is after end.
+        """
+        num_cells = num_cells or self.default_num_cells
+        if aggregate is not None:
+            top = self.hotspots(start, end, k=num_cells, num_cells=num_cells, aggregate=aggregate, freq=freq)
+            return top[top['prediction'] >= threshold].drop(columns='rank').reset_index(drop=True)
+
+        frames = []
+        for times, predictions in self._iter_range(start, end, freq, num_cells):
+            hour_idx, cell_idx = np.nonzero(predictions >= threshold)
+            frames.append(pd.DataFrame({
+                'time': times.to_numpy()[hour_idx],
+                'cell_id': (cell_idx + 1).astype(TRAINING_SCHEMA['cell']),
+                'prediction': predictions[hour_idx, cell_idx],
+            }))
+        df = pd.concat(frames, ignore_index=True)
+        df = df.sort_values(['time', 'prediction'], ascending=[True, False], kind='stable', ignore_index=True)
+        return self._with_coordinates(df, num_cells)
+
+
+def benchmark_predict_range(predictor: EmergencyPredictor, start: datetime, hours: int = 24, num_cells: int = 256):
+    """
+    Compares predict_range against calling predict once per hour and prints
+    the throughput of both in cell-hours per second.
+    """
+    end = start + pd.Timedelta(hours=hours - 1)
+
+    begin = time.perf_counter()
+    looped = np.stack([
+        predictor.predict(t.to_pydatetime(), num_cells=num_cells)['prediction'].to_numpy()
+        for t in pd.date_range(start, end, freq='h')
+    ])
+    looped_seconds = time.perf_counter() - begin
+
+    begin = time.perf_counter()
+    batched, _, _ = predictor.predict_range(start, end, num_cells=num_cells)
+    batched_seconds = time.perf_counter() - begin
+
+    np.testing.assert_allclose(looped, batched, rtol=1e-5, atol=1e-6)
+    cell_hours = hours * num_cells
+    print(f"{hours} hours x {num_cells} cells: looped predict {looped_seconds:.3f}s "
+          f"({cell_hours / looped_seconds:,.0f} cell-hours/s), predict_range {batched_seconds:.3f}s "
+          f"({cell_hours / batched_seconds:,.0f} cell-hours/s), {looped_seconds / batched_seconds:.1f}x faster")
+    return looped_seconds, batched_seconds
+
+
+def benchmark_latency(model_path: str, weather_data_path: str, target_datetime: datetime,
+                      n_calls: int = 500, num_cells: int = 256, threads: int = 1, cube_path: str = None):
+    """
+    Measures uncached predict() latency for the native and sklearn inference
+    paths, and the cube if cube_path is given, and prints p50/p99 per call.
+    With threads > 1 the calls are issued concurrently against one shared
+    predictor (and so one shared booster).
+
+    Returns:
+        dict: {inference: (p50_ms, p99_ms)}
+    """
+    import io
+    from contextlib import redirect_stdout
+    from concurrent.futures import ThreadPoolExecutor
+
+    results = {}
+    for inference in ('sklearn', 'native') + (('cube',) if cube_path else ()):
+        predictor = EmergencyPredictor(model_path, weather_data_path, cache_size=0, inference=inference,
+                                       cube_path=cube_path)
+
+        def timed_call(_):
+            begin = time.perf_counter()
+            predictor.predict(target_datetime, num_cells=num_cells)
+            return time.perf_counter() - begin
+
+        with redirect_stdout(io.StringIO()):
+            timed_call(0)  # warm up
+            with ThreadPoolExecutor(max_workers=threads) as pool:
+                latencies = np.array(list(pool.map(timed_call, range(n_calls)))) * 1000
+
+        results[inference] = (float(np.percentile(latencies, 50)), float(np.percentile(latencies, 99)))
+        print(f"{inference:<8} {threads} thread(s), {num_cells} cells: "
+              f"p50 {results[inference][0]:.2f} ms, p99 {results[inference][1]:.2f} ms")
+    return results
+
+
+_COLD_START_SCRIPT = """
+import sys, json, time, contextlib
+begin = time.perf_counter()
+from datetime import datetime
+from model_usage import EmergencyPredictor
+imported = time.perf_counter()
+with contextlib.redirect_stdout(sys.stderr):
+    predictor = EmergencyPredictor(sys.argv[1], sys.argv[2], cache_size=0)
+    constructed = time.perf_counter()
+    predictor.predict(datetime.fromisoformat(sys.argv[3]))
+first = time.perf_counter()
+print(json.dumps({'import': imported - begin, 'construct': constructed - imported,
+                  'first_predict': first - constructed, 'total': first - begin}))
+"""
+
+
+def measure_cold_start(model_path: str, weather_data_path: str, target_datetime: datetime, runs: int = 5):
+    """
+    Starts a fresh interpreter `runs` times and measures the time to first
+    prediction: importing this module, constructing the predictor and the
+    first predict() call (which loads the weather). Prints the median of each.
+
+    Returns:
+        dict: Median seconds per phase.
+    """
+    import subprocess
+
+    samples = []
+    for _ in range(runs):
+        completed = subprocess.run(
+            [sys.executable, '-c', _COLD_START_SCRIPT, str(model_path), str(weather_data_path),
+             target_datetime.isoformat()],
+            cwd=Path(__file__).resolve().parent, capture_output=True, text=True, check=True)
+        samples.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    medians = {phase: float(np.median([s[phase] for s in samples])) for phase in samples[0]}
+    print(f"Cold start over {runs} runs ({Path(model_path).name}): " +
+          ", ".join(f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in medians.items()))
+    return medians
+
 
 # --- Example of How to Use the Class ---
 if __name__ == '__main__':
     # DEFINE YOUR FILE PATHS HERE
     # NOTE: You may need to create a single 'weather.csv' from your two files first
     # Or adjust the path to point to one of them, e.g., downtown.
-    MODEL_FILE = '../model/emergency_prediction_model.joblib'
+    MODEL_FILE = '../model/emergency_prediction_model.ubj'
     WEATHER_FILE = '../data/sanfranciscodowntown.csv'  # Using one file as an example
 
     try:
@@ -122,8 +765,13 @@ if __name__ == '__main__':
         print("\n--- Prediction Results ---")
         print(prediction_results.head())
 
-        print("\n--- Top 5 Hottest Cells ---")
-        print(prediction_results.sort_values('prediction', ascending=False).head())
+        print("\n--- Top 5 Hottest Cells, next 6 hours ---")
+        print(predictor.hotspots(prediction_time, prediction_time + pd.Timedelta(hours=5), k=5))
+
+        # 5. A 24-hour outlook in one call
+        outlook, hours, cells = predictor.predict_range(prediction_time, prediction_time + pd.Timedelta(hours=23))
+        print("\n--- Expected calls per hour, next 24 hours ---")
+        print(pd.Series(outlook.sum(axis=1), index=hours))
 
     except Exception as e:
         print(f"An error occurred during the prediction process: {e}")
\ No newline at end of file
@@ -0,0 +1,293 @@
+"""
+A precomputed "cube" of model outputs for latency-critical callers.
+
+The booster is evaluated once for every (month, hour, day node, weather
+bin, cell) on a quantized weather grid, for one model year. At inference
+time a prediction is an array lookup (nearest bin) or a multilinear
+interpolation between the surrounding weather bins, with no tree
+evaluation at all.
+
+Beyond the weather binning, the day of month is read at the nearest of a
+few day nodes (one, the 15th, by default), so any day-of-month effect the
+model learned is lost; error_report measures it ('day_node_mae'). Missing
+weather has no node, the model sends it down each split's default branch,
+so lookup refuses it and EmergencyPredictor scores those hours with the
+booster.
+
+A cube holds a single model year and refuses lookups in any other year.
+
+    cube = PredictionCube.build(predictor, year=2006)
+    cube.save('../model/cube')
+    print(cube.error_report(predictor))
+    EmergencyPredictor(model, weather, inference='cube', cube_path='../model/cube')
+"""
+import json
+import time
+from itertools import product
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CUBE_WEATHER_COLUMNS = ['fmax', 'fmin', 'prcp_in', 'snow_in']
+DEFAULT_BINS = {'fmax': 6, 'fmin': 6, 'prcp_in': 4, 'snow_in': 2}
+DEFAULT_DAYS = (15,)
+LOOKUP_METHODS = ('nearest', 'linear')
+
+
+def weather_nodes(values: np.ndarray, n_bins: int) -> np.ndarray:
+    """Grid points at evenly spaced quantiles of the observed values, duplicates removed."""
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return np.zeros(1, dtype='float32')
+    return np.unique(np.quantile(values, np.linspace(0, 1, n_bins)).astype('float32'))
+
+
+class PredictionCube:
+    """
+    Model outputs on a (month, hour, day node, fmax, fmin, prcp_in, snow_in, cell)
+    grid, stored as float16 with the cell axis last so one hour is a contiguous
+    row of all cells.
+    """
+
+    def __init__(self, values: np.ndarray, nodes: dict, days, year: int, model_fingerprint: str = None,
+                 error: dict = None):
+        # A plain ndarray view of a memmap, fancy indexing on the np.memmap subclass is much slower
+        self.values = np.asarray(values)
+        self.nodes = {col: np.asarray(nodes[col], dtype='float32') for col in CUBE_WEATHER_COLUMNS}
+        self.days = np.asarray(days, dtype='int64')
+        self.year = int(year)
+        self.model_fingerprint = model_fingerprint
+        # The last error_report, saved with the cube so users can see its error bound
+        self.error = error
+
+    @property
+    def num_cells(self) -> int:
+        return self.values.shape[-1]
+
+    @classmethod
+    def build(cls, predictor, year: int = None, num_cells: int = None, bins: dict = None, days=DEFAULT_DAYS):
+        """
+        Evaluates the predictor's booster over the whole grid, one month per model call.
+
+        Args:
+            predictor (EmergencyPredictor): Supplies the booster, feature order
+                and the weather history that the bins are fitted to.
+            year (int): Value of the 'year' feature. Defaults to the last test
+                year in the model metadata, else the last year with weather.
+            num_cells (int): Defaults to the model's grid, else 256.
+            bins (dict): Number of weather grid points per column.
+            days (tuple): Day-of-month nodes; lookups use the nearest one.
+                Defaults to the 15th only, see error_report's day_node_mae.
+        """
+        bins = {**DEFAULT_BINS, **(bins or {})}
+        weather = predictor.weather
+        observed = np.asarray(weather.values)[weather.present]
+        nodes = {col: weather_nodes(observed[:, weather.columns.index(col)], bins[col])
+                 for col in CUBE_WEATHER_COLUMNS}
+
+        if year is None:
+            test_years = predictor.metadata.get('test_years')
+            year = test_years[-1] if test_years else int(pd.Timestamp(weather.last_day, unit='D').year)
+        if num_cells is None:
+            num_cells = (predictor.grid or {}).get('num_cells', 256)
+
+        weather_shape = tuple(len(nodes[col]) for col in CUBE_WEATHER_COLUMNS)
+        values = np.empty((12, 24, len(days)) + weather_shape + (num_cells,), dtype='float16')
+
+        # Every (hour, day, weather, cell) combination of one month, in the cube's axis order
+        grids = np.meshgrid(np.arange(24), np.asarray(days), *[nodes[col] for col in CUBE_WEATHER_COLUMNS],
+                            np.arange(1, num_cells + 1), indexing='ij')
+        flat = {name: g.ravel().astype('float32')
+                for name, g in zip(['hour', 'day'] + CUBE_WEATHER_COLUMNS + ['cell'], grids)}
+        flat['year'] = np.full(len(flat['cell']), year, dtype='float32')
+
+        began = time.perf_counter()
+        X = np.empty((len(flat['cell']), len(predictor.features_order)), dtype='float32')
+        for month in range(1, 13):
+            flat['month'] = np.full(len(flat['cell']), month, dtype='float32')
+            for i, feature in enumerate(predictor.features_order):
+                X[:, i] = flat[feature]
+            predictions = predictor.booster.inplace_predict(X, iteration_range=predictor.iteration_range)
+            values[month - 1] = np.asarray(predictions).clip(0).reshape(values.shape[1:])
+        print(f"Built a {'x'.join(map(str, values.shape))} prediction cube "
+              f"({values.nbytes / 1e6:.1f} MB) in {time.perf_counter() - began:.1f}s")
+
+        return cls(values, nodes, days, year, predictor.model_fingerprint)
+
+    def save(self, directory: str):
+        """Writes values.npy and meta.json, like WeatherStore."""
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        np.save(Path(directory) / 'values.npy', self.values)
+        with open(Path(directory) / 'meta.json', 'w') as f:
+            json.dump({
+                'nodes': {col: self.nodes[col].tolist() for col in CUBE_WEATHER_COLUMNS},
+                'days': self.days.tolist(),
+                'year': self.year,
+                'model_fingerprint': self.model_fingerprint,
+                'error': self.error,
+            }, f, indent=2)
+        return directory
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True):
+        with open(Path(directory) / 'meta.json') as f:
+            meta = json.load(f)
+        values = np.load(Path(directory) / 'values.npy', mmap_mode='r' if mmap else None)
+        return cls(values, meta['nodes'], meta['days'], meta['year'], meta['model_fingerprint'], meta.get('error'))
+
+    def _axis(self, col: str, x: np.ndarray, method: str):
+        """Lower node index and interpolation weight of x along one weather axis."""
+        nodes = self.nodes[col]
+        if len(nodes) == 1:
+            return np.zeros(len(x), dtype='int64'), np.zeros(len(x), dtype='float32')
+        lower = np.clip(np.searchsorted(nodes, x, side='right') - 1, 0, len(nodes) - 2)
+        t = np.clip((x - nodes[lower]) / (nodes[lower + 1] - nodes[lower]), 0, 1).astype('float32')
+        if method == 'nearest':
+            return np.where(t < 0.5, lower, lower + 1), t
+        return lower, t
+
+    def lookup(self, times, weather: np.ndarray, method: str = 'linear') -> np.ndarray:
+        """
+        Predictions for every cell at each of `times`.
+
+        Args:
+            times: Array-like of datetimes, all in the cube's year.
+            weather (np.ndarray): (len(times), 4) fmax, fmin, prcp_in, snow_in,
+                without missing values.
+            method (str): 'nearest' reads one cube row per hour, 'linear'
+                interpolates between the (up to 2^4) surrounding weather bins.
+
+        Returns:
+            np.ndarray: float32 array of shape (len(times), num_cells).
+
+        Raises:
+            ValueError: If any of `times` is outside the cube's year, or any
+                weather value is missing.
+        """
+        if method not in LOOKUP_METHODS:
+            raise ValueError(f"method must be one of {LOOKUP_METHODS}, got '{method}'")
+        missing = np.isnan(weather).any(axis=1)
+        if missing.any():
+            raise ValueError(f"{int(missing.sum())} hour(s) have missing weather, the cube has no value for them.")
+
+        # Calendar fields with datetime64 arithmetic, pandas accessors cost more than the lookup
+        hours = np.asarray(times, dtype='datetime64[h]').reshape(-1)
+        years = hours.astype('datetime64[Y]').astype('int64') + 1970
+        if (years != self.year).any():
+            raise ValueError(f"The cube was built for {self.year}, "
+                             f"got times in {sorted(set(years.tolist()) - {self.year})}.")
+        days = hours.astype('datetime64[D]')
+        months = hours.astype('datetime64[M]')
+        month = months.astype('int64') % 12
+        hour = (hours - days).astype('int64')
+        day_of_month = (days - months.astype('datetime64[D]')).astype('int64') + 1
+        day = np.abs(day_of_month[:, None] - self.days[None, :]).argmin(axis=1)
+
+        axes = [self._axis(col, weather[:, i], method) for i, col in enumerate(CUBE_WEATHER_COLUMNS)]
+        if method == 'nearest':
+            return self.values[(month, hour, day) + tuple(idx for idx, _ in axes)].astype('float32')
+
+        # One gather of all corners, (n, n_corners, n_cells), then a weighted sum over the corners.
+        # Axes with a single node contribute no corners.
+        corners = np.array(list(product(*[(0, 1) if len(self.nodes[col]) > 1 else (0,)
+                                          for col in CUBE_WEATHER_COLUMNS])))
+        index = [month[:, None], hour[:, None], day[:, None]]
+        weight = np.ones((len(hours), len(corners)), dtype='float32')
+        for k, (lower, t) in enumerate(axes):
+            index.append(lower[:, None] + corners[None, :, k])
+            weight *= np.where(corners[None, :, k] == 1, t[:, None], 1 - t[:, None])
+        return np.einsum('nc,ncx->nx', weight, self.values[tuple(index)].astype('float32'))
+
+    def error_report(self, predictor, num_cells: int = None, method: str = 'linear'):
+        """
+        Compares the cube against the full model over every hour of the cube's
+        year that has weather, and prints the error bound.
+
+        Returns:
+            dict: mae, p99 and max absolute error, the mean model prediction
+            for scale, and the lookup and model time per hour. Also the share
+            of the error from reading the day of month at the nearest day node
+            (day_node_mae, the model at the node's day against the model), and
+            the number of hours left out because a weather value is missing
+            (missing_weather_hours), which inference='cube' sends to the booster.
+        """
+        year = self.year
+        num_cells = num_cells or self.num_cells
+        times = pd.date_range(f'{year}-01-01', f'{year}-12-31 23:00', freq='h')
+        times = times[predictor.weather.present[np.clip(
+            times.to_numpy().astype('datetime64[D]').astype('int64') - predictor.weather.first_day,
+            0, len(predictor.weather) - 1)]]
+        if len(times) == 0:
+            raise ValueError(f"No weather data in {year} to evaluate the cube on.")
+        weather = predictor.weather.lookup(times)
+        complete = ~np.isnan(weather).any(axis=1)
+        missing_weather_hours = int((~complete).sum())
+        times, weather = times[complete], weather[complete]
+        if len(times) == 0:
+            raise ValueError(f"No hour of {year} has complete weather to evaluate the cube on.")
+
+        began = time.perf_counter()
+        X = predictor._feature_matrix(times, weather, num_cells)
+        full = predictor.booster.inplace_predict(X, iteration_range=predictor.iteration_range)
+        full = np.asarray(full, dtype='float32').clip(0).reshape(len(times), num_cells)
+        model_seconds = time.perf_counter() - began
+
+        began = time.perf_counter()
+        approx = self.lookup(times, weather, method)[:, :num_cells]
+        cube_seconds = time.perf_counter() - began
+
+        error = np.abs(approx - full)
+
+        # The model with the day of month moved to the day node a lookup reads
+        day_of_month = times.day.to_numpy()
+        node_day = self.days[np.abs(day_of_month[:, None] - self.days[None, :]).argmin(axis=1)]
+        X[:, predictor.features_order.index('day')] = np.repeat(node_day, num_cells).astype('float32')
+        at_node = predictor.booster.inplace_predict(X, iteration_range=predictor.iteration_range)
+        at_node = np.asarray(at_node, dtype='float32').clip(0).reshape(len(times), num_cells)
+
+        report = {
+            'year': year,
+            'hours': len(times),
+            'method': method,
+            'mae': float(error.mean()),
+            'p99_abs_error': float(np.percentile(error, 99)),
+            'max_abs_error': float(error.max()),
+            'mean_prediction': float(full.mean()),
+            'day_node_mae': float(np.abs(at_node - full).mean()),
+            'missing_weather_hours': missing_weather_hours,
+            'model_ms_per_hour': model_seconds / len(times) * 1000,
+            'cube_ms_per_hour': cube_seconds / len(times) * 1000,
+        }
+        print(f"Cube vs model on {len(times)} hours of {year} ({method}): MAE {report['mae']:.4f}, "
+              f"p99 {report['p99_abs_error']:.4f}, max {report['max_abs_error']:.4f} "
+              f"(mean prediction {report['mean_prediction']:.4f}); "
+              f"{report['cube_ms_per_hour']:.3f} ms/hour vs {report['model_ms_per_hour']:.3f} ms/hour")
+        print(f"  day of month at the nearest of {self.days.tolist()}: MAE {report['day_node_mae']:.4f}; "
+              f"{report['missing_weather_hours']} hours miss a weather value and are left to the model")
+        self.error = report
+        return report
+
+
+if __name__ == '__main__':
+    import argparse
+    from model_usage import EmergencyPredictor
+
+    parser = argparse.ArgumentParser(description="Build a prediction cube from a model and measure its error.")
+    parser.add_argument('--model', default='../model/emergency_prediction_model.ubj')
+    parser.add_argument('--weather', default='../data/weather_store')
+    parser.add_argument('--out', default='../model/prediction_cube')
+    parser.add_argument('--year', type=int, default=None,
+                        help="Model year, the only year the cube answers, also the year its error is measured on.")
+    parser.add_argument('--cells', type=int, default=None)
+    parser.add_argument('--bins', type=int, nargs=4, default=None, metavar=('FMAX', 'FMIN', 'PRCP', 'SNOW'))
+    parser.add_argument('--days', type=int, nargs='+', default=list(DEFAULT_DAYS))
+    args = parser.parse_args()
+
+    predictor = EmergencyPredictor(args.model, args.weather, cache_size=0)
+    bins = dict(zip(CUBE_WEATHER_COLUMNS, args.bins)) if args.bins else None
+    cube = PredictionCube.build(predictor, year=args.year, num_cells=args.cells, bins=bins, days=args.days)
+    for method in LOOKUP_METHODS:  # 'linear' last, so its bound is the one saved
+        cube.error_report(predictor, method=method)
+    cube.save(args.out)
+    print(f"Prediction cube saved to {args.out}")
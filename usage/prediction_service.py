@@ -0,0 +1,456 @@
+"""
+A small asyncio HTTP service around EmergencyPredictor.
+
+    python prediction_service.py --model ../model/emergency_prediction_model.ubj \
+        --weather ../data/weather_store --port 8765
+
+    GET /predict?time=2007-07-15T18:00&cells=256   -> {"time", "cells", "predictions"}; cells defaults to
+                                                       the model's grid
+    GET /predict?time=...&cells=10000&bbox=37.7,-122.52,37.83,-122.33&max_cells=400
+                                                    -> predictions summed to the pyramid level that
+                                                       fits the viewport, plus "level" and "level_cells"
+    GET /grid?cells=10000&level=2&format=topojson    -> that level's cells as GeoJSON (default) or
+                                                       TopoJSON, optionally &precision=<decimals>
+                                                       (GeoJSON) or &quantization=<int >= 2> (TopoJSON)
+    GET /metrics                                    -> latency, batch and queue-depth counters
+    GET /health
+
+cells is at most the model's grid, or MAX_CELLS for a model without a grid
+spec. A request line longer than MAX_REQUEST_LINE gets 414.
+
+Concurrent requests for the same hour share one computation. Distinct
+hours that arrive within batch_window seconds of each other are scored
+with one predict_hours call on a thread pool, so the event loop never
+waits on the model.
+
+    python prediction_service.py ... --load-test --clients 32 --requests 200
+starts the service and hammers it from the same process over localhost.
+"""
+import json
+import time
+import asyncio
+import argparse
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from model_usage import EmergencyPredictor
+from grid import GRID_SHAPE_ENCODINGS, grid_shapes
+
+DEFAULT_PORT = 8765
+MAX_REQUEST_LINE = 8192
+# Largest cells= of a model without a grid spec; one hour of it is a 2.4 MB feature matrix
+MAX_CELLS = 65_536
+# Cells a viewport request gets at most, when it does not ask for max_cells
+DEFAULT_MAX_CELLS = 1024
+# Encoded /grid bodies kept, least recently used are dropped first
+GRID_PAYLOAD_ENTRIES = 64
+
+
+class ServiceMetrics:
+    """Counters and a window of recent latencies. Only touched from the event loop thread."""
+
+    def __init__(self, window: int = 10000):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.batched_hours = 0
+        self.max_batch = 0
+        self.queue_depth = 0
+        self.max_queue_depth = 0
+        self.latencies_ms = deque(maxlen=window)
+        self.batch_ms = deque(maxlen=window)
+
+    def enqueue(self, n: int = 1):
+        self.queue_depth += n
+        self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+
+    def snapshot(self, inflight: int):
+        def percentiles(values):
+            if not values:
+                return {'p50': None, 'p95': None, 'p99': None}
+            p50, p95, p99 = np.percentile(np.fromiter(values, dtype='float64'), [50, 95, 99])
+            return {'p50': round(p50, 3), 'p95': round(p95, 3), 'p99': round(p99, 3)}
+
+        return {
+            'uptime_seconds': round(time.monotonic() - self.started, 1),
+            'requests': self.requests,
+            'errors': self.errors,
+            'cache_hits': self.cache_hits,
+            'coalesced': self.coalesced,
+            'batches': self.batches,
+            'mean_batch_hours': round(self.batched_hours / self.batches, 2) if self.batches else 0.0,
+            'max_batch_hours': self.max_batch,
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'inflight_hours': inflight,
+            'latency_ms': percentiles(self.latencies_ms),
+            'batch_ms': percentiles(self.batch_ms),
+        }
+
+
+class PredictionService:
+    """
+    Coalesces and micro-batches per-hour prediction requests for one predictor.
+
+    Args:
+        predictor (EmergencyPredictor): Shared by all requests. Its prediction
+            cache, if enabled, is checked before anything is queued.
+        batch_window (float): Seconds to wait for more hours before scoring.
+        max_batch_hours (int): A batch is scored as soon as it has this many hours.
+        workers (int): Threads scoring batches.
+    """
+
+    def __init__(self, predictor: EmergencyPredictor, batch_window: float = 0.005, max_batch_hours: int = 168,
+                 workers: int = 4):
+        self.predictor = predictor
+        self.batch_window = batch_window
+        self.max_batch_hours = max_batch_hours
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='predict')
+        self.metrics = ServiceMetrics()
+        # cells= above the model's grid would score cell IDs it never saw
+        self.max_cells = (predictor.grid or {}).get('num_cells') or MAX_CELLS
+        self._inflight = {}   # (hour, num_cells) -> Future shared by every waiter
+        self._pending = {}    # num_cells -> list of hours waiting for the next batch
+        self._flush_handles = {}
+        # (num_cells, level, encoding, precision, quantization) -> encoded /grid body, in LRU order
+        self._grid_payloads = OrderedDict()
+
+    async def predict_hour(self, target_datetime, num_cells: int = None) -> np.ndarray:
+        """Predictions for one hour, from the cache, an in-flight computation or the next batch."""
+        num_cells = num_cells or self.predictor.default_num_cells
+        hour = pd.Timestamp(target_datetime).floor('h')
+        cache = self.predictor.cache
+        if cache is not None:
+            cached = cache.get(self.predictor._cache_key(hour, num_cells))
+            if cached is not None:
+                self.metrics.cache_hits += 1
+                return cached
+
+        key = (hour, num_cells)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.metrics.coalesced += 1
+            return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[key] = future
+        pending = self._pending.setdefault(num_cells, [])
+        pending.append(hour)
+        self.metrics.enqueue()
+
+        if len(pending) >= self.max_batch_hours:
+            self._flush(num_cells)
+        elif num_cells not in self._flush_handles:
+            self._flush_handles[num_cells] = loop.call_later(self.batch_window, self._flush, num_cells)
+        return await asyncio.shield(future)
+
+    def _flush(self, num_cells: int):
+        handle = self._flush_handles.pop(num_cells, None)
+        if handle is not None:
+            handle.cancel()
+        hours = self._pending.pop(num_cells, [])
+        if hours:
+            asyncio.get_running_loop().create_task(self._run_batch(hours, num_cells))
+
+    async def _run_batch(self, hours, num_cells: int):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            try:
+                predictions = await loop.run_in_executor(self.executor, self.predictor.predict_hours, hours, num_cells)
+                results = [predictions[i].copy() for i in range(len(hours))]
+            except Exception as e:
+                # One bad hour (e.g. a day without weather) must not fail the unrelated hours batched with it
+                results = [e] if len(hours) == 1 else await loop.run_in_executor(
+                    self.executor, self._predict_each, hours, num_cells)
+            cache = self.predictor.cache
+            for hour, result in zip(hours, results):
+                future = self._inflight.pop((hour, num_cells))
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                    continue
+                if cache is not None:
+                    cache.put(self.predictor._cache_key(hour, num_cells), result)
+                future.set_result(result)
+        finally:
+            self.metrics.queue_depth -= len(hours)
+            self.metrics.batches += 1
+            self.metrics.batched_hours += len(hours)
+            self.metrics.max_batch = max(self.metrics.max_batch, len(hours))
+            self.metrics.batch_ms.append((time.perf_counter() - started) * 1000)
+
+    def _predict_each(self, hours, num_cells: int) -> list:
+        """Scores the hours one at a time, returning each hour's predictions or its exception."""
+        results = []
+        for hour in hours:
+            try:
+                results.append(self.predictor.predict_hours([hour], num_cells)[0].copy())
+            except Exception as e:
+                results.append(e)
+        return results
+
+    # --- HTTP ---
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Minimal HTTP/1.1 with keep-alive; only GET is supported."""
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                except ValueError:
+                    # Longer than MAX_REQUEST_LINE; the rest of the line is still unread, so close afterwards
+                    await self._respond(writer, '414 URI Too Long',
+                                        {'error': f'request line longer than {MAX_REQUEST_LINE} bytes'}, False)
+                    break
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    try:
+                        line = await reader.readline()
+                    except ValueError:
+                        headers = None
+                        break
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if headers is None:
+                    await self._respond(writer, '431 Request Header Fields Too Large',
+                                        {'error': f'header line longer than {MAX_REQUEST_LINE} bytes'}, False)
+                    break
+
+                try:
+                    status, body = await self.route(request_line)
+                except Exception as e:
+                    status, body = '500 Internal Server Error', {'error': f'{type(e).__name__}: {e}'}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._respond(writer, status, body, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            pass  # the server is shutting down with this keep-alive connection idle
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: str, body, keep_alive: bool):
+        payload = body if isinstance(body, bytes) else json.dumps(body, separators=(',', ':')).encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload)
+        await writer.drain()
+
+    async def route(self, request_line: bytes):
+        """Returns (status line, JSON-serializable body) for one request."""
+        try:
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+        except ValueError:
+            return '400 Bad Request', {'error': 'malformed request line'}
+        if method != 'GET':
+            return '405 Method Not Allowed', {'error': f'{method} is not supported'}
+
+        url = urlsplit(target)
+        if url.path == '/health':
+            return '200 OK', {'status': 'ok'}
+        if url.path == '/metrics':
+            return '200 OK', self.metrics.snapshot(len(self._inflight))
+        if url.path == '/grid':
+            return self.grid(parse_qs(url.query))
+        if url.path != '/predict':
+            return '404 Not Found', {'error': f'unknown path {url.path}'}
+
+        started = time.perf_counter()
+        self.metrics.requests += 1
+        query = parse_qs(url.query)
+        try:
+            hour = pd.Timestamp(query['time'][0]).floor('h')
+            num_cells = self._num_cells(query)
+            pyramid, level = self._level(query, num_cells)
+        except (KeyError, ValueError) as e:
+            self.metrics.errors += 1
+            return '400 Bad Request', {'error': f'expected ?time=<ISO datetime>&cells=<int>: {e}'}
+
+        try:
+            predictions = await self.predict_hour(hour, num_cells)
+        except KeyError as e:
+            self.metrics.errors += 1
+            return '404 Not Found', {'error': e.args[0]}
+        except Exception as e:
+            self.metrics.errors += 1
+            return '500 Internal Server Error', {'error': f'{type(e).__name__}: {e}'}
+        finally:
+            self.metrics.latencies_ms.append((time.perf_counter() - started) * 1000)
+
+        body = {'time': hour.isoformat(), 'cells': num_cells}
+        if pyramid is not None:
+            predictions = pyramid.aggregate(predictions, level)
+            body.update(level=level, level_cells=pyramid.num_cells(level))
+        body['predictions'] = predictions.astype('float64').round(4).tolist()
+        return '200 OK', body
+
+    def _num_cells(self, query: dict) -> int:
+        """The request's cells=, the model's grid by default, between 1 and max_cells."""
+        num_cells = int(query.get('cells', [self.predictor.default_num_cells])[0])
+        if not 0 < num_cells <= self.max_cells:
+            raise ValueError(f'cells must be between 1 and {self.max_cells}')
+        return num_cells
+
+    def _level(self, query: dict, num_cells: int):
+        """
+        (pyramid, level) for a request with ?level=<int> or ?bbox=<min_lat,min_lon,max_lat,max_lon>
+        and optionally &max_cells=<int>, or (None, 0) for the full-resolution grid.
+        """
+        if 'level' not in query and 'bbox' not in query:
+            return None, 0
+        pyramid = self.predictor.grid_pyramid(num_cells)
+        if 'level' in query:
+            level = int(query['level'][0])
+            if not 0 <= level < len(pyramid):
+                raise ValueError(f'level must be between 0 and {len(pyramid) - 1}')
+            return pyramid, level
+        min_lat, min_lon, max_lat, max_lon = map(float, query['bbox'][0].split(','))
+        max_cells = int(query.get('max_cells', [str(DEFAULT_MAX_CELLS)])[0])
+        return pyramid, pyramid.level_for_viewport(min_lat, max_lat, min_lon, max_lon, max_cells)
+
+    def grid(self, query: dict):
+        """
+        Cell shapes for /grid?cells=<int>&level=<int>&format=<geojson|topojson>, the shapes
+        that /predict?level= values belong to. GeoJSON takes &precision=<decimals>, TopoJSON
+        &quantization=<int>, at least 2. The last GRID_PAYLOAD_ENTRIES encoded payloads are kept.
+        """
+        try:
+            num_cells = self._num_cells(query)
+            encoding = query.get('format', ['geojson'])[0]
+            if encoding not in GRID_SHAPE_ENCODINGS:
+                raise ValueError(f'format must be one of {GRID_SHAPE_ENCODINGS}')
+            precision = int(query['precision'][0]) if 'precision' in query and encoding == 'geojson' else None
+            quantization = int(query['quantization'][0]) if 'quantization' in query and encoding == 'topojson' else None
+            if quantization is not None and quantization < 2:
+                raise ValueError('quantization must be at least 2')
+            pyramid, level = self._level({'level': ['0'], **query}, num_cells)
+        except (KeyError, ValueError) as e:
+            return '400 Bad Request', {'error': f'expected ?cells=<int>&level=<int>: {e}'}
+
+        key = (num_cells, level, encoding, precision, quantization)
+        payload = self._grid_payloads.get(key)
+        if payload is None:
+            lats, lons = pyramid.levels[level]
+            shapes = grid_shapes(lats, lons, encoding, precision, quantization)
+            payload = self._grid_payloads[key] = json.dumps(shapes, separators=(',', ':')).encode()
+            if len(self._grid_payloads) > GRID_PAYLOAD_ENTRIES:
+                self._grid_payloads.popitem(last=False)
+        self._grid_payloads.move_to_end(key)
+        return '200 OK', payload
+
+    async def serve(self, host: str = '127.0.0.1', port: int = DEFAULT_PORT):
+        """Starts listening and returns the asyncio server."""
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_REQUEST_LINE)
+        print(f"Prediction service listening on http://{host}:{port}")
+        return server
+
+
+async def _get(reader, writer, path: str, keep_alive: bool = True):
+    connection = 'keep-alive' if keep_alive else 'close'
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: {connection}\r\n\r\n".encode())
+    await writer.drain()
+    status = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return int(status.split()[1]), await reader.readexactly(length)
+
+
+async def load_test(host: str, port: int, start, hours: int = 24, clients: int = 32, requests_per_client: int = 100,
+                    num_cells: int = 256, seed: int = 0):
+    """
+    Opens `clients` keep-alive connections that each request random hours out
+    of the `hours` after `start`, and prints throughput and client-side latency.
+    Overlapping hours across clients exercise coalescing and batching.
+
+    Returns:
+        dict: Client-side latency percentiles in ms, throughput, and the service's /metrics.
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start).floor('h')
+    latencies = []
+
+    async def client(offsets):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            for offset in offsets:
+                path = f"/predict?time={(start + pd.Timedelta(hours=int(offset))).isoformat()}&cells={num_cells}"
+                begin = time.perf_counter()
+                status, _ = await _get(reader, writer, path)
+                latencies.append((time.perf_counter() - begin) * 1000)
+                if status != 200:
+                    raise RuntimeError(f"{path} returned {status}")
+        finally:
+            writer.close()
+
+    began = time.perf_counter()
+    await asyncio.gather(*(client(rng.integers(0, hours, requests_per_client)) for _ in range(clients)))
+    elapsed = time.perf_counter() - began
+
+    reader, writer = await asyncio.open_connection(host, port)
+    _, body = await _get(reader, writer, '/metrics', keep_alive=False)
+    writer.close()
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    result = {
+        'requests': len(latencies),
+        'requests_per_second': len(latencies) / elapsed,
+        'latency_ms': {'p50': p50, 'p95': p95, 'p99': p99},
+        'service': json.loads(body),
+    }
+    print(f"{len(latencies)} requests from {clients} clients in {elapsed:.2f}s "
+          f"({result['requests_per_second']:,.0f} req/s), latency p50 {p50:.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms")
+    service = result['service']
+    print(f"service: {service['batches']} batches (mean {service['mean_batch_hours']} hours), "
+          f"{service['coalesced']} coalesced, {service['cache_hits']} cache hits, "
+          f"max queue depth {service['max_queue_depth']}")
+    return result
+
+
+async def _main(args):
+    predictor = EmergencyPredictor(args.model, args.weather, cache_size=args.cache_size)
+    service = PredictionService(predictor, batch_window=args.batch_window_ms / 1000, workers=args.workers)
+    server = await service.serve(args.host, args.port)
+    async with server:
+        if args.load_test:
+            await load_test(args.host, args.port, args.load_test_start, hours=args.load_test_hours,
+                            clients=args.clients, requests_per_client=args.requests)
+        else:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve EmergencyPredictor over HTTP.")
+    parser.add_argument('--model', default='../model/emergency_prediction_model.ubj')
+    parser.add_argument('--weather', default='../data/weather_store')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-window-ms', type=float, default=5.0)
+    parser.add_argument('--cache-size', type=int, default=256, help="0 disables the predictor cache.")
+    parser.add_argument('--load-test', action='store_true', help="Run a localhost load test against the service.")
+    parser.add_argument('--load-test-start', default='2007-07-15T00:00')
+    parser.add_argument('--load-test-hours', type=int, default=24)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=100)
+    asyncio.run(_main(parser.parse_args()))
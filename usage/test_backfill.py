@@ -0,0 +1,68 @@
+import io
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from backfill import SharedArrays, build_feature_arrays, month_chunks, score_chunk
+from fixtures import GRID, MISSING_DAY, make_model, make_weather_store, weather_frame
+from model_usage import EmergencyPredictor
+from schema import FEATURES
+
+
+class TestBackfill(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.model_path = make_model(cls.directory.name)
+        with redirect_stdout(io.StringIO()):
+            cls.predictor = EmergencyPredictor(cls.model_path, make_weather_store(cls.directory.name), cache_size=0)
+        cls.arrays = build_feature_arrays(weather_frame(), GRID['columns'], GRID['rows'], GRID['min_in'],
+                                          GRID['max_in'])
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_month_chunks(self):
+        chunks = month_chunks('2007-01-30 12:00', '2007-02-02 05:00', chunk_hours=24)
+        self.assertEqual([n for _, n in chunks], [24, 12, 24, 6])
+        self.assertEqual(chunks[0], (pd.Timestamp('2007-01-30 12:00'), 24))
+        self.assertEqual(chunks[2], (pd.Timestamp('2007-02-01 00:00'), 24))
+        for start, n_hours in chunks:
+            self.assertEqual(start.month, (start + pd.Timedelta(hours=n_hours - 1)).month)
+
+    def test_shared_arrays_round_trip(self):
+        with SharedArrays(self.arrays) as shared:
+            attached, blocks = SharedArrays.attach(shared.specs())
+            for name, array in self.arrays.items():
+                np.testing.assert_array_equal(attached[name], array)
+                self.assertEqual(attached[name].dtype, array.dtype)
+            del attached
+            for block in blocks:
+                block.close()
+            specs = shared.specs()
+        with self.assertRaises(FileNotFoundError):
+            SharedArrays.attach(specs)
+
+    def test_score_chunk_matches_predict_hours(self):
+        """Same predictions as EmergencyPredictor, and no rows on the day without weather."""
+        booster = xgb.Booster(model_file=self.model_path)
+        start = pd.Timestamp(MISSING_DAY) - pd.Timedelta(hours=12)
+        df = score_chunk(self.arrays, booster, FEATURES, start, 36)
+
+        times = pd.date_range(start, periods=36, freq='h')
+        times = times[times.normalize() != pd.Timestamp(MISSING_DAY)]
+        expected = self.predictor.predict_hours(times, GRID['num_cells'])
+        self.assertEqual(len(df), expected.size)
+        self.assertEqual(df['cell'].tolist(), list(range(1, GRID['num_cells'] + 1)) * len(times))
+        self.assertEqual(df['hour'].tolist(), np.repeat(times.hour, GRID['num_cells']).tolist())
+        np.testing.assert_allclose(df['prediction'], expected.ravel(), rtol=1e-6)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
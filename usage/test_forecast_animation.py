@@ -0,0 +1,56 @@
+import base64
+import unittest
+
+import numpy as np
+
+from forecast_animation import FRAME_LEVELS, ForecastAnimation, decode_frames, encode_frames, level_colors
+from grid import create_grid_axes
+
+
+class TestFrames(unittest.TestCase):
+
+    def test_round_trip(self):
+        predictions = np.random.default_rng(0).gamma(2.0, 1.0, (48, 30)).astype('float32')
+        vmax = float(predictions.max())
+        expected = np.ceil(predictions / vmax * (FRAME_LEVELS - 1)).astype('uint8')
+        np.testing.assert_array_equal(decode_frames(encode_frames(predictions, vmax), 30), expected)
+
+    def test_deltas_wrap(self):
+        """Levels jumping between 0 and 255 give deltas outside 0-255, which wrap both ways."""
+        predictions = np.array([[0.0, 4.0, 2.0], [4.0, 0.0, 2.0], [0.0, 4.0, 0.01], [4.0, 4.0, 4.0]])
+        levels = decode_frames(encode_frames(predictions, vmax=4.0), 3)
+        np.testing.assert_array_equal(levels, [[0, 255, 128], [255, 0, 128], [0, 255, 1], [255, 255, 255]])
+
+    def test_missing_negative_and_above_scale(self):
+        """NaN and negative predictions are level 0, transparent; anything above vmax is the top level."""
+        predictions = np.array([[np.nan, -3.0, 10.0, 1e-6], [1.0, np.nan, -0.5, 10.0]])
+        levels = decode_frames(encode_frames(predictions, vmax=2.0), 4)
+        np.testing.assert_array_equal(levels, [[0, 0, 255, 1], [128, 0, 0, 255]])
+
+    def test_level_colors(self):
+        colors = level_colors()
+        self.assertEqual(len(colors), FRAME_LEVELS)
+        self.assertEqual((colors[0], colors[-1]), ('#ffffcc', '#800026'))
+
+
+class TestForecastAnimation(unittest.TestCase):
+
+    def setUp(self):
+        self.lats, self.lons = create_grid_axes(37.7, 37.83, -122.52, -122.33, 5, 4)
+        self.predictions = np.random.default_rng(1).random((24, 20))
+        self.times = np.arange('2007-07-19T00', '2007-07-20T00', dtype='datetime64[h]')
+
+    def test_embeds_the_frames(self):
+        animation = ForecastAnimation(self.predictions, self.times, self.lats, self.lons, vmax=1.0)
+        frames = decode_frames(base64.b64decode(animation.frames), animation.num_cells)
+        np.testing.assert_array_equal(frames, decode_frames(encode_frames(self.predictions, 1.0), 20))
+        self.assertIn('Thu 2007-07-19 00:00', animation.labels_json)
+        self.assertEqual(animation.transfer_sizes()['frames'], len(animation.frames))
+
+    def test_rejects_another_grid(self):
+        with self.assertRaises(ValueError):
+            ForecastAnimation(self.predictions[:, :16], self.times, self.lats, self.lons)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
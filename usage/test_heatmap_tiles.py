@@ -0,0 +1,111 @@
+import io
+import struct
+import tempfile
+import unittest
+import zlib
+from contextlib import redirect_stdout
+
+import numpy as np
+import pandas as pd
+
+from fixtures import GRID, make_model, make_weather_store
+from heatmap_tiles import PALETTE, HeatmapTileCache, colorize, encode_png
+from model_usage import EmergencyPredictor
+
+
+def decode_png(data: bytes) -> np.ndarray:
+    """The RGBA image of an 8-bit, unfiltered PNG like encode_png writes, checking every chunk's CRC."""
+    assert data[:8] == b'\x89PNG\r\n\x1a\n'
+    chunks, offset = {}, 8
+    while offset < len(data):
+        length, tag = struct.unpack('>I4s', data[offset:offset + 8])
+        body = data[offset + 8:offset + 8 + length]
+        crc, = struct.unpack('>I', data[offset + 8 + length:offset + 12 + length])
+        assert crc == zlib.crc32(tag + body) & 0xffffffff, tag
+        chunks[tag] = chunks.get(tag, b'') + body
+        offset += 12 + length
+    width, height, depth, color_type = struct.unpack('>IIBB', chunks[b'IHDR'][:10])
+    assert (depth, color_type) == (8, 6) and b'IEND' in chunks
+    scanlines = np.frombuffer(zlib.decompress(chunks[b'IDAT']), dtype='uint8').reshape(height, 1 + width * 4)
+    assert not scanlines[:, 0].any()
+    return scanlines[:, 1:].reshape(height, width, 4)
+
+
+def rgb(color: str) -> list:
+    return [int(color[i:i + 2], 16) for i in (1, 3, 5)]
+
+
+class TestColorize(unittest.TestCase):
+
+    def test_palette_and_transparency(self):
+        values = np.array([[0.0, np.nan, -1.0], [2.0, 4.0, 9.0]])
+        rgba = colorize(values, vmax=4.0, alpha=200)
+        self.assertEqual(rgba.shape, (2, 3, 4))
+        self.assertEqual(rgba.dtype, np.uint8)
+        # Row 0 of the values is the southernmost, the image's last row
+        np.testing.assert_array_equal(rgba[1, :, 3], [0, 0, 0])
+        np.testing.assert_array_equal(rgba[0, :, 3], [200, 200, 200])
+        # Half the scale is the middle palette colour, vmax and above the last
+        np.testing.assert_array_equal(rgba[0, 0, :3], rgb(PALETTE[len(PALETTE) // 2]))
+        np.testing.assert_array_equal(rgba[0, 1, :3], rgb(PALETTE[-1]))
+        np.testing.assert_array_equal(rgba[0, 2, :3], rgb(PALETTE[-1]))
+
+    def test_png_round_trip(self):
+        rgba = np.random.default_rng(0).integers(0, 256, (7, 5, 4), dtype='uint8')
+        np.testing.assert_array_equal(decode_png(encode_png(rgba)), rgba)
+        one_pixel = colorize(np.array([[1.0]]), vmax=1.0)
+        np.testing.assert_array_equal(decode_png(encode_png(one_pixel)), one_pixel)
+
+
+class TestHeatmapTileCache(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        model_path = make_model(cls.directory.name)
+        weather_path = make_weather_store(cls.directory.name)
+        with redirect_stdout(io.StringIO()):
+            cls.predictor = EmergencyPredictor(model_path, weather_path, cache_size=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.tiles_dir = tempfile.TemporaryDirectory()
+        self.tiles = HeatmapTileCache(self.tiles_dir.name)
+
+    def tearDown(self):
+        self.tiles_dir.cleanup()
+
+    def render(self, *args, **kwargs):
+        with redirect_stdout(io.StringIO()):
+            return self.tiles.render(self.predictor, *args, num_cells=GRID['num_cells'], **kwargs)
+
+    def test_later_renders_keep_the_layer_scale(self):
+        """Hours added to a layer are drawn on the scale of the images already in it."""
+        night, day = pd.Timestamp('2007-07-19 00:00'), pd.Timestamp('2007-07-19 23:00')
+        self.assertEqual(self.render(night, night + pd.Timedelta(hours=5)), 6)
+        self.assertEqual(self.render(night, day), 18)
+        self.assertEqual(self.render(night, day), 0)
+
+        meta = self.tiles.meta(self.predictor, GRID['num_cells'])
+        first_six = self.predictor.predict_hours(pd.date_range(night, periods=6, freq='h')).max()
+        self.assertAlmostEqual(meta['layer_vmax'], float(first_six), places=5)
+        self.assertEqual(set(meta['vmax'].values()), {meta['layer_vmax']})
+        self.assertEqual(meta['shape'], [GRID['rows'], GRID['columns']])
+
+        values = self.predictor.predict_hours([day])[0].reshape(GRID['rows'], GRID['columns'])
+        path = self.tiles.hour_path(self.predictor, day, GRID['num_cells'])
+        np.testing.assert_array_equal(decode_png(path.read_bytes()), colorize(values, meta['layer_vmax']))
+
+    def test_explicit_vmax(self):
+        hour = pd.Timestamp('2007-07-19 12:00')
+        self.render(hour, hour, vmax=100.0)
+        self.render(hour, hour, vmax=50.0, overwrite=True)
+        meta = self.tiles.meta(self.predictor, GRID['num_cells'])
+        self.assertEqual((meta['layer_vmax'], meta['vmax']['2007-07-19T12']), (100.0, 50.0))
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
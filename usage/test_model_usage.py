@@ -0,0 +1,183 @@
+import io
+import os
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from fixtures import GRID, MISSING_DAY, make_model, make_weather_store
+from model_usage import EmergencyPredictor, PredictionCache, replay_clock, top_k_indices
+from weather_store import WeatherStore
+
+
+class TestPredictionCache(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        cache = PredictionCache(max_entries=2)
+        for key in 'abc':
+            cache.put(key, np.zeros(3))
+            if key == 'b':
+                cache.get('a')  # 'a' is now more recent than 'b'
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats()['evictions'], 1)
+        self.assertFalse(cache.get('c').flags.writeable)
+
+    def test_ttl_expiry(self):
+        cache = PredictionCache(ttl_seconds=10)
+        with mock.patch('model_usage.time.monotonic', return_value=100.0):
+            cache.put('a', np.zeros(3))
+        with mock.patch('model_usage.time.monotonic', return_value=109.0):
+            self.assertIsNotNone(cache.get('a'))
+        with mock.patch('model_usage.time.monotonic', return_value=110.5):
+            self.assertNotIn('a', cache)
+            self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['entries'], 0)
+
+
+class TestTopK(unittest.TestCase):
+
+    def test_matches_a_full_sort(self):
+        values = np.random.default_rng(0).random(1000)
+        np.testing.assert_array_equal(top_k_indices(values, 10), np.argsort(values)[::-1][:10])
+        np.testing.assert_array_equal(top_k_indices(values, 5000), np.argsort(values)[::-1])
+        self.assertEqual(len(top_k_indices(values, 0)), 0)
+
+
+class TestEmergencyPredictor(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.model_path = make_model(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def setUp(self):
+        self.weather_dir = tempfile.TemporaryDirectory()
+        self.weather_path = make_weather_store(self.weather_dir.name)
+        with redirect_stdout(io.StringIO()):
+            self.predictor = EmergencyPredictor(self.model_path, self.weather_path, cache_size=8)
+
+    def tearDown(self):
+        self.predictor.stop_warmer()
+        self.weather_dir.cleanup()
+
+    def predict(self, *args, **kwargs):
+        with redirect_stdout(io.StringIO()):
+            return self.predictor.predict(*args, **kwargs)
+
+    def test_defaults_to_the_model_grid(self):
+        self.assertEqual(self.predictor.default_num_cells, GRID['num_cells'])
+        self.assertEqual(len(self.predict(datetime(2007, 7, 19, 12))), GRID['num_cells'])
+        lats, lons = self.predictor.grid_axes(GRID['num_cells'])
+        self.assertEqual((len(lats), len(lons)), (GRID['rows'] + 1, GRID['columns'] + 1))
+        np.testing.assert_allclose([lats[0], lons[0], lats[-1], lons[-1]], GRID['min_in'] + GRID['max_in'])
+
+    def test_native_matches_sklearn(self):
+        with redirect_stdout(io.StringIO()):
+            sklearn = EmergencyPredictor(self.model_path, self.weather_path, cache_size=0, inference='sklearn')
+        times = pd.date_range('2006-12-30', periods=72, freq='h')
+        native = self.predictor.predict_hours(times, GRID['num_cells'])
+        np.testing.assert_allclose(native, sklearn.predict_hours(times, GRID['num_cells']), rtol=1e-6, atol=1e-6)
+        self.assertEqual(native.shape, (72, GRID['num_cells']))
+        self.assertEqual(native.dtype, np.float32)
+
+    def test_concurrent_calls_share_the_booster(self):
+        """inplace_predict on one shared booster from many threads gives the single-threaded results."""
+        days = [pd.date_range(f'2007-0{month}-10', periods=24, freq='h') for month in range(1, 9)]
+        expected = [self.predictor.predict_hours(times, GRID['num_cells']) for times in days]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda times: self.predictor.predict_hours(times, GRID['num_cells']), days * 4))
+        for i, result in enumerate(results):
+            np.testing.assert_array_equal(result, expected[i % len(days)])
+
+    def test_refresh_weather_invalidates_cache(self):
+        hour = datetime(2007, 7, 19, 12)
+        before = self.predict(hour, GRID['num_cells'])['prediction'].to_numpy()
+        self.assertEqual(self.predictor.cache_stats()['entries'], 1)
+        self.assertFalse(self.predictor.refresh_weather())
+
+        store = WeatherStore.load(self.weather_path, mmap=False)
+        store.values[:, store.columns.index('fmax')] += 15
+        store.save(self.weather_path)
+        meta = os.path.join(self.weather_path, 'meta.json')
+        os.utime(meta, ns=(os.stat(meta).st_atime_ns, os.stat(meta).st_mtime_ns + 10 ** 9))
+
+        self.assertTrue(self.predictor.refresh_weather())
+        self.assertEqual(self.predictor.cache_stats()['entries'], 0)
+        after = self.predict(hour, GRID['num_cells'])['prediction'].to_numpy()
+        self.assertGreater(after.sum(), before.sum())
+
+    def test_warmer_needs_a_clock(self):
+        with self.assertRaises(ValueError):
+            self.predictor.start_warmer(num_cells=GRID['num_cells'])
+
+    def test_warmer_fills_cache_and_stops_past_the_weather(self):
+        with redirect_stdout(io.StringIO()):
+            self.predictor.start_warmer(hours_ahead=3, num_cells=GRID['num_cells'], interval_seconds=60,
+                                        clock=replay_clock(datetime(2007, 7, 19, 6)))
+            for _ in range(100):
+                if self.predictor.cache_stats()['entries'] == 4:
+                    break
+                time.sleep(0.05)
+        self.assertEqual(self.predictor.cache_stats()['entries'], 4)
+        self.assertTrue(self.predictor._warmer.is_alive())
+        self.predictor.stop_warmer()
+
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.predictor.start_warmer(num_cells=GRID['num_cells'], clock=lambda: datetime.fromisoformat(MISSING_DAY))
+            self.predictor._warmer.join(timeout=10)
+        self.assertFalse(self.predictor._warmer.is_alive())
+        self.assertIn("Cache warmer stopped", output.getvalue())
+
+    def test_hotspots_match_a_full_sort(self):
+        start, end = datetime(2007, 7, 18, 6), datetime(2007, 7, 19, 5)
+        with redirect_stdout(io.StringIO()):
+            predictions, times, cells = self.predictor.predict_range(start, end)
+        totals = predictions.sum(axis=0, dtype='float64')
+
+        top = self.predictor.hotspots(start, end, k=5)
+        np.testing.assert_array_equal(top['cell_id'], cells[np.argsort(totals)[::-1][:5]])
+        np.testing.assert_allclose(top['prediction'], np.sort(totals)[::-1][:5], rtol=1e-6)
+
+        hottest = self.predictor.hotspots(start, end, k=3, aggregate=None)
+        hour, cell = np.unravel_index(np.argmax(predictions), predictions.shape)
+        self.assertEqual((hottest['time'][0], hottest['cell_id'][0]), (times[hour], cells[cell]))
+
+        above = self.predictor.cells_above(start, end, threshold=float(np.median(predictions)))
+        self.assertEqual(len(above), (predictions >= np.median(predictions)).sum())
+        self.assertTrue(self.predictor.cells_above(start, end, threshold=1e9).empty)
+
+    def test_hotspots_are_at_cell_centres(self):
+        top = self.predictor.hotspots(datetime(2007, 7, 19), datetime(2007, 7, 19, 5), k=GRID['num_cells'])
+        lats, lons = self.predictor.grid_axes(GRID['num_cells'])
+        first = top.set_index('cell_id').loc[1]
+        self.assertAlmostEqual(first['latitude'], (lats[0] + lats[1]) / 2)
+        self.assertAlmostEqual(first['longitude'], (lons[0] + lons[1]) / 2)
+        last = top.set_index('cell_id').loc[GRID['num_cells']]
+        self.assertAlmostEqual(last['latitude'], (lats[-2] + lats[-1]) / 2)
+        self.assertAlmostEqual(last['longitude'], (lons[-2] + lons[-1]) / 2)
+
+    def test_query_arguments(self):
+        start, end = datetime(2007, 7, 19, 6), datetime(2007, 7, 19, 0)
+        with self.assertRaisesRegex(ValueError, 'k must be at least 1'):
+            self.predictor.hotspots(end, start, k=0)
+        with self.assertRaisesRegex(ValueError, 'is after end'):
+            self.predictor.hotspots(start, end)
+        with self.assertRaisesRegex(ValueError, 'is after end'):
+            self.predictor.cells_above(start, end, threshold=0.0)
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
@@ -0,0 +1,101 @@
+import io
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from fixtures import GRID, make_model, make_weather_store
+from model_usage import EmergencyPredictor
+from prediction_cube import CUBE_WEATHER_COLUMNS, PredictionCube
+from weather_store import WeatherStore, day_ordinals
+
+
+class TestPredictionCube(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.model_path = make_model(cls.directory.name)
+        cls.weather_path = make_weather_store(cls.directory.name)
+        with redirect_stdout(io.StringIO()):
+            cls.predictor = EmergencyPredictor(cls.model_path, cls.weather_path, cache_size=0)
+            cls.cube = PredictionCube.build(cls.predictor, year=2007, bins={'fmax': 12, 'fmin': 6})
+            cls.cube_path = cls.cube.save(f'{cls.directory.name}/cube')
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def native(self, times, weather):
+        X = self.predictor._feature_matrix(times, weather, GRID['num_cells'])
+        predictions = self.predictor.booster.inplace_predict(X, iteration_range=self.predictor.iteration_range)
+        return np.asarray(predictions, dtype='float32').clip(0).reshape(len(times), GRID['num_cells'])
+
+    def test_lookup_on_the_nodes_matches_the_model(self):
+        """On a day node with weather on the weather nodes, both methods read the model's output back."""
+        times = pd.date_range('2007-03-15', periods=24, freq='h')
+        rng = np.random.default_rng(0)
+        weather = np.stack([rng.choice(self.cube.nodes[col], len(times)) for col in CUBE_WEATHER_COLUMNS], axis=1)
+        expected = self.native(times, weather)
+        for method in ('nearest', 'linear'):
+            np.testing.assert_allclose(self.cube.lookup(times, weather, method), expected, rtol=1e-3, atol=1e-2)
+
+    def test_linear_lookup_is_close_to_the_model(self):
+        with redirect_stdout(io.StringIO()):
+            report = self.cube.error_report(self.predictor)
+        self.assertEqual(report['year'], 2007)
+        self.assertLess(report['mae'], 0.1 * report['mean_prediction'])
+        # The synthetic target has no day-of-month effect, so one day node costs little
+        self.assertLess(report['day_node_mae'], report['mae'])
+        self.assertEqual(report['missing_weather_hours'], 0)
+
+    def test_rejects_other_years_and_missing_weather(self):
+        times = pd.date_range('2007-12-31 23:00', periods=2, freq='h')
+        with self.assertRaises(ValueError):
+            self.cube.lookup(times, np.zeros((2, 4), dtype='float32'))
+        weather = np.ones((2, 4), dtype='float32')
+        weather[1, 0] = np.nan
+        with self.assertRaisesRegex(ValueError, 'missing weather'):
+            self.cube.lookup(times[:1].repeat(2), weather)
+
+    def test_cube_inference(self):
+        with redirect_stdout(io.StringIO()):
+            predictor = EmergencyPredictor(self.model_path, self.weather_path, cache_size=0,
+                                           inference='cube', cube_path=self.cube_path)
+        times = pd.date_range('2007-05-01', periods=48, freq='h')
+        weather = self.predictor.weather.lookup(times)
+        np.testing.assert_array_equal(predictor.predict_hours(times), self.cube.lookup(times, weather))
+        with self.assertRaises(ValueError):
+            predictor.predict_hours(pd.date_range('2006-05-01', periods=2, freq='h'))
+        with self.assertRaises(ValueError):
+            predictor.predict(datetime(2007, 5, 1), num_cells=GRID['num_cells'] + 1)
+
+    def test_missing_weather_hours_go_to_the_booster(self):
+        """A day whose fmax is missing is scored by the trees, the other hours by the cube."""
+        store = WeatherStore.load(self.weather_path, mmap=False)
+        store.values[day_ordinals(['2007-05-02'])[0] - store.first_day, store.columns.index('fmax')] = np.nan
+        with tempfile.TemporaryDirectory() as directory:
+            store.save(directory)
+            with redirect_stdout(io.StringIO()):
+                cube = EmergencyPredictor(self.model_path, directory, cache_size=0, inference='cube',
+                                          cube_path=self.cube_path)
+                native = EmergencyPredictor(self.model_path, directory, cache_size=0)
+            times = pd.date_range('2007-05-01 12:00', periods=24, freq='h')
+            predictions = cube.predict_hours(times)
+            np.testing.assert_array_equal(predictions[12:], native.predict_hours(times[12:]))
+            np.testing.assert_array_equal(predictions[:12], self.cube.lookup(times[:12], store.lookup(times[:12])))
+
+            with redirect_stdout(io.StringIO()):
+                report = self.cube.error_report(native)
+            self.assertEqual(report['missing_weather_hours'], 24)
+
+        with self.assertRaises(ValueError):
+            EmergencyPredictor(self.model_path, self.weather_path, inference='cube', cube_path=self.cube_path,
+                               weather_fallback='nan')
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)
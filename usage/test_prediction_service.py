@@ -0,0 +1,140 @@
+import io
+import json
+import asyncio
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from fixtures import GRID, MISSING_DAY, make_model, make_weather_store
+from model_usage import EmergencyPredictor
+from prediction_service import GRID_PAYLOAD_ENTRIES, MAX_REQUEST_LINE, PredictionService, _get
+
+CELLS = GRID['num_cells']
+
+
+class TestPredictionService(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.model_path = make_model(cls.directory.name)
+        cls.weather_path = make_weather_store(cls.directory.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def setUp(self):
+        with redirect_stdout(io.StringIO()):
+            self.predictor = EmergencyPredictor(self.model_path, self.weather_path, cache_size=0)
+        # A long window so every request made in one gather lands in the same batch
+        self.service = PredictionService(self.predictor, batch_window=0.05, workers=2)
+
+    def tearDown(self):
+        self.service.executor.shutdown()
+
+    async def get(self, path: str):
+        with redirect_stdout(io.StringIO()):
+            status, body = await self.service.route(f"GET {path} HTTP/1.1\r\n".encode())
+        return int(status.split()[0]), body
+
+    async def test_same_hour_is_coalesced(self):
+        hour = pd.Timestamp('2007-07-19 12:00')
+        first, second = await asyncio.gather(self.service.predict_hour(hour, CELLS),
+                                             self.service.predict_hour(hour, CELLS))
+        np.testing.assert_array_equal(first, second)
+        np.testing.assert_array_equal(first, self.predictor.predict_hours([hour], CELLS)[0])
+        self.assertEqual((self.service.metrics.coalesced, self.service.metrics.batches), (1, 1))
+
+    async def test_distinct_hours_are_batched(self):
+        hours = pd.date_range('2007-07-19', periods=6, freq='h')
+        results = await asyncio.gather(*(self.service.predict_hour(hour, CELLS) for hour in hours))
+        np.testing.assert_array_equal(np.stack(results), self.predictor.predict_hours(hours, CELLS))
+        self.assertEqual((self.service.metrics.batches, self.service.metrics.max_batch), (1, 6))
+        self.assertFalse(self.service._inflight)
+
+    async def test_bad_hour_fails_alone(self):
+        """A day without weather fails only its own request, not the others in its batch."""
+        good, bad = await asyncio.gather(self.get(f'/predict?time=2007-07-19T12:00&cells={CELLS}'),
+                                         self.get(f'/predict?time={MISSING_DAY}T12:00&cells={CELLS}'))
+        self.assertEqual(good[0], 200)
+        self.assertEqual(len(good[1]['predictions']), CELLS)
+        self.assertEqual(bad[0], 404)
+        self.assertIn(MISSING_DAY, bad[1]['error'])
+        self.assertEqual(self.service.metrics.batches, 1)
+
+    async def test_client_errors(self):
+        self.assertEqual((await self.get('/predict?cells=16'))[0], 400)
+        self.assertEqual((await self.get('/predict?time=yesterday-ish'))[0], 400)
+        self.assertEqual((await self.get('/predict?time=2007-07-19T12:00&cells=0'))[0], 400)
+        # More cells than the model's grid would score cell IDs it never saw
+        self.assertEqual(self.service.max_cells, CELLS)
+        self.assertEqual((await self.get(f'/predict?time=2007-07-19T12:00&cells={CELLS + 1}'))[0], 400)
+        self.assertEqual((await self.get('/predict?time=2007-07-19T12:00&cells=50000000'))[0], 400)
+        self.assertEqual((await self.get('/predict?time=2007-07-19T12:00&level=99'))[0], 400)
+        self.assertEqual((await self.get('/nowhere'))[0], 404)
+        status, body = await self.get('/predict?time=2007-07-19T12:00')
+        self.assertEqual((status, body['cells']), (200, CELLS))
+
+    async def test_grid(self):
+        status, body = await self.get('/grid?format=topojson&quantization=100')
+        topology = json.loads(body)
+        self.assertEqual((status, topology['type']), (200, 'Topology'))
+        self.assertEqual(len(topology['objects']['grid']['geometries']), CELLS)
+        # precision only rounds GeoJSON, TopoJSON ignores it
+        self.assertEqual((await self.get('/grid?format=topojson&quantization=100&precision=1'))[1], body)
+        status, body = await self.get('/grid?precision=2')
+        self.assertEqual(json.loads(body)['features'][0]['geometry']['coordinates'][0][0], [-122.5, 37.72])
+
+        for query in ('cells=0', 'cells=-4', f'cells={CELLS + 1}', 'format=topojson&quantization=1', 'format=svg', 'level=9'):
+            self.assertEqual((await self.get(f'/grid?{query}'))[0], 400, query)
+
+    async def test_grid_payloads_are_bounded(self):
+        for quantization in range(2, GRID_PAYLOAD_ENTRIES + 12):
+            await self.get(f'/grid?format=topojson&quantization={quantization}')
+        self.assertEqual(len(self.service._grid_payloads), GRID_PAYLOAD_ENTRIES)
+        self.assertNotIn((CELLS, 0, 'topojson', None, 2), self.service._grid_payloads)
+
+    async def test_unexpected_error_is_a_500(self):
+        server = await self.service.serve('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            with mock.patch.object(self.predictor, 'predict_hours', side_effect=RuntimeError('booster crashed')):
+                status, body = await _get(reader, writer, '/predict?time=2007-07-19T12:00')
+            self.assertEqual(status, 500)
+            self.assertIn('booster crashed', json.loads(body)['error'])
+            # The connection is still usable
+            status, _ = await _get(reader, writer, '/health', keep_alive=False)
+            self.assertEqual(status, 200)
+            writer.close()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+    async def test_long_request_line_is_a_414(self):
+        server = await self.service.serve('127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            status, body = await _get(reader, writer, '/predict?time=2007-07-19T12:00&pad=' + 'x' * MAX_REQUEST_LINE)
+            self.assertEqual(status, 414)
+            self.assertIn(str(MAX_REQUEST_LINE), json.loads(body)['error'])
+            self.assertEqual(await reader.read(), b'')  # and the connection is closed
+            writer.close()
+
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /health HTTP/1.1\r\nX-Padding: ' + b'x' * MAX_REQUEST_LINE + b'\r\n\r\n')
+            self.assertTrue((await reader.readline()).startswith(b'HTTP/1.1 431'))
+            writer.close()
+        finally:
+            server.close()
+            await server.wait_closed()
+
+
+if __name__ == '__main__':
+    unittest.main(argv=['first-arg-is-ignored'], exit=False)